@@ -57,10 +57,16 @@ module ExpressionUtils {
 
     }  UploadExpressionParams;
 
-    /**     Output from upload expression    **/
+    /**     Output from upload expression
+
+        string   obj_ref                    -   the reference of the new expression object
+        mapping<string, float> stage_timings  -   the time taken by each stage of the
+                                               upload, in seconds
+    **/
 
     typedef structure {
         string   obj_ref;
+        mapping<string, float> stage_timings;
      }  UploadExpressionOutput;
 
     /**  Uploads the expression  **/
@@ -68,6 +74,38 @@ module ExpressionUtils {
     funcdef  upload_expression(UploadExpressionParams params)
                                    returns (UploadExpressionOutput)
                                    authentication required;
+
+    /**
+        Required input parameters for uploading several expressions
+
+        list<UploadExpressionParams> expressions  -   the upload parameters of each expression
+        int      num_threads           -   Optional - number of expressions processed
+                                           concurrently (default 4)
+    **/
+
+    typedef structure {
+        list<UploadExpressionParams> expressions;
+        int      num_threads;
+    }  UploadExpressionsBatchParams;
+
+    /**     Output from upload expressions batch, with the object references
+            in the order of the input expressions
+
+        list<mapping<string, float>> stage_timings  -   the time taken by each stage of the
+                                                        upload of each expression, in seconds
+    **/
+
+    typedef structure {
+        list<string>   obj_refs;
+        list<mapping<string, float>> stage_timings;
+     }  UploadExpressionsBatchOutput;
+
+    /**  Uploads several expressions, processing them concurrently and saving them
+         in a single workspace call per workspace  **/
+
+    funcdef  upload_expressions_batch(UploadExpressionsBatchParams params)
+                                   returns (UploadExpressionsBatchOutput)
+                                   authentication required;
     /**
         Required input parameters for downloading expression
         string source_ref 	-       object reference of expression source. The
@@ -78,6 +116,8 @@ module ExpressionUtils {
 
     typedef structure {
         string      source_ref;
+        list<string> members;           /*  Optional - names of the files to download, e.g.
+                                            t_data.ctab; all the files if not given */
     } DownloadExpressionParams;
 
     /**  The output of the download method.  **/
@@ -92,6 +132,34 @@ module ExpressionUtils {
                        returns (DownloadExpressionOutput)
                        authentication required;
 
+    /**
+        Required input parameters for getting a file of an expression
+        string source_ref 	-       object reference of expression source. The
+                                    object ref is 'ws_name_or_id/obj_name_or_id'
+                                    where ws_name_or_id is the workspace name or id
+                                    and obj_name_or_id is the object name or id
+        string member       -       name of the file, e.g. genes.fpkm_tracking
+    **/
+
+    typedef structure {
+        string      source_ref;
+        string      member;
+    } GetExpressionMemberParams;
+
+    /**  The output of the get_expression_member method.  **/
+
+    typedef structure {
+        string    file_path;            /* path of the downloaded file  */
+    } GetExpressionMemberOutput;
+
+    /** Downloads a single file of an expression, reading just the bytes of
+        that file from shock when the expression was uploaded with the member
+        index of its files **/
+
+    funcdef get_expression_member(GetExpressionMemberParams params)
+                       returns (GetExpressionMemberOutput)
+                       authentication required;
+
     /**
         Required input parameters for exporting expression
 
@@ -121,6 +189,15 @@ module ExpressionUtils {
 
     /**
         Following are the required input parameters to get Expression Matrix
+
+        Optional parameters for an incremental update, when expressions were added
+        to or removed from the set since the matrices were last built:
+
+        string   previous_exprMatrix_FPKM_ref  -  FPKM matrix of the previous call
+        string   previous_exprMatrix_TPM_ref   -  TPM matrix of the previous call
+
+        Only the expressions missing from the previous matrices, or saved after
+        them, are fetched; the other columns are copied from the previous matrices.
     **/
 
     typedef structure {
@@ -129,6 +206,9 @@ module ExpressionUtils {
         string      output_obj_name;
         string      expressionset_ref;
 
+        string      previous_exprMatrix_FPKM_ref;
+        string      previous_exprMatrix_TPM_ref;
+
     } getExprMatrixParams;
 
     typedef structure {
@@ -141,4 +221,30 @@ module ExpressionUtils {
     funcdef  get_expressionMatrix(getExprMatrixParams params)
                                    returns (getExprMatrixOutput)
                                    authentication required;
+
+    /**
+        Required input parameters for exporting an expression matrix
+
+        string   source_ref     -   object reference of a KBaseFeatureValues.ExpressionMatrix
+        int      row_block_size -   Optional - number of rows (genes) per tile (default 4096)
+        int      col_block_size -   Optional - number of columns (samples) per tile (default 64)
+    **/
+
+    typedef structure {
+        string  source_ref;
+        int     row_block_size;
+        int     col_block_size;
+    } ExportMatrixParams;
+
+    typedef structure {
+        string  shock_id;     /* shock id of the zipped matrix tiles */
+    } ExportMatrixOutput;
+
+    /** Exports an expression matrix to shock as a zip of float64 .npy tiles of
+        row_block_size x col_block_size values, listed in a manifest.json, so
+        single genes or samples can be read without loading the whole matrix **/
+
+    funcdef export_expression_matrix(ExportMatrixParams params)
+                     returns (ExportMatrixOutput output)
+                     authentication required;
 };
@@ -55,13 +55,55 @@ class ExpressionUtils(object):
            parameter "external_source_date" of String, parameter
            "processing_comments" of String
         :returns: instance of type "UploadExpressionOutput" (*     Output
-           from upload expression    *) -> structure: parameter "obj_ref" of
-           String
+           from upload expression string   obj_ref                    -   the
+           reference of the new expression object mapping<string, float>
+           stage_timings  -   the time taken by each stage of the upload, in
+           seconds *) -> structure: parameter "obj_ref" of String, parameter
+           "stage_timings" of mapping from String to Double
         """
         return self._client.call_method(
             'ExpressionUtils.upload_expression',
             [params], self._service_ver, context)
 
+    def upload_expressions_batch(self, params, context=None):
+        """
+        Uploads several expressions, processing them concurrently and saving them
+        in a single workspace call per workspace *
+        :param params: instance of type "UploadExpressionsBatchParams" (*
+           Required input parameters for uploading several expressions
+           list<UploadExpressionParams> expressions - the upload parameters
+           of each expression int num_threads - Optional - number of
+           expressions processed concurrently (default 4) *) -> structure:
+           parameter "expressions" of list of type "UploadExpressionParams"
+           (*    Required input parameters for uploading a reads expression
+           data string   destination_ref        -   object reference of
+           expression data. The object ref is 'ws_name_or_id/obj_name_or_id'
+           where ws_name_or_id is the workspace name or id and obj_name_or_id
+           is the object name or id string   source_dir             -  
+           directory with the files to be uploaded string   alignment_ref    
+           -   alignment workspace object reference *) -> structure:
+           parameter "destination_ref" of String, parameter "source_dir" of
+           String, parameter "alignment_ref" of String, parameter
+           "genome_ref" of String, parameter "annotation_id" of String,
+           parameter "bam_file_path" of String, parameter "transcripts" of
+           type "boolean" (A boolean - 0 for false, 1 for true. @range (0,
+           1)), parameter "data_quality_level" of Long, parameter
+           "original_median" of Double, parameter "description" of String,
+           parameter "platform" of String, parameter "source" of String,
+           parameter "external_source_date" of String, parameter
+           "processing_comments" of String, parameter "num_threads" of Long
+        :returns: instance of type "UploadExpressionsBatchOutput" (*   
+           Output from upload expressions batch, with the object references
+           in the order of the input expressions list<mapping<string,
+           float>> stage_timings  -   the time taken by each stage of the
+           upload of each expression, in seconds *) -> structure: parameter
+           "obj_refs" of list of String, parameter "stage_timings" of list of
+           mapping from String to Double
+        """
+        return self._client.call_method(
+            'ExpressionUtils.upload_expressions_batch',
+            [params], self._service_ver, context)
+
     def download_expression(self, params, context=None):
         """
         Downloads expression *
@@ -71,7 +113,7 @@ class ExpressionUtils(object):
            The object ref is 'ws_name_or_id/obj_name_or_id' where
            ws_name_or_id is the workspace name or id and obj_name_or_id is
            the object name or id *) -> structure: parameter "source_ref" of
-           String
+           String, parameter "members" of list of String
         :returns: instance of type "DownloadExpressionOutput" (*  The output
            of the download method.  *) -> structure: parameter
            "destination_dir" of String
@@ -80,6 +122,27 @@ class ExpressionUtils(object):
             'ExpressionUtils.download_expression',
             [params], self._service_ver, context)
 
+    def get_expression_member(self, params, context=None):
+        """
+        Downloads a single file of an expression, reading just the bytes of
+        that file from shock when the expression was uploaded with the member
+        index of its files *
+        :param params: instance of type "GetExpressionMemberParams" (*
+           Required input parameters for getting a file of an expression
+           string source_ref         -       object reference of expression
+           source. The object ref is 'ws_name_or_id/obj_name_or_id' where
+           ws_name_or_id is the workspace name or id and obj_name_or_id is
+           the object name or id string member       -       name of the
+           file, e.g. genes.fpkm_tracking *) -> structure: parameter
+           "source_ref" of String, parameter "member" of String
+        :returns: instance of type "GetExpressionMemberOutput" (*  The
+           output of the get_expression_member method.  *) -> structure:
+           parameter "file_path" of String
+        """
+        return self._client.call_method(
+            'ExpressionUtils.get_expression_member',
+            [params], self._service_ver, context)
+
     def export_expression(self, params, context=None):
         """
         Wrapper function for use by in-narrative downloaders to download expressions from shock *
@@ -99,10 +162,18 @@ class ExpressionUtils(object):
     def get_expressionMatrix(self, params, context=None):
         """
         :param params: instance of type "getExprMatrixParams" (* Following
-           are the required input parameters to get Expression Matrix *) ->
-           structure: parameter "workspace_name" of String, parameter
-           "output_obj_name" of String, parameter "expressionset_ref" of
-           String
+           are the required input parameters to get Expression Matrix
+           Optional parameters for an incremental update, when expressions
+           were added to or removed from the set since the matrices were
+           last built: string   previous_exprMatrix_FPKM_ref  -  FPKM matrix
+           of the previous call string   previous_exprMatrix_TPM_ref   -  TPM
+           matrix of the previous call Only the expressions missing from the
+           previous matrices, or saved after them, are fetched; the other
+           columns are copied from the previous matrices. *) -> structure:
+           parameter "workspace_name" of String, parameter "output_obj_name"
+           of String, parameter "expressionset_ref" of String, parameter
+           "previous_exprMatrix_FPKM_ref" of String, parameter
+           "previous_exprMatrix_TPM_ref" of String
         :returns: instance of type "getExprMatrixOutput" -> structure:
            parameter "exprMatrix_FPKM_ref" of String, parameter
            "exprMatrix_TPM_ref" of String
@@ -111,6 +182,27 @@ class ExpressionUtils(object):
             'ExpressionUtils.get_expressionMatrix',
             [params], self._service_ver, context)
 
+    def export_expression_matrix(self, params, context=None):
+        """
+        Exports an expression matrix to shock as a zip of float64 .npy tiles of
+        row_block_size x col_block_size values, listed in a manifest.json, so
+        single genes or samples can be read without loading the whole matrix *
+        :param params: instance of type "ExportMatrixParams" (* Required
+           input parameters for exporting an expression matrix string  
+           source_ref     -   object reference of a
+           KBaseFeatureValues.ExpressionMatrix int      row_block_size -  
+           Optional - number of rows (genes) per tile (default 4096) int     
+           col_block_size -   Optional - number of columns (samples) per tile
+           (default 64) *) -> structure: parameter "source_ref" of String,
+           parameter "row_block_size" of Long, parameter "col_block_size" of
+           Long
+        :returns: instance of type "ExportMatrixOutput" -> structure:
+           parameter "shock_id" of String
+        """
+        return self._client.call_method(
+            'ExpressionUtils.export_expression_matrix',
+            [params], self._service_ver, context)
+
     def status(self, context=None):
         return self._client.call_method('ExpressionUtils.status',
                                         [], self._service_ver, context)
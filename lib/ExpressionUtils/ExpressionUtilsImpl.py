@@ -5,8 +5,14 @@ import sys
 import time
 import shutil
 import glob
+import json
 import logging
+import zlib
+import requests
 from datetime import datetime
+from collections import OrderedDict
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 from pprint import pprint
 from pprint import pformat
@@ -19,6 +25,12 @@ from ReadsAlignmentUtils.ReadsAlignmentUtilsClient import ReadsAlignmentUtils
 from core.expression_utils import ExpressionUtils as Expression_Utils
 from core.table_maker import TableMaker
 from core.exprMatrix_utils import ExprMatrixUtils
+from core.pipeline import Pipeline
+from core.http_session import configure_session, use_session
+from core.async_client import AsyncClient
+from core.bundle_utils import (hash_bundle, pack_bundle, unpack_bundle_stream, index_bundle,
+                               dump_bundle_index, unpack_bundle_member, file_md5,
+                               BundleIndex)
 
 #END_HEADER
 
@@ -67,6 +79,31 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
     PARAM_IN_EXT_SRC_DATE = 'external_source_date'
     PARAM_IN_TRANSCRIPTS = 'transcripts'
     PARAM_IN_SRC = 'source'
+    PARAM_IN_EXPRESSIONS = 'expressions'
+    PARAM_IN_NUM_THREADS = 'num_threads'
+    PARAM_IN_MEMBERS = 'members'
+    PARAM_IN_MEMBER = 'member'
+
+    # zlib level and number of threads the bundles are packed with in each
+    # bundle-pack-mode but zip, the default, where DataFileUtil packs them;
+    # None is a thread per cpu
+    BUNDLE_PACK_MODES = {'store': (0, 1),
+                         'fast': (1, 1),
+                         'parallel': (zlib.Z_DEFAULT_COMPRESSION, None)}
+
+    # user metadata key of the member index of the bundle of an expression,
+    # see get_expression_member. The workspace limits a metadata key and its
+    # value to META_MAX_BYTES together, so the index is left out of bundles
+    # of more than about 15 files, which get_expression_member downloads whole.
+    META_BUNDLE_MEMBERS = 'bundle_members'
+    META_MAX_BYTES = 900
+
+    # seconds to wait for shock to accept a connection or send more of a
+    # file read from it directly, before giving up on the read
+    SHOCK_TIMEOUT = 60
+
+    # default number of expressions processed concurrently by upload_expressions_batch
+    BATCH_NUM_THREADS = 4
 
     def _check_required_param(self, in_params, param_list):
         """
@@ -76,9 +113,26 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
             if (param not in in_params or not in_params[param]):
                 raise ValueError('{} parameter is required'.format(param))
 
-    def _proc_ws_obj_params(self, ctx, params):
+    def _get_ws_id(self, ws_name_id):
         """
-        Check the validity of workspace and object params and return them
+        Return the id of a workspace given by name or id
+        """
+        if not isinstance(ws_name_id, int):
+
+            dfu = use_session(DataFileUtil(self.callback_url))
+            try:
+                ws_name_id = dfu.ws_name_to_id(ws_name_id)
+            except DFUError as se:
+                prefix = se.message.split('.')[0]
+                raise ValueError(prefix)
+
+        return ws_name_id
+
+    def _proc_ws_obj_params(self, ctx, params, object_refs=()):
+        """
+        Check the validity of workspace and object params and return them,
+        along with the workspace objects of object_refs, which are fetched in
+        the same batch request as the workspace id
         """
         dst_ref = params.get(self.PARAM_IN_DST_REF)
 
@@ -90,30 +144,45 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
         if not bool(obj_name_id.strip()):
             raise ValueError("Object name or id is required in " + self.PARAM_IN_DST_REF)
 
-        dfu = DataFileUtil(self.callback_url)
-
+        ws_calls = list()
         if not isinstance(ws_name_id, int):
-
+            ws_calls.append(('Workspace.get_workspace_info', [{'workspace': ws_name_id}]))
+        if object_refs:
+            ws_calls.append(('Workspace.get_objects2',
+                             [{'objects': [{'ref': ref} for ref in object_refs]}]))
+
+        objs = list()
+        if ws_calls:
+            ws = use_session(Workspace(self.ws_url))
             try:
-                ws_name_id = dfu.ws_name_to_id(ws_name_id)
-            except DFUError as se:
-                prefix = se.message.split('.')[0]
-                raise ValueError(prefix)
+                results = ws._client.call_methods(ws_calls)
+            except WorkspaceError as wse:
+                # raises the ValueError of the workspace, if it is the one failing
+                self._get_ws_id(ws_name_id)
+                self.__LOGGER.error('Logging stacktrace from workspace exception:\n' + wse.data)
+                raise
+
+            if object_refs:
+                objs = results.pop()['data']
+            if results:
+                ws_name_id = results[0][0]
 
         self.__LOGGER.info('Obtained workspace name/id ' + str(ws_name_id))
 
-        return ws_name_id, obj_name_id
+        return ws_name_id, obj_name_id, objs
 
     def _proc_upload_expression_params(self, ctx, params):
         """
-        Check the presence and validity of upload expression params
+        Check the presence and validity of upload expression params and
+        return them, along with the alignment object
         """
         self._check_required_param(params, [self.PARAM_IN_DST_REF,
                                             self.PARAM_IN_SRC_DIR,
                                             self.PARAM_IN_ALIGNMENT_REF
                                             ])
 
-        ws_name_id, obj_name_id = self._proc_ws_obj_params(ctx, params)
+        ws_name_id, obj_name_id, objs = self._proc_ws_obj_params(
+            ctx, params, [params.get(self.PARAM_IN_ALIGNMENT_REF)])
 
         source_dir = params.get(self.PARAM_IN_SRC_DIR)
 
@@ -123,11 +192,11 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
         if not os.listdir(source_dir):
             raise ValueError('Source directory is empty: ' + source_dir)
 
-        return ws_name_id, obj_name_id, source_dir
+        return ws_name_id, obj_name_id, source_dir, objs[0]
 
     def _get_ws_info(self, obj_ref):
 
-        ws = Workspace(self.ws_url)
+        ws = use_session(Workspace(self.ws_url))
         try:
             info = ws.get_object_info_new({'objects': [{'ref': obj_ref}]})[0]
         except WorkspaceError as wse:
@@ -153,6 +222,9 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
         if transcripts:
             fpkm_file_path = os.path.join(source_dir, 't_data.ctab')
 
+        if not os.path.isfile(fpkm_file_path) and os.path.isfile(fpkm_file_path + '.gz'):
+            fpkm_file_path += '.gz'
+
         if not os.path.isfile(fpkm_file_path):
             raise ValueError('{} file is required'.format(fpkm_file_path))
 
@@ -162,7 +234,25 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
         return self.expression_utils.get_expression_levels(fpkm_file_path,
                                                            genome_ref, id_col)
 
-    def _gen_ctab_files(self, params, alignment_ref):
+    def _start_alignment_download(self, params, alignment_ref):
+        """
+        Start downloading the alignment when its bam file is needed to generate
+        the ctab files, so that the download overlaps the other stages of the
+        upload. Returns the pending download, or None if the bam file is not
+        needed.
+        """
+        source_dir = params.get(self.PARAM_IN_SRC_DIR)
+        if (not source_dir or not alignment_ref or
+                len(glob.glob(source_dir + '/*.ctab')) >= 5 or
+                not os.path.isfile(os.path.join(source_dir, 'transcripts.gtf')) or
+                params.get(self.PARAM_IN_BAM_FILE_PATH) is not None):
+            return None
+
+        self.__LOGGER.info('Downloading bam file from alignment object')
+        rau = AsyncClient(use_session(ReadsAlignmentUtils(self.callback_url)))
+        return rau.download_alignment({'source_ref': alignment_ref})
+
+    def _gen_ctab_files(self, params, alignment_dir):
 
         source_dir = params.get(self.PARAM_IN_SRC_DIR)
         if len(glob.glob(source_dir + '/*.ctab')) < 5:
@@ -177,11 +267,6 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
                params[self.PARAM_IN_BAM_FILE_PATH] is not None:
                 bam_file_path = params[self.PARAM_IN_BAM_FILE_PATH]
             else:
-                self.__LOGGER.info('Downloading bam file from alignment object')
-                rau = ReadsAlignmentUtils(self.callback_url)
-                alignment_retVal = rau.download_alignment({'source_ref': alignment_ref})
-                alignment_dir = alignment_retVal.get('destination_dir')
-
                 allbamfiles = glob.glob(alignment_dir + '/*.bam')
                 if len(allbamfiles) == 0:
                     raise ValueError('bam file does not exist in {}'.format(d))
@@ -206,6 +291,288 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
             if result != 0:
                 raise ValueError('Tablemaker failed')
 
+    def _reuse_bundle(self, user_id, bundle_hash):
+        """
+        Return a handle of the shock node holding a bundle the user loaded
+        before, and the member index of the bundle, or None if the bundle is
+        not in the index of the user or its node is gone
+        """
+        entry = self.bundle_index.get(user_id, bundle_hash)
+        if entry is None:
+            return None
+
+        handle = entry['handle']
+        try:
+            owned_node = self.dfu.own_shock_node({'shock_id': handle['id'],
+                                                  'make_handle': 1})
+        except DFUError as e:
+            self.__LOGGER.info('Unable to reuse shock node {0}, uploading the bundle: {1}'
+                               .format(handle['id'], e.message))
+            self.bundle_index.remove(user_id, bundle_hash)
+            return None
+
+        self.__LOGGER.info('Reusing shock node {0} of an identical bundle'
+                           .format(owned_node['shock_id']))
+        return owned_node['handle'], entry['members']
+
+    def _fetch_bundle_zip(self, handle, zip_path):
+        """
+        Write the zip file of a reused bundle to zip_path, where an upload of
+        the bundle leaves it, unless the same zip file is already there
+        """
+        if os.path.isfile(zip_path) and file_md5(zip_path) == handle.get('remote_md5'):
+            return
+
+        self.dfu.shock_to_file({'shock_id': handle['id'], 'file_path': zip_path})
+
+    def _upload_bundle(self, ctx, source_dir):
+        """
+        Zip the source directory and load it to shock, returning the file handle
+        and the member index of the zip file, see get_expression_member. The
+        zip file is left next to the source directory.
+        The directory is zipped as set by bundle-pack-mode, see BUNDLE_PACK_MODES.
+        A bundle with the same name and files as one the user loaded before is
+        not loaded again, see _reuse_bundle.
+        """
+        path, dir = os.path.split(source_dir)
+        zipfile = dir + '.zip'
+
+        bundle_hash = hash_bundle(source_dir, exclude=[zipfile])
+        reused_bundle = self._reuse_bundle(ctx['user_id'], bundle_hash)
+        if reused_bundle is not None:
+            self._fetch_bundle_zip(reused_bundle[0], os.path.join(path, zipfile))
+            return reused_bundle
+
+        if self.bundle_pack_mode == 'zip':
+            uploaded_file = self.dfu.file_to_shock({'file_path': source_dir,
+                                                    'make_handle': 1,
+                                                    'pack': 'zip'
+                                                    })
+            """
+            move the zipfile created in the source directory one level up
+            """
+            if os.path.isfile(os.path.join(source_dir, zipfile)):
+                shutil.move(os.path.join(source_dir, zipfile), os.path.join(path, zipfile))
+        else:
+            level, threads = self.BUNDLE_PACK_MODES[self.bundle_pack_mode]
+            pack_bundle(source_dir, os.path.join(path, zipfile), level,
+                        threads or cpu_count(), exclude=[zipfile])
+            uploaded_file = self.dfu.file_to_shock({'file_path': os.path.join(path, zipfile),
+                                                    'make_handle': 1
+                                                    })
+
+        members = None
+        if os.path.isfile(os.path.join(path, zipfile)):
+            members = index_bundle(os.path.join(path, zipfile))
+
+        self.bundle_index.put(ctx['user_id'], bundle_hash, uploaded_file['handle'], members)
+
+        return uploaded_file['handle'], members
+
+    def _stream_bundle(self, ctx, file_handle, output_dir, members):
+        """
+        Extract the files of a zipped bundle into the output directory as it is
+        read from shock, without writing the zip file to disk. Returns the
+        names of the files extracted, or None if the bundle has to be
+        downloaded and unpacked by DataFileUtil instead.
+        """
+        if not file_handle.get('file_name', '').endswith('.zip'):
+            return None
+
+        try:
+            response = requests.get(self.shock_url + '/node/' + file_handle['id'] + '?download_raw',
+                                    headers={'Authorization': 'OAuth ' + ctx['token']},
+                                    stream=True, timeout=self.SHOCK_TIMEOUT)
+            try:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                return unpack_bundle_stream(response.raw, output_dir, members)
+            finally:
+                response.close()
+        except (ValueError, requests.exceptions.RequestException) as e:
+            self.__LOGGER.info('Unable to stream shock node {0}, downloading it: {1}'
+                               .format(file_handle['id'], e))
+            shutil.rmtree(output_dir)
+            os.mkdir(output_dir)
+            return None
+
+    def _download_bundle(self, ctx, file_handle, output_dir, members):
+        """
+        Download the files of a bundle into the output directory, streaming
+        the bundle if possible, see _stream_bundle. Only the files named by
+        members are kept, if given.
+        """
+        extracted = self._stream_bundle(ctx, file_handle, output_dir, members)
+        if extracted is None:
+            file_ret = self.dfu.shock_to_file({
+                                               'shock_id': file_handle['id'],
+                                               'file_path': output_dir,
+                                               'unpack': 'unpack'
+                                               })
+
+            for f in glob.glob(output_dir + '/*.zip'):
+                os.remove(f)
+
+            extracted = list()
+            for dir_path, dir_names, file_names in os.walk(output_dir):
+                for file_name in file_names:
+                    file_path = os.path.join(dir_path, file_name)
+                    name = os.path.relpath(file_path, output_dir).replace(os.sep, '/')
+                    if members is None or name in members:
+                        extracted.append(name)
+                    else:
+                        os.remove(file_path)
+
+        if members is not None:
+            missing = [member for member in members if member not in extracted]
+            if missing:
+                raise ValueError('Files not in the expression: ' + ', '.join(missing))
+
+        if not os.listdir(output_dir):
+            raise ValueError('No files were downloaded: ' + output_dir)
+
+    def _read_bundle_member(self, ctx, file_handle, member, file_path):
+        """
+        Extract a file of a bundle by reading just its bytes from shock, at the
+        offset given by its member index entry. Returns False if the bytes
+        read are not those of the file, e.g. if shock ignores the range.
+        """
+        offset, compress_size = member[0], member[1]
+        try:
+            response = requests.get(self.shock_url + '/node/' + file_handle['id'] +
+                                    '?download_raw&seek={0}&length={1}'.format(offset,
+                                                                              compress_size),
+                                    headers={'Authorization': 'OAuth ' + ctx['token']},
+                                    stream=True, timeout=self.SHOCK_TIMEOUT)
+            try:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                unpack_bundle_member(response.raw, member, file_path)
+            finally:
+                response.close()
+        except (ValueError, requests.exceptions.RequestException) as e:
+            self.__LOGGER.info('Unable to read {0} from shock node {1}, downloading it: {2}'
+                               .format(file_path, file_handle['id'], e))
+            return False
+        return True
+
+    def _gen_expression_object(self, ctx, params):
+        """
+        Parse the expression files of one upload, generate its ctab files and
+        load them to shock. Returns the workspace id, the workspace object to
+        save and the time taken by each stage of the upload.
+
+        The stages run as a pipeline: the expression levels are parsed while
+        the alignment is downloaded, the ctab files generated and the files
+        loaded to shock. The levels of transcripts are read from a ctab file,
+        so they wait for the ctab files.
+        """
+        alignment_ref = params.get(self.PARAM_IN_ALIGNMENT_REF)
+        source_dir = params.get(self.PARAM_IN_SRC_DIR)
+
+        # the download only needs the parameters, so it starts with the
+        # parameter checks rather than after them
+        alignment_download = self._start_alignment_download(params, alignment_ref)
+
+        pipeline = Pipeline()
+        pipeline.add_stage('params', lambda: self._proc_upload_expression_params(ctx, params))
+        pipeline.add_stage('genome_ref',
+                           lambda proc_params: self._get_genome_ref(
+                               proc_params[3]['data']['genome_id'], params),
+                           ['params'])
+        pipeline.add_stage('download_alignment',
+                           lambda proc_params: alignment_download.get().get('destination_dir')
+                           if alignment_download else None,
+                           ['params'])
+        pipeline.add_stage('ctab_files',
+                           lambda alignment_dir: self._gen_ctab_files(params, alignment_dir),
+                           ['download_alignment'])
+        if params.get(self.PARAM_IN_TRANSCRIPTS):
+            pipeline.add_stage('expression_levels',
+                               lambda genome_ref, ctab_files: self._get_expression_levels(
+                                   source_dir, genome_ref, True),
+                               ['genome_ref', 'ctab_files'])
+        else:
+            pipeline.add_stage('expression_levels',
+                               lambda genome_ref: self._get_expression_levels(
+                                   source_dir, genome_ref, False),
+                               ['genome_ref'])
+        pipeline.add_stage('upload_bundle', lambda ctab_files: self._upload_bundle(ctx, source_dir),
+                           ['ctab_files'])
+
+        results = pipeline.run()
+        self.__LOGGER.info('Upload stage timings: ' + str(dict(pipeline.timings)))
+
+        ws_name_id, obj_name_id, source_dir, alignment_obj = results['params']
+        alignment = alignment_obj['data']
+        genome_ref = results['genome_ref']
+        expression_levels, tpm_expression_levels = results['expression_levels']
+        file_handle, bundle_members = results['upload_bundle']
+
+        expression_data = {
+                           'numerical_interpretation': 'FPKM',
+                           'genome_id': genome_ref,
+                           'mapped_rnaseq_alignment': {alignment['read_sample_id']: alignment_ref},
+                           'condition': alignment['condition'],
+                           'file': file_handle,
+                           'expression_levels': expression_levels,
+                           'tpm_expression_levels': tpm_expression_levels
+                           }
+        additional_params = [self.PARAM_IN_ANNOTATION_ID,
+                             self.PARAM_IN_DESCRIPTION,
+                             self.PARAM_IN_DATA_QUAL_LEVEL,
+                             self.PARAM_IN_PLATFORM,
+                             self.PARAM_IN_PROC_COMMENTS,
+                             self.PARAM_IN_MAPPED_SAMPLE_ID,
+                             self.PARAM_IN_ORIG_MEDIAN,
+                             self.PARAM_IN_EXT_SRC_DATE,
+                             self.PARAM_IN_SRC
+                             ]
+
+        for opt_param in additional_params:
+            if opt_param in params and params[opt_param] is not None:
+                expression_data[opt_param] = params[opt_param]
+
+        extra_provenance_input_refs = list()
+        extra_provenance_input_refs.append(params.get(self.PARAM_IN_ALIGNMENT_REF))
+        if self.PARAM_IN_GENOME_REF in params and params.get(self.PARAM_IN_GENOME_REF) is not None:
+            extra_provenance_input_refs.append(params.get(self.PARAM_IN_GENOME_REF))
+
+        self.__LOGGER.info('===========   Adding extra_provenance_refs')
+        self.__LOGGER.info(str(extra_provenance_input_refs))
+        self.__LOGGER.info('==========================================')
+
+        expression_obj = {
+                          "type": "KBaseRNASeq.RNASeqExpression",
+                          "data": expression_data,
+                          "name": obj_name_id,
+                          "extra_provenance_input_refs": extra_provenance_input_refs
+                         }
+
+        if bundle_members:
+            bundle_members_meta = dump_bundle_index(
+                bundle_members, self.META_MAX_BYTES - len(self.META_BUNDLE_MEMBERS))
+            if bundle_members_meta is not None:
+                expression_obj['meta'] = {self.META_BUNDLE_MEMBERS: bundle_members_meta}
+            else:
+                self.__LOGGER.info('Member index of {0} files too large to save'
+                                   .format(len(bundle_members)))
+
+        return ws_name_id, expression_obj, dict(pipeline.timings)
+
+    def _save_expression_objects(self, ws_name_id, expression_objs):
+        """
+        Save expression objects to a workspace in a single call and return
+        their object infos
+        """
+        res = self.dfu.save_objects(
+            {"id": ws_name_id,
+             "objects": expression_objs})
+
+        self.__LOGGER.info('save complete')
+
+        return res
+
     #END_CLASS_HEADER
 
     # config contains contents of config file in a hash or None if it couldn't
@@ -226,10 +593,35 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
         self.scratch = config['scratch']
         self.callback_url = os.environ['SDK_CALLBACK_URL']
         self.ws_url = config['workspace-url']
+        self.shock_url = config.get('shock-url')
+        if not self.shock_url:
+            raise ValueError('shock-url is required in the service configuration')
         self.config['SDK_CALLBACK_URL'] = self.callback_url
+
+        # the clients share one connection pool and its request settings
+        session_config = dict()
+        if config.get('client-pool-size'):
+            session_config['pool_size'] = int(config['client-pool-size'])
+        if config.get('client-compress-min-bytes'):
+            session_config['compress_min_bytes'] = int(config['client-compress-min-bytes'])
+        configure_session(**session_config)
+
         self.expression_utils = Expression_Utils(self.config)
-        self.dfu = DataFileUtil(self.callback_url)
+        self.dfu = use_session(DataFileUtil(self.callback_url))
         self.table_maker = TableMaker(config, self.__LOGGER)
+        # shock handles of the bundles loaded by this service, by user and content hash
+        bundle_index_dir = config.get('bundle-index-dir')
+        if not bundle_index_dir:
+            # the scratch directory only lasts one job
+            bundle_index_dir = os.path.join(self.scratch, 'bundle_index')
+            self.__LOGGER.info('bundle-index-dir is not set, so shock nodes of identical '
+                               'bundles are only reused within this job')
+        self.bundle_index = BundleIndex(bundle_index_dir)
+        self.bundle_pack_mode = config.get('bundle-pack-mode') or 'zip'
+        if self.bundle_pack_mode != 'zip' and self.bundle_pack_mode not in self.BUNDLE_PACK_MODES:
+            raise ValueError('bundle-pack-mode must be one of zip, ' +
+                             ', '.join(sorted(self.BUNDLE_PACK_MODES)) + ': ' +
+                             self.bundle_pack_mode)
         self.expr_matrix_utils = ExprMatrixUtils(config, self.__LOGGER)
         #END_CONSTRUCTOR
         pass
@@ -257,8 +649,11 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
            parameter "external_source_date" of String, parameter
            "processing_comments" of String
         :returns: instance of type "UploadExpressionOutput" (*     Output
-           from upload expression    *) -> structure: parameter "obj_ref" of
-           String
+           from upload expression string   obj_ref                    -   the
+           reference of the new expression object mapping<string, float>
+           stage_timings  -   the time taken by each stage of the upload, in
+           seconds *) -> structure: parameter "obj_ref" of String, parameter
+           "stage_timings" of mapping from String to Double
         """
         # ctx is the context object
         # return variables are: returnVal
@@ -267,94 +662,122 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
         self.__LOGGER.info('Starting upload expression, parsing parameters ')
         pprint(params)
 
-        ws_name_id, obj_name_id, source_dir = self._proc_upload_expression_params(ctx, params)
+        ws_name_id, expression_obj, stage_timings = self._gen_expression_object(ctx, params)
 
-        alignment_ref = params.get(self.PARAM_IN_ALIGNMENT_REF)
-        try:
-            alignment_obj = self.dfu.get_objects({'object_refs': [alignment_ref]})['data'][0]
-        except DFUError as e:
-            self.__LOGGER.error('Logging stacktrace from workspace exception:\n' + e.data)
-            raise
-
-        alignment = alignment_obj['data']
-        assembly_or_genome_ref = alignment['genome_id']
+        save_start = time.time()
+        res = self._save_expression_objects(ws_name_id, [expression_obj])[0]
+        stage_timings['save_object'] = time.time() - save_start
 
-        genome_ref = self._get_genome_ref(assembly_or_genome_ref, params)
+        returnVal = {'obj_ref': str(res[6]) + '/' + str(res[0]) + '/' + str(res[4]),
+                     'stage_timings': stage_timings}
 
-        expression_levels, tpm_expression_levels = self._get_expression_levels(
-            source_dir, genome_ref, params.get(self.PARAM_IN_TRANSCRIPTS))
+        self.__LOGGER.info('Uploaded object: ')
+        print(returnVal)
+        #END upload_expression
 
-        self._gen_ctab_files(params, alignment_ref)
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, dict):
+            raise ValueError('Method upload_expression return value ' +
+                             'returnVal is not type dict as required.')
+        # return the results
+        return [returnVal]
 
-        uploaded_file = self.dfu.file_to_shock({'file_path': source_dir,
-                                                'make_handle': 1,
-                                                'pack': 'zip'
-                                                })
+    def upload_expressions_batch(self, ctx, params):
         """
-        move the zipfile created in the source directory one level up
+        Uploads several expressions, processing them concurrently and saving them
+        in a single workspace call per workspace *
+        :param params: instance of type "UploadExpressionsBatchParams" (*
+           Required input parameters for uploading several expressions
+           list<UploadExpressionParams> expressions - the upload parameters
+           of each expression int num_threads - Optional - number of
+           expressions processed concurrently (default 4) *) -> structure:
+           parameter "expressions" of list of type "UploadExpressionParams"
+           (*    Required input parameters for uploading a reads expression
+           data string   destination_ref        -   object reference of
+           expression data. The object ref is 'ws_name_or_id/obj_name_or_id'
+           where ws_name_or_id is the workspace name or id and obj_name_or_id
+           is the object name or id string   source_dir             -  
+           directory with the files to be uploaded string   alignment_ref    
+           -   alignment workspace object reference *) -> structure:
+           parameter "destination_ref" of String, parameter "source_dir" of
+           String, parameter "alignment_ref" of String, parameter
+           "genome_ref" of String, parameter "annotation_id" of String,
+           parameter "bam_file_path" of String, parameter "transcripts" of
+           type "boolean" (A boolean - 0 for false, 1 for true. @range (0,
+           1)), parameter "data_quality_level" of Long, parameter
+           "original_median" of Double, parameter "description" of String,
+           parameter "platform" of String, parameter "source" of String,
+           parameter "external_source_date" of String, parameter
+           "processing_comments" of String, parameter "num_threads" of Long
+        :returns: instance of type "UploadExpressionsBatchOutput" (*   
+           Output from upload expressions batch, with the object references
+           in the order of the input expressions list<mapping<string,
+           float>> stage_timings  -   the time taken by each stage of the
+           upload of each expression, in seconds *) -> structure: parameter
+           "obj_refs" of list of String, parameter "stage_timings" of list of
+           mapping from String to Double
         """
-        path, dir = os.path.split(source_dir)
-        zipfile = dir + '.zip'
-        if os.path.isfile(os.path.join(source_dir, zipfile)):
-            shutil.move(os.path.join(source_dir, zipfile), os.path.join(path, zipfile))
-
-        file_handle = uploaded_file['handle']
-        file_size = uploaded_file['size']
-
-        expression_data = {
-                           'numerical_interpretation': 'FPKM',
-                           'genome_id': genome_ref,
-                           'mapped_rnaseq_alignment': {alignment['read_sample_id']: alignment_ref},
-                           'condition': alignment['condition'],
-                           'file': file_handle,
-                           'expression_levels': expression_levels,
-                           'tpm_expression_levels': tpm_expression_levels
-                           }
-        additional_params = [self.PARAM_IN_ANNOTATION_ID,
-                             self.PARAM_IN_DESCRIPTION,
-                             self.PARAM_IN_DATA_QUAL_LEVEL,
-                             self.PARAM_IN_PLATFORM,
-                             self.PARAM_IN_PROC_COMMENTS,
-                             self.PARAM_IN_MAPPED_SAMPLE_ID,
-                             self.PARAM_IN_ORIG_MEDIAN,
-                             self.PARAM_IN_EXT_SRC_DATE,
-                             self.PARAM_IN_SRC
-                             ]
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN upload_expressions_batch
 
-        for opt_param in additional_params:
-            if opt_param in params and params[opt_param] is not None:
-                expression_data[opt_param] = params[opt_param]
+        self.__LOGGER.info('Starting batch upload of expressions, parsing parameters ')
+        pprint(params)
 
-        extra_provenance_input_refs = list()
-        extra_provenance_input_refs.append(params.get(self.PARAM_IN_ALIGNMENT_REF))
-        if self.PARAM_IN_GENOME_REF in params and params.get(self.PARAM_IN_GENOME_REF) is not None:
-            extra_provenance_input_refs.append(params.get(self.PARAM_IN_GENOME_REF))
+        expressions_params = params.get(self.PARAM_IN_EXPRESSIONS)
+        if not expressions_params:
+            raise ValueError('{} parameter is required'.format(self.PARAM_IN_EXPRESSIONS))
 
-        self.__LOGGER.info('===========   Adding extra_provenance_refs')
-        self.__LOGGER.info(str(extra_provenance_input_refs))
-        self.__LOGGER.info('==========================================')
+        # each upload zips its source_dir in place, so they can not be shared
+        source_dirs = [expression_params.get(self.PARAM_IN_SRC_DIR)
+                       for expression_params in expressions_params]
+        if len(set(source_dirs)) != len(source_dirs):
+            raise ValueError('{} must be different for each expression'
+                             .format(self.PARAM_IN_SRC_DIR))
 
-        res = self.dfu.save_objects(
-            {"id": ws_name_id,
-             "objects": [{
-                          "type": "KBaseRNASeq.RNASeqExpression",
-                          "data": expression_data,
-                          "name": obj_name_id,
-                          "extra_provenance_input_refs": extra_provenance_input_refs
-                         }
-                         ]})[0]
+        num_threads = int(params.get(self.PARAM_IN_NUM_THREADS) or self.BATCH_NUM_THREADS)
+        if num_threads < 1:
+            raise ValueError('{} must be at least 1'.format(self.PARAM_IN_NUM_THREADS))
 
+        # genome features are indexed once and shared by all the expressions
+        # of that genome, see Expression_Utils._get_feature_index
+        pool = ThreadPool(min(num_threads, len(expressions_params)))
+        try:
+            expression_objs = pool.map(
+                lambda expression_params: self._gen_expression_object(ctx, expression_params),
+                expressions_params)
+        finally:
+            pool.terminate()
+
+        ws_obj_indexes = OrderedDict()
+        for i, (ws_name_id, expression_obj, stage_timings) in enumerate(expression_objs):
+            ws_obj_indexes.setdefault(ws_name_id, []).append(i)
+
+        # the objects of different workspaces are saved concurrently
+        dfu = AsyncClient(self.dfu)
+        saves = [(obj_indexes, dfu.save_objects({'id': ws_name_id,
+                                                 'objects': [expression_objs[i][1]
+                                                             for i in obj_indexes]}))
+                 for ws_name_id, obj_indexes in ws_obj_indexes.items()]
+
+        obj_refs = [None] * len(expression_objs)
+        for obj_indexes, save in saves:
+            for i, info in zip(obj_indexes, save.get()):
+                obj_refs[i] = str(info[6]) + '/' + str(info[0]) + '/' + str(info[4])
         self.__LOGGER.info('save complete')
 
-        returnVal = {'obj_ref': str(res[6]) + '/' + str(res[0]) + '/' + str(res[4])}
+        returnVal = {'obj_refs': obj_refs,
+                     'stage_timings': [stage_timings
+                                       for ws_name_id, expression_obj, stage_timings
+                                       in expression_objs]}
 
-        self.__LOGGER.info('Uploaded object: ')
+        self.__LOGGER.info('Uploaded objects: ')
         print(returnVal)
-        #END upload_expression
+        #END upload_expressions_batch
 
         # At some point might do deeper type checking...
         if not isinstance(returnVal, dict):
-            raise ValueError('Method upload_expression return value ' +
+            raise ValueError('Method upload_expressions_batch return value ' +
                              'returnVal is not type dict as required.')
         # return the results
         return [returnVal]
@@ -368,7 +791,7 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
            The object ref is 'ws_name_or_id/obj_name_or_id' where
            ws_name_or_id is the workspace name or id and obj_name_or_id is
            the object name or id *) -> structure: parameter "source_ref" of
-           String
+           String, parameter "members" of list of String
         :returns: instance of type "DownloadExpressionOutput" (*  The output
            of the download method.  *) -> structure: parameter
            "destination_dir" of String
@@ -395,17 +818,8 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
         output_dir = os.path.join(self.scratch, 'download_' + str(timestamp))
         os.mkdir(output_dir)
 
-        file_ret = self.dfu.shock_to_file({
-                                           'shock_id': expression[0]['data']['file']['id'],
-                                           'file_path': output_dir,
-                                           'unpack': 'unpack'
-                                           })
-
-        if not os.listdir(output_dir):
-            raise ValueError('No files were downloaded: ' + output_dir)
-
-        for f in glob.glob(output_dir + '/*.zip'):
-            os.remove(f)
+        self._download_bundle(ctx, expression[0]['data']['file'], output_dir,
+                              params.get(self.PARAM_IN_MEMBERS) or None)
 
         returnVal = {'destination_dir': output_dir}
 
@@ -418,6 +832,69 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
         # return the results
         return [returnVal]
 
+    def get_expression_member(self, ctx, params):
+        """
+        Downloads a single file of an expression, reading just the bytes of
+        that file from shock when the expression was uploaded with the member
+        index of its files *
+        :param params: instance of type "GetExpressionMemberParams" (*
+           Required input parameters for getting a file of an expression
+           string source_ref         -       object reference of expression
+           source. The object ref is 'ws_name_or_id/obj_name_or_id' where
+           ws_name_or_id is the workspace name or id and obj_name_or_id is
+           the object name or id string member       -       name of the
+           file, e.g. genes.fpkm_tracking *) -> structure: parameter
+           "source_ref" of String, parameter "member" of String
+        :returns: instance of type "GetExpressionMemberOutput" (*  The
+           output of the get_expression_member method.  *) -> structure:
+           parameter "file_path" of String
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN get_expression_member
+
+        self.__LOGGER.info('Running get_expression_member with params:\n' +
+                           pformat(params))
+
+        self._check_required_param(params, [self.PARAM_IN_SRC_REF, self.PARAM_IN_MEMBER])
+        member = params[self.PARAM_IN_MEMBER]
+        if member.startswith('/') or '..' in member.split('/'):
+            raise ValueError('Invalid ' + self.PARAM_IN_MEMBER + ': ' + member)
+
+        # just the file handle of the expression, not its expression levels
+        ws = use_session(Workspace(self.ws_url, token=ctx['token']))
+        try:
+            expression = ws.get_objects2({'objects': [{'ref': params[self.PARAM_IN_SRC_REF],
+                                                       'included': ['/file']}]})['data'][0]
+        except WorkspaceError as wse:
+            self.__LOGGER.error('Logging stacktrace from workspace exception:\n' + wse.data)
+            raise
+
+        file_handle = expression['data']['file']
+        bundle_members = json.loads((expression['info'][10] or {}).get(
+            self.META_BUNDLE_MEMBERS, '{}'))
+
+        # set the output dir
+        timestamp = int((datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds() * 1000)
+        output_dir = os.path.join(self.scratch, 'member_' + str(timestamp))
+        os.mkdir(output_dir)
+        file_path = os.path.join(output_dir, *member.split('/'))
+
+        if member not in bundle_members or not self._read_bundle_member(
+                ctx, file_handle, bundle_members[member], file_path):
+            self._download_bundle(ctx, file_handle, output_dir, [member])
+
+        returnVal = {'file_path': file_path}
+
+        #END get_expression_member
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, dict):
+            raise ValueError('Method get_expression_member return value ' +
+                             'returnVal is not type dict as required.')
+        # return the results
+        return [returnVal]
+
     def export_expression(self, ctx, params):
         """
         Wrapper function for use by in-narrative downloaders to download expressions from shock *
@@ -458,10 +935,18 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
     def get_expressionMatrix(self, ctx, params):
         """
         :param params: instance of type "getExprMatrixParams" (* Following
-           are the required input parameters to get Expression Matrix *) ->
-           structure: parameter "workspace_name" of String, parameter
-           "output_obj_name" of String, parameter "expressionset_ref" of
-           String
+           are the required input parameters to get Expression Matrix
+           Optional parameters for an incremental update, when expressions
+           were added to or removed from the set since the matrices were
+           last built: string   previous_exprMatrix_FPKM_ref  -  FPKM matrix
+           of the previous call string   previous_exprMatrix_TPM_ref   -  TPM
+           matrix of the previous call Only the expressions missing from the
+           previous matrices, or saved after them, are fetched; the other
+           columns are copied from the previous matrices. *) -> structure:
+           parameter "workspace_name" of String, parameter "output_obj_name"
+           of String, parameter "expressionset_ref" of String, parameter
+           "previous_exprMatrix_FPKM_ref" of String, parameter
+           "previous_exprMatrix_TPM_ref" of String
         :returns: instance of type "getExprMatrixOutput" -> structure:
            parameter "exprMatrix_FPKM_ref" of String, parameter
            "exprMatrix_TPM_ref" of String
@@ -481,6 +966,38 @@ workspace object. Once uploaded, the expression files can be downloaded onto an
                              'returnVal is not type dict as required.')
         # return the results
         return [returnVal]
+
+    def export_expression_matrix(self, ctx, params):
+        """
+        Exports an expression matrix to shock as a zip of float64 .npy tiles of
+        row_block_size x col_block_size values, listed in a manifest.json, so
+        single genes or samples can be read without loading the whole matrix *
+        :param params: instance of type "ExportMatrixParams" (* Required
+           input parameters for exporting an expression matrix string  
+           source_ref     -   object reference of a
+           KBaseFeatureValues.ExpressionMatrix int      row_block_size -  
+           Optional - number of rows (genes) per tile (default 4096) int     
+           col_block_size -   Optional - number of columns (samples) per tile
+           (default 64) *) -> structure: parameter "source_ref" of String,
+           parameter "row_block_size" of Long, parameter "col_block_size" of
+           Long
+        :returns: instance of type "ExportMatrixOutput" -> structure:
+           parameter "shock_id" of String
+        """
+        # ctx is the context object
+        # return variables are: output
+        #BEGIN export_expression_matrix
+        shock_id = self.expr_matrix_utils.export_expression_matrix(params)
+
+        output = {'shock_id': shock_id}
+        #END export_expression_matrix
+
+        # At some point might do deeper type checking...
+        if not isinstance(output, dict):
+            raise ValueError('Method export_expression_matrix return value ' +
+                             'output is not type dict as required.')
+        # return the results
+        return [output]
     def status(self, ctx):
         #BEGIN_STATUS
         returnVal = {'state': "OK",
@@ -337,10 +337,18 @@ class Application(object):
                              name='ExpressionUtils.upload_expression',
                              types=[dict])
         self.method_authentication['ExpressionUtils.upload_expression'] = 'required'  # noqa
+        self.rpc_service.add(impl_ExpressionUtils.upload_expressions_batch,
+                             name='ExpressionUtils.upload_expressions_batch',
+                             types=[dict])
+        self.method_authentication['ExpressionUtils.upload_expressions_batch'] = 'required'  # noqa
         self.rpc_service.add(impl_ExpressionUtils.download_expression,
                              name='ExpressionUtils.download_expression',
                              types=[dict])
         self.method_authentication['ExpressionUtils.download_expression'] = 'required'  # noqa
+        self.rpc_service.add(impl_ExpressionUtils.get_expression_member,
+                             name='ExpressionUtils.get_expression_member',
+                             types=[dict])
+        self.method_authentication['ExpressionUtils.get_expression_member'] = 'required'  # noqa
         self.rpc_service.add(impl_ExpressionUtils.export_expression,
                              name='ExpressionUtils.export_expression',
                              types=[dict])
@@ -349,6 +357,10 @@ class Application(object):
                              name='ExpressionUtils.get_expressionMatrix',
                              types=[dict])
         self.method_authentication['ExpressionUtils.get_expressionMatrix'] = 'required'  # noqa
+        self.rpc_service.add(impl_ExpressionUtils.export_expression_matrix,
+                             name='ExpressionUtils.export_expression_matrix',
+                             types=[dict])
+        self.method_authentication['ExpressionUtils.export_expression_matrix'] = 'required'  # noqa
         self.rpc_service.add(impl_ExpressionUtils.status,
                              name='ExpressionUtils.status',
                              types=[dict])
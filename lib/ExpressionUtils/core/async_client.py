@@ -0,0 +1,53 @@
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+
+# threads running the calls of the AsyncClient wrappers, see _get_async_pool.
+# Can be set with the KB_CLIENT_ASYNC_THREADS environment variable.
+ASYNC_THREADS = int(os.environ.get('KB_CLIENT_ASYNC_THREADS', 10))
+
+_async_pool = None
+_async_pool_lock = threading.Lock()
+
+
+def _get_async_pool():
+    global _async_pool
+    with _async_pool_lock:
+        if _async_pool is None:
+            _async_pool = ThreadPool(ASYNC_THREADS)
+        return _async_pool
+
+
+class AsyncClient(object):
+    """
+     Wraps a generated KBase client so that its methods return at once, while
+     the calls run on a thread pool shared by the AsyncClients of the process.
+     The methods return multiprocessing.pool.AsyncResult instances; their
+     get() method waits for the call and returns its result or raises its
+     error, e.g.:
+        dfu = AsyncClient(use_session(DataFileUtil(url)))
+        upload = dfu.file_to_shock({'file_path': path})
+        ...
+        handle = upload.get()['handle']
+     Calls run on the shared pool must not wait for other calls made on it.
+    """
+
+    def __init__(self, client, pool=None):
+        """
+        :param client: the client to wrap, e.g. a DataFileUtil or Workspace
+                       instance
+        :param pool: Optional - the thread pool running the calls, instead of
+                     the shared one
+        """
+        self._client = client
+        self._pool = pool
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+        if name.startswith('_') or not callable(method):
+            return method
+
+        def call_async(*args, **kwargs):
+            pool = self._pool or _get_async_pool()
+            return pool.apply_async(method, args, kwargs)
+        return call_async
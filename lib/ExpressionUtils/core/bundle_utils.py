@@ -0,0 +1,408 @@
+import os
+import re
+import json
+import time
+import uuid
+import zlib
+import struct
+import hashlib
+import zipfile
+from multiprocessing.pool import ThreadPool
+
+# size of the blocks bundle files are read in
+HASH_BLOCK_SIZE = 1 << 20
+
+# size of the blocks bundle files are deflated in by pack_bundle
+PACK_BLOCK_SIZE = 1 << 20
+
+# largest size or offset of a zip file without the zip64 extensions
+ZIP_LIMIT = 0xFFFFFFFF
+
+
+def _encode(path):
+    return path.encode('utf-8') if isinstance(path, unicode) else path
+
+
+def _bundle_files(source_dir, exclude):
+    exclude = set(exclude)
+    file_paths = list()
+    for dir_path, dir_names, file_names in os.walk(source_dir):
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            rel_path = os.path.relpath(file_path, source_dir)
+            if rel_path not in exclude:
+                file_paths.append((rel_path, file_path))
+    return sorted(file_paths)
+
+
+def hash_bundle(source_dir, exclude=()):
+    """
+    hash_bundle: returns the SHA-256 hex digest of a bundle directory, over
+                 the name of the directory and the relative path, size and
+                 content of each of its files, in sorted path order, so that
+                 two directories of the same name and the same files hash the
+                 same.
+
+    :param exclude: paths, relative to source_dir, of files to leave out
+    """
+    bundle_hash = hashlib.sha256()
+    bundle_hash.update(_encode(os.path.basename(os.path.normpath(source_dir))) + '\0')
+
+    for rel_path, file_path in _bundle_files(source_dir, exclude):
+        bundle_hash.update('{0}\0{1}\0'.format(_encode(rel_path), os.path.getsize(file_path)))
+        with open(file_path, 'rb') as bundle_file:
+            for block in iter(lambda: bundle_file.read(HASH_BLOCK_SIZE), b''):
+                bundle_hash.update(block)
+
+    return bundle_hash.hexdigest()
+
+
+def file_md5(file_path):
+    """
+    file_md5: returns the MD5 hex digest of a file, as shock reports it in the
+              remote_md5 of a handle
+    """
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as md5_file:
+        for block in iter(lambda: md5_file.read(HASH_BLOCK_SIZE), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def _deflate_block(block_args):
+    block, level, last = block_args
+    # a sync flush ends each block on a byte boundary without ending the
+    # stream, so the independently deflated blocks concatenate to one stream
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(block) + compressor.flush(
+        zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def _read_blocks(bundle_file):
+    block = bundle_file.read(PACK_BLOCK_SIZE)
+    while True:
+        next_block = bundle_file.read(PACK_BLOCK_SIZE)
+        yield block, not next_block
+        if not next_block:
+            return
+        block = next_block
+
+
+def _dos_date_time(mtime):
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+def pack_bundle(source_dir, zip_path, level=zlib.Z_DEFAULT_COMPRESSION, threads=1,
+                exclude=()):
+    """
+    pack_bundle: zips the files of source_dir, by their paths relative to
+                 source_dir, into zip_path.
+
+    :param level: Optional - the zlib compression level, 0 to store the files
+                  uncompressed
+    :param threads: Optional - the number of threads deflating the blocks of
+                    the files; blocks are deflated independently, as pigz
+                    does, so that they can be deflated concurrently
+    :param exclude: Optional - paths, relative to source_dir, of files to
+                    leave out
+    """
+    compress_type = zipfile.ZIP_DEFLATED if level else zipfile.ZIP_STORED
+    pool = ThreadPool(threads) if compress_type == zipfile.ZIP_DEFLATED and threads > 1 else None
+
+    members = list()
+    try:
+        with open(zip_path, 'wb') as zip_file:
+            for rel_path, file_path in _bundle_files(source_dir, exclude):
+                name = _encode(rel_path.replace(os.sep, '/'))
+                flag_bits = 0x800 if isinstance(rel_path, unicode) else 0
+                stat = os.stat(file_path)
+                dos_time, dos_date = _dos_date_time(stat.st_mtime)
+                header_offset = zip_file.tell()
+                if header_offset > ZIP_LIMIT:
+                    raise ValueError('bundle too large to pack: ' + source_dir)
+
+                # the crc and sizes are written over once the file is packed
+                zip_file.write(struct.pack(zipfile.structFileHeader, zipfile.stringFileHeader,
+                                           20, 0, flag_bits, compress_type, dos_time, dos_date,
+                                           0, 0, 0, len(name), 0))
+                zip_file.write(name)
+
+                crc = 0
+                file_size = 0
+                compress_size = 0
+                with open(file_path, 'rb') as bundle_file:
+                    if compress_type == zipfile.ZIP_STORED:
+                        for block in iter(lambda: bundle_file.read(PACK_BLOCK_SIZE), b''):
+                            crc = zlib.crc32(block, crc)
+                            file_size += len(block)
+                            zip_file.write(block)
+                        compress_size = file_size
+                    else:
+                        blocks = _read_blocks(bundle_file)
+                        while True:
+                            # a window of blocks at a time, to bound the memory used
+                            window = [(block, level, last) for block, last in
+                                      (next(blocks, (None, None)) for _ in range(threads * 2))
+                                      if block is not None]
+                            if not window:
+                                break
+                            for block, _, _ in window:
+                                crc = zlib.crc32(block, crc)
+                                file_size += len(block)
+                            deflated = (pool.map(_deflate_block, window) if pool
+                                        else [_deflate_block(args) for args in window])
+                            for data in deflated:
+                                compress_size += len(data)
+                                zip_file.write(data)
+
+                if max(file_size, compress_size) > ZIP_LIMIT:
+                    raise ValueError('bundle too large to pack: ' + source_dir)
+
+                crc &= 0xFFFFFFFF
+                end_offset = zip_file.tell()
+                zip_file.seek(header_offset + 14)
+                zip_file.write(struct.pack('<3L', crc, compress_size, file_size))
+                zip_file.seek(end_offset)
+
+                members.append((name, flag_bits, dos_time, dos_date, crc, compress_size,
+                                file_size, stat.st_mode, header_offset))
+
+            central_dir_offset = zip_file.tell()
+            for (name, flag_bits, dos_time, dos_date, crc, compress_size,
+                 file_size, mode, header_offset) in members:
+                zip_file.write(struct.pack(zipfile.structCentralDir, zipfile.stringCentralDir,
+                                           20, 3, 20, 0, flag_bits, compress_type,
+                                           dos_time, dos_date, crc, compress_size, file_size,
+                                           len(name), 0, 0, 0, 0,
+                                           (mode & 0xFFFF) << 16, header_offset))
+                zip_file.write(name)
+            central_dir_size = zip_file.tell() - central_dir_offset
+
+            if len(members) > 0xFFFF or central_dir_offset + central_dir_size > ZIP_LIMIT:
+                raise ValueError('bundle too large to pack: ' + source_dir)
+            zip_file.write(struct.pack(zipfile.structEndArchive, zipfile.stringEndArchive,
+                                       0, 0, len(members), len(members),
+                                       central_dir_size, central_dir_offset, 0))
+    finally:
+        if pool:
+            pool.close()
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    while len(data) < size:
+        block = stream.read(size - len(data))
+        if not block:
+            raise ValueError('zip file ends before its central directory')
+        data += block
+    return data
+
+
+def _member_path(dest_dir, name):
+    parts = name.split('/')
+    if name.startswith('/') or '..' in parts or os.path.isabs(name):
+        raise ValueError('zip file member outside of the zip file: ' + name)
+    return os.path.join(dest_dir, *[part for part in parts if part])
+
+
+def _extract_member(stream, file_path, name, compress_type, compress_size, file_size, crc):
+    if not os.path.exists(os.path.dirname(file_path)):
+        os.makedirs(os.path.dirname(file_path))
+
+    decompressor = (zlib.decompressobj(-zlib.MAX_WBITS)
+                    if compress_type == zipfile.ZIP_DEFLATED else None)
+    member_crc = 0
+    with open(file_path, 'wb') as member_file:
+        try:
+            while compress_size:
+                block = _read_exactly(stream, min(compress_size, PACK_BLOCK_SIZE))
+                compress_size -= len(block)
+                if decompressor:
+                    block = decompressor.decompress(block)
+                member_crc = zlib.crc32(block, member_crc)
+                member_file.write(block)
+            if decompressor:
+                block = decompressor.flush()
+                member_crc = zlib.crc32(block, member_crc)
+                member_file.write(block)
+        except zlib.error as e:
+            raise ValueError('zip file member corrupt: {0}: {1}'.format(name, e))
+
+    if member_crc & 0xFFFFFFFF != crc or os.path.getsize(file_path) != file_size:
+        raise ValueError('zip file member corrupt: ' + name)
+
+
+def unpack_bundle_stream(stream, dest_dir, members=None):
+    """
+    unpack_bundle_stream: extracts the files of a zip file into dest_dir as
+                          the zip file is read from stream, front to back by
+                          the local headers of its files, so the zip file is
+                          never written to disk; returns the names of the
+                          files extracted. Raises ValueError for a zip file
+                          that cannot be read that way, e.g. with files whose
+                          sizes follow their data.
+
+    :param members: Optional - the names of the files to extract; the rest
+                    are skipped, and the stream is read no further once they
+                    are all extracted
+    """
+    remaining = set(members) if members is not None else None
+    extracted = list()
+
+    while remaining is None or remaining:
+        # the central directory follows the last file
+        signature = stream.read(4)
+        if signature != zipfile.stringFileHeader:
+            break
+
+        (_, _, _, flag_bits, compress_type, _, _, crc, compress_size, file_size,
+         name_length, extra_length) = struct.unpack(
+            zipfile.structFileHeader,
+            signature + _read_exactly(stream, zipfile.sizeFileHeader - 4))
+        name = _read_exactly(stream, name_length)
+        if flag_bits & 0x800:
+            name = name.decode('utf-8')
+        _read_exactly(stream, extra_length)
+
+        if flag_bits & 0x8 or compress_size == ZIP_LIMIT:
+            raise ValueError('zip file member sizes unknown before its data: ' + name)
+        if flag_bits & 0x1 or compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise ValueError('zip file member encrypted or compressed unsupported: ' + name)
+
+        if remaining is not None and name not in remaining:
+            while compress_size:
+                compress_size -= len(_read_exactly(stream, min(compress_size, PACK_BLOCK_SIZE)))
+            continue
+
+        file_path = _member_path(dest_dir, name)
+        if name.endswith('/'):
+            if not os.path.exists(file_path):
+                os.makedirs(file_path)
+            continue
+        _extract_member(stream, file_path, name, compress_type, compress_size, file_size, crc)
+
+        extracted.append(name)
+        if remaining is not None:
+            remaining.discard(name)
+
+    return extracted
+
+
+def index_bundle(zip_path):
+    """
+    index_bundle: returns the member index of a zip file, mapping the name of
+                  each of its files to [offset, compress_size, file_size,
+                  compress_type, crc], where offset is where the (compressed)
+                  data of the file starts, so that a file can be extracted
+                  from just those bytes of the zip file, see
+                  unpack_bundle_member
+    """
+    members = dict()
+    with zipfile.ZipFile(zip_path) as zip_file, open(zip_path, 'rb') as raw_file:
+        for info in zip_file.infolist():
+            if info.filename.endswith('/'):
+                continue
+            # the extra field of the local header may differ from the central one
+            raw_file.seek(info.header_offset)
+            header = struct.unpack(zipfile.structFileHeader,
+                                   _read_exactly(raw_file, zipfile.sizeFileHeader))
+            offset = (info.header_offset + zipfile.sizeFileHeader +
+                      header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH])
+            members[info.filename] = [offset, info.compress_size, info.file_size,
+                                      info.compress_type, info.CRC]
+    return members
+
+
+def dump_bundle_index(members, max_bytes):
+    """
+    dump_bundle_index: returns a member index (see index_bundle) as compact
+                       JSON, or None if that takes more than max_bytes bytes
+    """
+    # non ASCII names are escaped, so the length is the size in bytes
+    index = json.dumps(members, separators=(',', ':'), sort_keys=True)
+    if len(index) > max_bytes:
+        return None
+    return index
+
+
+def unpack_bundle_member(stream, member, file_path):
+    """
+    unpack_bundle_member: extracts a file of a zip file to file_path from a
+                          stream of the bytes of the zip file starting at the
+                          offset of its member index entry, see index_bundle;
+                          raises ValueError if the bytes are not those of the
+                          file
+    """
+    offset, compress_size, file_size, compress_type, crc = member
+    if compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        raise ValueError('zip file member compressed unsupported: ' + file_path)
+    _extract_member(stream, file_path, os.path.basename(file_path), compress_type,
+                    compress_size, file_size, crc)
+
+
+class BundleIndex:
+    """
+     Local index of the bundles loaded to shock, from the hash of a bundle (see
+     hash_bundle) to the shock handle of its upload and the member index of
+     its zip file (see index_bundle), so that a bundle already
+     loaded is not loaded again. The index is kept per user, so that a user
+     only reuses the shock nodes of the bundles they loaded themselves. Each
+     entry is a JSON file named by the hash in the directory of the user,
+     written atomically, so the index can be shared by concurrent uploads.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        if not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+
+    def _entry_path(self, user_id, bundle_hash):
+        if not re.match('^\\w[\\w.-]*$', user_id or ''):
+            raise ValueError('invalid user id: {0}'.format(user_id))
+        if not re.match('^[0-9a-f]+$', bundle_hash):
+            raise ValueError('invalid bundle hash: {0}'.format(bundle_hash))
+        return os.path.join(self.index_dir, user_id, bundle_hash + '.json')
+
+    def get(self, user_id, bundle_hash):
+        """
+        get: returns the entry of a bundle of a user, a dict of its shock handle
+             and member index, or None if it is not indexed
+        """
+        try:
+            with open(self._entry_path(user_id, bundle_hash)) as entry:
+                return json.load(entry)
+        except (IOError, ValueError):
+            return None
+
+    def put(self, user_id, bundle_hash, handle, members=None):
+        """
+        put: indexes the shock handle of a bundle loaded by a user
+
+        :param members: Optional - the member index of the zip file of the bundle
+        """
+        entry_path = self._entry_path(user_id, bundle_hash)
+        user_dir = os.path.dirname(entry_path)
+        try:
+            os.makedirs(user_dir)
+        except OSError:
+            # created by a concurrent upload
+            if not os.path.isdir(user_dir):
+                raise
+        tmp_path = '{0}.{1}.tmp'.format(entry_path, uuid.uuid4())
+        with open(tmp_path, 'w') as entry:
+            json.dump({'handle': handle, 'members': members}, entry)
+        os.rename(tmp_path, entry_path)
+
+    def remove(self, user_id, bundle_hash):
+        """
+        remove: removes a bundle of a user from the index, e.g. when its shock
+                node is gone
+        """
+        try:
+            os.remove(self._entry_path(user_id, bundle_hash))
+        except OSError:
+            pass
@@ -1,11 +1,18 @@
 import os
 import uuid
 import re
+import numpy as np
 from pprint import pprint, pformat
+from multiprocessing.pool import ThreadPool
 
 from Workspace.WorkspaceClient import Workspace
+from Workspace.baseclient import ServerError as WorkspaceError
 from DataFileUtil.DataFileUtilClient import DataFileUtil
 from DataFileUtil.baseclient import ServerError as DFUError
+from matrix_builder import MatrixBuilder
+from matrix_export import write_matrix_tiles
+from object_cache import WorkspaceObjectCache
+from http_session import use_session
 
 class ExprMatrixUtils:
     """
@@ -15,6 +22,25 @@ class ExprMatrixUtils:
     PARAM_IN_WS_NAME = 'workspace_name'
     PARAM_IN_OBJ_NAME = 'output_obj_name'
     PARAM_IN_EXPSET_REF = 'expressionset_ref'
+    PARAM_IN_PREV_FPKM_REF = 'previous_exprMatrix_FPKM_ref'
+    PARAM_IN_PREV_TPM_REF = 'previous_exprMatrix_TPM_ref'
+    PARAM_IN_SRC_REF = 'source_ref'
+    PARAM_IN_ROW_BLOCK_SIZE = 'row_block_size'
+    PARAM_IN_COL_BLOCK_SIZE = 'col_block_size'
+
+    # default tile size of exported matrices
+    EXPORT_ROW_BLOCK_SIZE = 4096
+    EXPORT_COL_BLOCK_SIZE = 64
+
+    # number of expression objects requested per get_objects2 call
+    EXPR_FETCH_BATCH_SIZE = 50
+
+    # the parts of the expression objects used to build the matrices
+    EXPR_INCLUDED_PATHS = ['/expression_levels',
+                           '/tpm_expression_levels',
+                           '/condition',
+                           '/numerical_interpretation',
+                           '/processing_comments']
 
     def __init__(self, config, logger=None):
         self.config = config
@@ -22,13 +48,16 @@ class ExprMatrixUtils:
         self.callback_url = os.environ['SDK_CALLBACK_URL']
         self.scratch = os.path.join(config['scratch'], 'EM_' + str(uuid.uuid4()))
         self.ws_url = config['workspace-url']
-        self.ws_client = Workspace(self.ws_url)
-        self.dfu = DataFileUtil(self.callback_url)
+        self.ws_client = use_session(Workspace(self.ws_url))
+        self.dfu = use_session(DataFileUtil(self.callback_url))
+        # number of get_objects2 calls issued concurrently
+        self.expr_fetch_threads = int(config.get('expression-fetch-threads', 4))
         pass
 
-    def process_params(self, params):
+    def process_params(self, object_cache, params):
         """
-        validates params passed to gen expression matrix method
+        validates params passed to gen expression matrix method, and returns the
+        id of the output workspace
         """
         for p in [self.PARAM_IN_EXPSET_REF,
                   self.PARAM_IN_OBJ_NAME,
@@ -38,136 +67,331 @@ class ExprMatrixUtils:
                 raise ValueError('"{}" parameter is required, but missing'.format(p))
 
         ws_name_id = params.get(self.PARAM_IN_WS_NAME)
+        ws_calls = list()
+        if not isinstance(ws_name_id, int):
+            ws_calls.append(('get_workspace_info', {'workspace': ws_name_id}))
+
+        # the expression set and previous matrices are fetched in the same
+        # batch request as the workspace info
+        object_refs = [params.get(self.PARAM_IN_EXPSET_REF)]
+        if params.get(self.PARAM_IN_PREV_FPKM_REF):
+            object_refs += [params.get(p) for p in [self.PARAM_IN_PREV_FPKM_REF,
+                                                    self.PARAM_IN_PREV_TPM_REF]
+                            if params.get(p)]
+        try:
+            ws_results = object_cache.prefetch(object_refs, ws_calls=ws_calls)
+        except WorkspaceError:
+            # raises the ValueError of the workspace, if it is the one failing
+            self.get_ws_id(ws_name_id)
+            raise
+
+        return ws_results[0][0] if ws_calls else ws_name_id
+
+    def get_ws_id(self, ws_name_id):
+        """
+        returns the id of a workspace given by name or id
+        """
         if not isinstance(ws_name_id, int):
             try:
                 ws_name_id = self.dfu.ws_name_to_id(ws_name_id)
             except DFUError as se:
                 prefix = se.message.split('.')[0]
                 raise ValueError(prefix)
-        self.ws_id = ws_name_id
-
-    def get_expressionset_data(self, expressionset_ref):
-
-        expr_set_obj = self.ws_client.get_objects2(
-            {'objects': [{'ref': expressionset_ref}]})['data'][0]
+        return ws_name_id
 
+    def get_expression_refs(self, expr_set_obj):
+        """
+        returns the refs of the expressions of an expression set object, in
+        order, or None if the object is not an expression set
+        """
         expr_set_obj_type = expr_set_obj.get('info')[2]
-        expr_set_data = dict()
-        expr_set_data['ws_name'] = expr_set_obj.get('info')[7]
-        expr_set_data['obj_name'] = expr_set_obj.get('info')[1]
 
         if re.match('KBaseRNASeq.RNASeqExpressionSet-\d.\d', expr_set_obj_type):
-            expr_set_data['genome_ref'] = expr_set_obj['data']['genome_id']
             expr_obj_refs = list()
             for expr_obj in expr_set_obj['data']['mapped_expression_ids']:
                 expr_obj_refs.append(expr_obj.values()[0])
-            expr_set_data['expr_obj_refs'] = expr_obj_refs
+            return expr_obj_refs
 
         elif re.match('KBaseSets.ExpressionSet-\d.\d', expr_set_obj_type):
             items = expr_set_obj.get('data').get('items')
             expr_obj_refs = list()
             for item in items:
                 expr_obj_refs.append(item['ref'])
-            expr_obj = self.ws_client.get_objects2(
-                {'objects': [{'ref': expr_obj_refs[0]}]})['data'][0]
-            expr_set_data['genome_ref'] = expr_obj['data']['genome_id']
-            expr_set_data['expr_obj_refs'] = expr_obj_refs
-        else:
+            return expr_obj_refs
+
+        return None
+
+    def get_expressionset_data(self, object_cache, expressionset_ref):
+
+        expr_set_obj = object_cache.get_objects([expressionset_ref])[0]
+
+        expr_set_data = dict()
+        expr_set_data['ref'] = expressionset_ref
+        expr_set_data['ws_name'] = expr_set_obj.get('info')[7]
+        expr_set_data['obj_name'] = expr_set_obj.get('info')[1]
+
+        expr_obj_refs = self.get_expression_refs(expr_set_obj)
+        if expr_obj_refs is None:
             raise TypeError(self.PARAM_IN_EXPSET_REF + ' should be of type ' +
                             'KBaseRNASeq.RNASeqExpressionSet ' +
                             'or KBaseSets.ExpressionSet')
+        expr_set_data['expr_obj_refs'] = expr_obj_refs
+
+        if re.match('KBaseRNASeq.RNASeqExpressionSet-\d.\d', expr_set_obj.get('info')[2]):
+            expr_set_data['genome_ref'] = expr_set_obj['data']['genome_id']
+        else:
+            expr_set_data['genome_ref'] = self.get_expression_genome_ref(object_cache,
+                                                                         expr_obj_refs[0])
         return expr_set_data
 
-    def save_expression_matrix(self, tables, expr_set_data, em_obj_name, hidden = 0):
-
-        all_rows = {}    # build a dictionary of keys only which is a union of all row ids (gene_ids)
-        self.logger.info( '***** length of tables is {0}'.format( len( tables )))
-        for table in tables:
-            for r in table.keys():
-                all_rows[r] = []
-
-        for gene_id in all_rows.keys():
-            row = []
-            for table in tables:
-                if ( gene_id in table ):
-                    #logger.info( 'append ' + gene_id )
-                    #logger.info( pformat( table[gene_id]))
-                               #all_rows[gene_id].append( table[gene_id] )
-                    row.append( table[gene_id] )
-                else:
-                    #logger.info( 'append  0' )
-                    row.append( 0 )
-                all_rows[gene_id] = row
-                #logger.info( all_rows[gene_id])
+    def get_expression_genome_ref(self, object_cache, expr_obj_ref):
+        """
+        reads the genome_id of an expression from its object metadata, falling
+        back to fetching only that field of the object
+        """
+        expr_info = object_cache.get_object_infos([expr_obj_ref])[0]
+        genome_ref = (expr_info[10] or {}).get('genome_id')
+        if not genome_ref:
+            expr_obj = object_cache.get_objects([expr_obj_ref], ['/genome_id'])[0]
+            genome_ref = expr_obj['data']['genome_id']
+
+        return genome_ref
+
+    def _get_expression_objects_batch(self, object_cache, expr_obj_refs, ws_name):
+        """
+        fetches a batch of expression objects in a single get_objects2 call,
+        leaving out the parts of the objects not used by the matrices
+        """
+        try:
+            self.logger.info('*** getting {0} expression objects from workspace ****'
+                             .format(len(expr_obj_refs)))
+
+            return object_cache.get_objects(expr_obj_refs, self.EXPR_INCLUDED_PATHS)
+
+        except Exception, e:
+            self.logger.exception(e)
+            raise Exception('Unable to download expression objects {0} from workspace {1}'.
+                            format(', '.join(expr_obj_refs), ws_name))
+
+    def get_expression_objects(self, object_cache, expr_obj_refs, ws_name):
+        """
+        fetches expression objects in batches of EXPR_FETCH_BATCH_SIZE, with up to
+        expr_fetch_threads batches in flight. Objects are returned in the order
+        of expr_obj_refs.
+        """
+        batches = [expr_obj_refs[i:i + self.EXPR_FETCH_BATCH_SIZE]
+                   for i in range(0, len(expr_obj_refs), self.EXPR_FETCH_BATCH_SIZE)]
+        if not batches:
+            return []
+
+        pool = ThreadPool(max(1, min(self.expr_fetch_threads, len(batches))))
+        try:
+            expr_obj_batches = pool.map(
+                lambda batch: self._get_expression_objects_batch(object_cache, batch, ws_name),
+                batches)
+        finally:
+            pool.terminate()
+
+        return [expr for expr_obj_batch in expr_obj_batches for expr in expr_obj_batch]
 
+    def gen_expression_matrix_object(self, matrix, layer, expr_set_data, em_obj_name, hidden = 0):
+        """
+        generates the ExpressionMatrix workspace object of a layer of a MatrixBuilder
+        """
+        self.logger.info('loading {0} expression matrix data'.format(layer))
         em_data = {
                     'genome_ref': expr_set_data['genome_ref'],
                     'scale': 'log2',
                     'type': 'level',
                     'data': {
-                            'row_ids': [],
-                            'values': [],
+                            'row_ids': matrix.row_ids,
+                            'values': matrix.get_values(layer),
                             'col_ids': expr_set_data['expr_obj_names']
                             },
-                    'feature_mapping' : {},
+                    'feature_mapping' : dict((gene_id, gene_id) for gene_id in matrix.row_ids),
                     'condition_mapping': expr_set_data['condition_map']
                    }
 
-        # we need to load row-by-row to preserve the order
-        self.logger.info('loading expression matrix data')
-
-        for gene_id in all_rows.keys():
-            em_data['feature_mapping'][gene_id] = gene_id
-            em_data['data']['row_ids'].append(gene_id)
-            em_data['data']['values'].append(all_rows[gene_id])
+        return { 'type': 'KBaseFeatureValues.ExpressionMatrix',
+                 'data': em_data,
+                 'name': em_obj_name,
+                 'hidden': hidden,
+                 'extra_provenance_input_refs': [
+                     em_data.get('genome_ref'),
+                     expr_set_data['ref']]
+               }
 
+    def save_expression_matrices(self, ws_id, em_objs):
+        """
+        saves ExpressionMatrix objects in a single workspace call and returns
+        their references
+        """
         try:
-            self.logger.info( 'saving em_data em_name {0}'.format(em_obj_name))
-            obj_info = self.dfu.save_objects({'id': self.ws_id,
-                                              'objects': [
-                                                          { 'type': 'KBaseFeatureValues.ExpressionMatrix',
-                                                            'data': em_data,
-                                                            'name': em_obj_name,
-                                                            'hidden': hidden,
-                                                            'extra_provenance_input_refs': [
-                                                                em_data.get('genome_ref'),
-                                                                self.params[self.PARAM_IN_EXPSET_REF]]
-                                                          }
-                                                    ]})[0]
-            self.logger.info('ws save return:\n' + pformat(obj_info))
+            self.logger.info( 'saving em_data em_names {0}'.format(
+                ', '.join(em_obj['name'] for em_obj in em_objs)))
+            obj_infos = self.dfu.save_objects({'id': ws_id,
+                                               'objects': em_objs})
+            self.logger.info('ws save return:\n' + pformat(obj_infos))
         except Exception as e:
             self.logger.exception(e)
             raise Exception('Failed Saving Expression Matrix to Workspace')
 
-        return str(obj_info[6]) + '/' + str(obj_info[0]) + '/' + str(obj_info[4])
+        return [str(obj_info[6]) + '/' + str(obj_info[0]) + '/' + str(obj_info[4])
+                for obj_info in obj_infos]
+
+    def get_matrix_column_refs(self, object_cache, em_obj):
+        """
+        returns the refs of the expressions of the columns of a matrix, in
+        order, read from the expression set in the provenance of the matrix.
+        The workspace stores the refs of a set as ws/obj/ver refs. Returns None
+        when the provenance holds no single set matching the columns.
+        """
+        prov_refs = list()
+        for action in em_obj.get('provenance') or []:
+            for ref in action.get('resolved_ws_objects') or []:
+                if ref not in prov_refs:
+                    prov_refs.append(ref)
+        if not prov_refs:
+            return None
+
+        try:
+            prov_infos = object_cache.get_object_infos(prov_refs)
+            expr_set_objs = object_cache.get_objects(
+                [ref for ref, info in zip(prov_refs, prov_infos)
+                 if info[2].split('-')[0] in ['KBaseRNASeq.RNASeqExpressionSet',
+                                              'KBaseSets.ExpressionSet']])
+            if len(expr_set_objs) != 1:
+                return None
+
+            col_refs = self.get_expression_refs(expr_set_objs[0])
+            col_infos = object_cache.get_object_infos(col_refs)
+        except WorkspaceError as e:
+            self.logger.info('unable to read the provenance of previous matrix {0}: {1}'
+                             .format(em_obj['info'][1], e.message))
+            return None
+
+        if [info[1] for info in col_infos] != em_obj['data']['data']['col_ids']:
+            return None
+        return col_refs
+
+    def get_previous_matrices(self, object_cache, params, expr_set_data):
+        """
+        fetches the matrices of a previous get_expression_matrix call, given for
+        an incremental update. Returns a dictionary with the object data and
+        column expression refs of each matrix layer ('fpkm' and 'tpm'), empty
+        when there is no previous FPKM matrix, the matrices are of another
+        genome or the expressions of their columns cannot be told.
+        """
+        layer_refs = [(layer, params.get(param))
+                      for layer, param in [('fpkm', self.PARAM_IN_PREV_FPKM_REF),
+                                           ('tpm', self.PARAM_IN_PREV_TPM_REF)]
+                      if params.get(param)]
+        if not layer_refs or layer_refs[0][0] != 'fpkm':
+            return {}
+
+        em_objs = object_cache.get_objects([em_ref for layer, em_ref in layer_refs])
+
+        previous = dict()
+        for (layer, em_ref), em_obj in zip(layer_refs, em_objs):
+            if not em_obj.get('info')[2].startswith('KBaseFeatureValues.ExpressionMatrix'):
+                raise TypeError('previous matrix {0} should be of type '.format(em_ref) +
+                                'KBaseFeatureValues.ExpressionMatrix')
+
+            em_data = em_obj.get('data')
+            if em_data.get('genome_ref') != expr_set_data['genome_ref']:
+                self.logger.info('previous matrix {0} is not of genome {1}, rebuilding all columns'
+                                 .format(em_ref, expr_set_data['genome_ref']))
+                return {}
+
+            col_refs = self.get_matrix_column_refs(object_cache, em_obj)
+            if col_refs is None:
+                self.logger.info('unable to tell the expressions of the columns of previous '
+                                 'matrix {0}, not reusing it'.format(em_ref))
+                if layer == 'fpkm':
+                    return {}
+                continue
+
+            previous[layer] = {'data': em_data, 'col_refs': col_refs}
+
+        if 'tpm' in previous and previous['tpm']['col_refs'] != previous['fpkm']['col_refs']:
+            del previous['tpm']
+
+        return previous
+
+    def get_previous_columns(self, previous, expr_obj_refs):
+        """
+        returns, for each expression ref, the column of the previous matrices
+        holding its levels, or None when the expression is not in the previous
+        matrices. Columns are matched on ws/obj/ver refs, so an expression
+        saved again, or a set pointing to another version or to a same-named
+        object, is fetched again.
+        """
+        if not previous:
+            return [None] * len(expr_obj_refs)
+
+        prev_cols = dict((col_ref, col)
+                         for col, col_ref in enumerate(previous['fpkm']['col_refs']))
+
+        return [prev_cols.get(expr_obj_ref) for expr_obj_ref in expr_obj_refs]
 
     def get_expression_matrix(self, params):
+        """
+        builds the FPKM and TPM ExpressionMatrix objects of an expression set.
 
-        self.process_params(params)
-        self.params = params
+        When the matrices of a previous call are given, only the expressions
+        missing from them (by ws/obj/ver ref) are fetched; the columns of the
+        others are copied from the previous matrices, and columns of expressions
+        no longer in the set are dropped. The matrices match those of a full
+        build, except that the rows of genes only found in dropped columns are
+        kept, with zero levels: the previous matrices do not tell a missing
+        level from a zero level.
+        """
+        # workspace objects fetched by this request, passed down rather than
+        # kept on the instance, which serves concurrent requests
+        object_cache = WorkspaceObjectCache(self.ws_client)
+        ws_id = self.process_params(object_cache, params)
 
         expressionset_ref = params.get(self.PARAM_IN_EXPSET_REF)
 
-        expr_set_data = self.get_expressionset_data(expressionset_ref)
+        expr_set_data = self.get_expressionset_data(object_cache, expressionset_ref)
+        expr_obj_refs = expr_set_data['expr_obj_refs']
+
+        previous = self.get_previous_matrices(object_cache, params, expr_set_data)
+        previous_cols = self.get_previous_columns(previous, expr_obj_refs)
+        fetch_refs = [expr_obj_ref for expr_obj_ref, col in zip(expr_obj_refs, previous_cols)
+                      if col is None]
+        self.logger.info('fetching {0} of {1} expressions, reusing the others from the '
+                         'previous matrices'.format(len(fetch_refs), len(expr_obj_refs)))
+        expr_objs = dict(zip(fetch_refs, self.get_expression_objects(
+            object_cache, fetch_refs, expr_set_data['ws_name'])))
+
+        if 'tpm' not in previous and len(fetch_refs) < len(expr_obj_refs) and any(
+                'tpm_expression_levels' in expr['data'] for expr in expr_objs.values()):
+            # the TPM levels of the reused expressions are not in the previous matrices
+            self.logger.info('no previous TPM matrix, fetching the reused expressions')
+            refetch_refs = [expr_obj_ref for expr_obj_ref in expr_obj_refs
+                            if expr_obj_ref not in expr_objs]
+            expr_objs.update(zip(refetch_refs, self.get_expression_objects(
+                object_cache, refetch_refs, expr_set_data['ws_name'])))
+            previous_cols = [None] * len(expr_obj_refs)
+
         expr_obj_names = list()
         fpkm_tables = list()
         tpm_tables = list()
         condition_map = dict()
-        tpm_table = None
-        for expr_obj_ref in expr_set_data['expr_obj_refs']:
-            try:
-                self.logger.info('*** getting expression set {0} from workspace ****'
-                                 .format(expr_obj_ref))
-
-                expr = self.ws_client.get_objects2(
-                                            {'objects':
-                                            [{'ref': expr_obj_ref}]})['data'][0]
-
-            except Exception, e:
-                self.logger.exception(e)
-                raise Exception('Unable to download expression object {0} from workspace {1}'.
-                                format(expr_obj_ref, expr_set_data['ws_name']))
+        has_tpm = True
+        for expr_obj_ref, col in zip(expr_obj_refs, previous_cols):
+            if col is not None:
+                prev_data = previous['fpkm']['data']
+                expr_name = prev_data['data']['col_ids'][col]
+                expr_obj_names.append(expr_name)
+                condition_map.update({expr_name: prev_data['condition_mapping'].get(expr_name)})
+                fpkm_tables.append(None)
+                tpm_tables.append(None)
+                has_tpm = has_tpm and 'tpm' in previous
+                continue
 
+            expr = expr_objs[expr_obj_ref]
             expr_name = expr.get('info')[1]
             expr_obj_names.append(expr_name)
             condition_map.update({expr_name: expr.get('data').get('condition')})
@@ -189,17 +413,86 @@ class ExprMatrixUtils:
             if 'tpm_expression_levels' in expr['data']:  # so we need to check for this key
                 tpm_table = expr.get('data').get('tpm_expression_levels')
                 self.logger.info('TPM keycount: {0}'.format(len(tpm_table.keys())))
-                tpm_tables.append(tpm_table)
+            else:
+                has_tpm = False
+            tpm_tables.append(tpm_table)
 
         expr_set_data['expr_obj_names'] = expr_obj_names
         expr_set_data['condition_map'] = condition_map
         output_obj_name = params.get(self.PARAM_IN_OBJ_NAME)
-        fpkm_ref = self.save_expression_matrix(fpkm_tables,
-                                               expr_set_data,
-                                               '{0}_FPKM_ExpressionMatrix'.format(output_obj_name))
-        tpm_ref = None
-        if tpm_table is not None:
-            tpm_ref = self.save_expression_matrix(tpm_tables,
-                                                  expr_set_data,
-                                                  '{0}_TPM_ExpressionMatrix'.format(output_obj_name))
+
+        # the TPM matrix is only built when every expression has TPM levels
+        layer_tables = {'fpkm': fpkm_tables}
+        if tpm_tables and has_tpm:
+            layer_tables['tpm'] = tpm_tables
+
+        reused_cols = [i for i, col in enumerate(previous_cols) if col is not None]
+        layer_row_ids = dict((layer, previous[layer]['data']['data']['row_ids']
+                              if reused_cols else [])
+                             for layer in layer_tables)
+        row_ids = set()
+        for layer in layer_tables:
+            row_ids.update(layer_row_ids[layer])
+        matrix = MatrixBuilder.from_layers(layer_tables, row_ids=row_ids)
+
+        for layer in layer_tables:
+            if reused_cols and layer_row_ids[layer]:
+                prev_values = np.array(previous[layer]['data']['data']['values'], dtype=np.float64)
+                matrix.set_columns(reused_cols, layer_row_ids[layer],
+                                   prev_values[:, [previous_cols[i] for i in reused_cols]],
+                                   layer)
+
+        em_objs = [self.gen_expression_matrix_object(
+                       matrix, 'fpkm', expr_set_data,
+                       '{0}_FPKM_ExpressionMatrix'.format(output_obj_name))]
+        if 'tpm' in layer_tables:
+            em_objs.append(self.gen_expression_matrix_object(
+                matrix, 'tpm', expr_set_data,
+                '{0}_TPM_ExpressionMatrix'.format(output_obj_name)))
+
+        em_refs = self.save_expression_matrices(ws_id, em_objs)
+        fpkm_ref = em_refs[0]
+        tpm_ref = em_refs[1] if len(em_refs) > 1 else None
+
         return fpkm_ref, tpm_ref
+
+    def export_expression_matrix(self, params):
+        """
+        exports an ExpressionMatrix as a zip of float64 .npy tiles to shock,
+        see matrix_export.write_matrix_tiles for the layout
+        """
+        em_ref = params.get(self.PARAM_IN_SRC_REF)
+        if not em_ref:
+            raise ValueError('"{}" parameter is required, but missing'
+                             .format(self.PARAM_IN_SRC_REF))
+
+        row_block_size = int(params.get(self.PARAM_IN_ROW_BLOCK_SIZE) or self.EXPORT_ROW_BLOCK_SIZE)
+        col_block_size = int(params.get(self.PARAM_IN_COL_BLOCK_SIZE) or self.EXPORT_COL_BLOCK_SIZE)
+
+        object_cache = WorkspaceObjectCache(self.ws_client)
+        em_obj = object_cache.get_objects([em_ref])[0]
+        em_info = em_obj.get('info')
+        if not em_info[2].startswith('KBaseFeatureValues.ExpressionMatrix'):
+            raise TypeError(self.PARAM_IN_SRC_REF + ' should be of type ' +
+                            'KBaseFeatureValues.ExpressionMatrix')
+
+        em_data = em_obj.get('data')
+        output_dir = os.path.join(self.scratch, 'export_' + str(uuid.uuid4()), em_info[1])
+        self.logger.info('writing expression matrix {0} tiles to {1}'.format(em_ref, output_dir))
+        write_matrix_tiles(output_dir,
+                           em_data['data']['row_ids'],
+                           em_data['data']['col_ids'],
+                           em_data['data']['values'],
+                           row_block_size,
+                           col_block_size,
+                           {'source_ref': '{0}/{1}/{2}'.format(em_info[6], em_info[0],
+                                                               em_info[4]),
+                            'genome_ref': em_data.get('genome_ref'),
+                            'scale': em_data.get('scale'),
+                            'type': em_data.get('type')})
+
+        # each tile is compressed as its own zip member, so they can be read separately
+        uploaded_file = self.dfu.file_to_shock({'file_path': output_dir,
+                                                'pack': 'zip'})
+
+        return uploaded_file['shock_id']
@@ -0,0 +1,166 @@
+import gzip
+
+from itertools import izip
+
+from operator import itemgetter
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# size, in bytes, of the chunks of lines read at a time by columns()
+COLUMNS_CHUNK_SIZE = 16 * 1024
+
+# expression file formats, told apart by their header line
+STRINGTIE = 'stringtie'  # StringTie genes.fpkm_tracking / gene_abund.tab, with FPKM and TPM
+CUFFLINKS = 'cufflinks'  # Cufflinks genes.fpkm_tracking / isoforms.fpkm_tracking, FPKM only
+CTAB = 'ctab'            # tablemaker / StringTie -B t_data.ctab, FPKM only
+
+
+def detect_format(header):
+    """
+    detect_format: returns the format of an expression file from its header
+                   columns, or None if the format is not recognized
+    """
+    if header[:2] == ['Gene ID', 'Gene Name'] and 'TPM' in header:
+        return STRINGTIE
+    if header[:1] == ['tracking_id'] and 'FPKM_status' in header:
+        return CUFFLINKS
+    if header[:1] == ['t_id'] and 't_name' in header:
+        return CTAB
+    return None
+
+
+def open_expression_file(filepath):
+    """
+    open_expression_file: opens an expression file for reading, decompressing
+                          it on the fly if it is gzip compressed
+    """
+    with open(filepath, 'rb') as file:
+        magic = file.read(len(GZIP_MAGIC))
+
+    if magic == GZIP_MAGIC:
+        return gzip.open(filepath, 'rb')
+    return open(filepath, 'r')
+
+
+class ExpressionFileReader:
+    """
+     Single pass reader for the tab separated expression files written by
+     StringTie, Cufflinks and tablemaker (genes.fpkm_tracking, gene_abund.tab
+     and t_data.ctab), plain or gzip compressed.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.line_number = 1
+        # blank lines skipped by columns(), see row_line_number
+        self._blank_lines = []
+        self._file = open_expression_file(filepath)
+        self.header = self._file.readline().rstrip('\r\n').split('\t')
+        self.format = detect_format(self.header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def column_index(self, column_name):
+        """
+        column_index: returns the index of a header column or None if the file
+                      has no such column
+        """
+        try:
+            return self.header.index(column_name)
+        except ValueError:
+            return None
+
+    def rows(self, columns):
+        """
+        rows: yields a tuple with the values of the given columns for each line
+              of the file. Lines are only split up to the last requested column.
+        """
+        last_col = max(columns)
+        get_columns = itemgetter(*columns)
+        if len(columns) == 1:
+            get_columns = lambda larr: (larr[columns[0]],)
+
+        # only the last column of a line carries the line terminator
+        strip_line = last_col >= len(self.header) - 1
+
+        for line in self._file:
+            self.line_number += 1
+            if strip_line:
+                line = line.rstrip('\r\n')
+
+            larr = line.split('\t', last_col + 1)
+            if len(larr) <= last_col:
+                if not line.strip():
+                    continue
+                raise ValueError('line {} of {} has only {} columns'
+                                 .format(self.line_number, self.filepath, len(larr)))
+
+            yield get_columns(larr)
+
+    def columns(self, columns):
+        """
+        columns: returns a list with the values of each of the given columns,
+                 in file order. Unlike rows(), the file is read and split in
+                 chunks of lines, which is much faster for large files.
+        """
+        last_col = max(columns)
+        values = [[] for column in columns]
+
+        while True:
+            chunk = self._file.read(COLUMNS_CHUNK_SIZE)
+            if not chunk:
+                break
+            # complete the last line of the chunk
+            if chunk[-1] != '\n':
+                chunk += self._file.readline()
+
+            # splitlines drops the line terminators, so no value needs stripping
+            lines = chunk.splitlines()
+            split_lines = [line.split('\t', last_col + 1) for line in lines]
+            try:
+                chunk_values = [[larr[column] for larr in split_lines] for column in columns]
+            except IndexError:
+                split_lines = self._check_split_lines(lines, split_lines, last_col)
+                chunk_values = [[larr[column] for larr in split_lines] for column in columns]
+            self.line_number += len(lines)
+
+            for column_values, chunk_column_values in izip(values, chunk_values):
+                column_values.extend(chunk_column_values)
+
+        return values
+
+    def _check_split_lines(self, lines, split_lines, last_col):
+        """
+        _check_split_lines: drops the blank lines of a chunk of lines, and
+                            raises a ValueError for a line with too few columns
+        """
+        checked_lines = []
+        for index, (line, larr) in enumerate(izip(lines, split_lines)):
+            if len(larr) > last_col:
+                checked_lines.append(larr)
+            elif not line.strip():
+                self._blank_lines.append(self.line_number + index + 1)
+            else:
+                raise ValueError('line {} of {} has only {} columns'
+                                 .format(self.line_number + index + 1, self.filepath,
+                                         len(larr)))
+        return checked_lines
+
+    def row_line_number(self, row):
+        """
+        row_line_number: returns the line number of the file for an index into
+                         the values returned by columns()
+        """
+        line_number = row + 2
+        for blank_line in self._blank_lines:
+            if blank_line > line_number:
+                break
+            line_number += 1
+        return line_number
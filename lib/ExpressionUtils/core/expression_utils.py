@@ -6,7 +6,50 @@ import time
 
 import sys
 
+import os
+
+import threading
+
+import numpy as np
+
+from collections import OrderedDict
+
+from itertools import izip
+
+from multiprocessing.pool import ThreadPool
+
 from GenomeSearchUtil.GenomeSearchUtilClient import GenomeSearchUtil
+from feature_index import FeatureIndex
+from feature_cache import FeatureIdCache
+from expression_reader import ExpressionFileReader
+from http_session import use_session
+
+
+LOG_2 = math.log(2)
+
+
+def log2_levels(levels):
+    """
+    log2_levels: returns log2(level + 1) for an array of expression levels
+    """
+    # dividing natural logarithms, as math.log(level + 1, 2) does
+    return np.log(levels + 1) / LOG_2
+
+
+def calculate_tpm(fpkm):
+    """
+    calculate_tpm: returns the TPM levels for an array of FPKM levels, or None
+                   if the FPKM levels sum to 0
+    """
+    if not len(fpkm):
+        return None
+
+    # accumulate in file order so the sum matches a row by row summation
+    sum_fpkm = np.add.accumulate(fpkm)[-1]
+    if sum_fpkm == 0:
+        return None
+
+    return (fpkm / sum_fpkm) * 1e6
 
 
 def get_logger():
@@ -27,23 +70,90 @@ class ExpressionUtils:
      Constains a set of functions for expression levels calculations.
     """
 
+    # number of genome feature indexes kept in memory
+    FEATURE_INDEX_CACHE_SIZE = 4
+
+    # number of features requested per GenomeSearchUtil search page and the
+    # number of pages fetched concurrently
+    FEATURE_PAGE_SIZE = 5000
+    FEATURE_PAGE_THREADS = 4
+
+    def _get_feature_page(self, genome_ref, start, feature_num):
+        """
+        _get_feature_page: get a page of features from genome, keeping only
+                           their ids and aliases
+        """
+        genome_features = self.gsu.search({'ref': genome_ref,
+                                           'start': start,
+                                           'limit': self.FEATURE_PAGE_SIZE,
+                                           'num_found': feature_num,
+                                           'sort_by': [['feature_id', True]]})['features']
+
+        return [(genome_feature.get('feature_id'),
+                 list((genome_feature.get('aliases') or {}).keys()))
+                for genome_feature in genome_features]
+
     def _get_feature_ids(self, genome_ref):
         """
         _get_feature_ids: get feature ids from genome
+
+        :return: a dictionary mapping each feature id to its list of aliases
         """
         self.logger.info("Matching to features from genome {}"
                          .format(genome_ref))
 
-        feature_num = self.gsu.search({'ref': genome_ref})['num_found']
+        feature_ids = self.feature_id_cache.get(genome_ref)
+        if feature_ids is not None:
+            self.logger.info("Using cached features of genome {}".format(genome_ref))
+            return feature_ids
 
-        genome_features = self.gsu.search({'ref': genome_ref,
-                                           'limit': feature_num,
-                                           'sort_by': [['feature_id', True]]})['features']
+        feature_num = self.gsu.search({'ref': genome_ref, 'limit': 1})['num_found']
+
+        page_starts = range(0, feature_num, self.FEATURE_PAGE_SIZE)
+        feature_ids = dict()
+        if page_starts:
+            pool = ThreadPool(min(self.FEATURE_PAGE_THREADS, len(page_starts)))
+            try:
+                for feature_page in pool.imap_unordered(
+                        lambda start: self._get_feature_page(genome_ref, start, feature_num),
+                        page_starts):
+                    feature_ids.update(feature_page)
+            finally:
+                pool.terminate()
 
-        features_ids = map(lambda genome_feature: genome_feature.get('feature_id'),
-                           genome_features)
+        self.feature_id_cache.put(genome_ref, feature_ids)
 
-        return list(set(features_ids))
+        return feature_ids
+
+    def _get_feature_index(self, genome_ref):
+        """
+        _get_feature_index: get the FeatureIndex of a genome, building it only
+                            the first time the genome is seen
+        """
+        # only the lock of the genome is created under the shared lock, so
+        # the indexes of different genomes are built concurrently
+        with self.feature_index_lock:
+            genome_lock = self.feature_index_locks.get(genome_ref)
+            if genome_lock is None:
+                genome_lock = self.feature_index_locks[genome_ref] = threading.Lock()
+
+        # concurrent uploads against one genome wait for a single index build
+        with genome_lock:
+            with self.feature_index_lock:
+                feature_index = self.feature_indexes.pop(genome_ref, None)
+                if feature_index is not None:
+                    self.feature_indexes[genome_ref] = feature_index
+            if feature_index is None:
+                feature_index = FeatureIndex(self._get_feature_ids(genome_ref))
+                self.logger.info("Indexed {} features from genome {}"
+                                 .format(len(feature_index), genome_ref))
+
+                with self.feature_index_lock:
+                    self.feature_indexes[genome_ref] = feature_index
+                    while len(self.feature_indexes) > self.FEATURE_INDEX_CACHE_SIZE:
+                        self.feature_indexes.popitem(last=False)
+
+        return feature_index
 
     def __init__(self, config, logger=None):
         self.config = config
@@ -53,7 +163,79 @@ class ExpressionUtils:
             self.logger = get_logger()
 
         callback_url = self.config['SDK_CALLBACK_URL']
-        self.gsu = GenomeSearchUtil(callback_url)
+        self.gsu = use_session(GenomeSearchUtil(callback_url))
+        self.feature_indexes = OrderedDict()
+        self.feature_index_lock = threading.Lock()
+        self.feature_index_locks = dict()
+
+        cache_size_mb = int(self.config.get('feature-id-cache-size-mb', 512))
+        self.feature_id_cache = FeatureIdCache(
+            os.path.join(self.config['scratch'], 'feature_id_cache'),
+            cache_size_mb * 1024 * 1024)
+
+    def get_expression_level_arrays(self, filepath, genome_ref, id_col=0):
+        """
+         Returns the gene ids of an FPKM tracking file with their FPKM, log2 FPKM,
+         TPM and log2 TPM expression levels as NumPy arrays. TPM levels are read
+         from the file when it has a TPM column (StringTie), else they are
+         computed from the FPKM levels.
+
+        :param filepath: An FPKM tracking file, which may be gzip compressed
+        :return: list of gene ids and a dictionary with the 'fpkm', 'log2_fpkm',
+                 'tpm' and 'log2_tpm' arrays, in the order of the gene ids
+        """
+        feature_index = self._get_feature_index(genome_ref)
+
+        with ExpressionFileReader(filepath) as reader:
+            fpkm_col = reader.column_index('FPKM')
+            if fpkm_col is None:
+                error_msg = 'Unable to find an FPKM column in the specified file: ' + str(filepath)
+                self.logger.error(error_msg)
+                raise ValueError(error_msg)
+            self.logger.info('Using FPKM at col ' + str(fpkm_col) + ' in ' + str(filepath))
+
+            # use the TPM levels computed by the quantifier when there are some
+            tpm_col = reader.column_index('TPM')
+            columns = [id_col, 1, fpkm_col]
+            if tpm_col is not None:
+                self.logger.info('Using {} TPM at col {} in {}'.format(
+                    reader.format or 'precomputed', tpm_col, filepath))
+                columns.append(tpm_col)
+
+            values = reader.columns(columns)
+
+        gene_ids = feature_index.resolve_all(values[0], values[1])
+        fpkm_values = values[2]
+        tpm_values = values[3] if tpm_col is not None else []
+
+        if None in gene_ids:
+            row = gene_ids.index(None)
+            error_msg = 'line {} ({}) does not include known feature'.format(
+                reader.row_line_number(row), values[0][row])
+            raise ValueError(error_msg)
+
+        if "" in gene_ids:
+            rows = [row for row, gene_id in enumerate(gene_ids) if gene_id != ""]
+            gene_ids = [gene_ids[row] for row in rows]
+            fpkm_values = [fpkm_values[row] for row in rows]
+            tpm_values = [tpm_values[row] for row in rows] if tpm_values else []
+
+        fpkm = np.array(fpkm_values, dtype=np.float64)
+
+        if tpm_col is not None:
+            tpm = np.array(tpm_values, dtype=np.float64)
+        else:
+            tpm = calculate_tpm(fpkm)
+            if tpm is None:
+                self.logger.error("Unable to compute TPM values as sum of FPKM values is 0")
+                tpm = np.zeros_like(fpkm)
+
+        levels = {'fpkm': fpkm,
+                  'log2_fpkm': log2_levels(fpkm),
+                  'tpm': tpm,
+                  'log2_tpm': log2_levels(tpm)}
+
+        return gene_ids, levels
 
     def get_expression_levels(self, filepath, genome_ref, id_col=0):
         """
@@ -63,44 +245,10 @@ class ExpressionUtils:
         :param filename: An FPKM tracking file
         :return: fpkm and tpm expression levels as dictionaries
         """
-        fpkm_dict = {}
-        tpm_dict = {}
-
-        # get FPKM col index
-        try:
-            with open(filepath, 'r') as file:
-                header = file.readline()
-                fpkm_col = header.strip().split('\t').index('FPKM')
-                self.logger.info('Using FPKM at col ' + str(fpkm_col) + ' in ' + str(filepath))
-        except:
-            self.logger.error('Unable to find an FPKM column in the specified file: ' + str(filepath))
-
-        feature_ids = self._get_feature_ids(genome_ref)
-
-        sum_fpkm = 0.0
-        with open(filepath) as f:
-            next(f)
-            for line in f:
-                larr = line.split("\t")
-
-                if larr[id_col] in feature_ids:
-                    gene_id = larr[id_col]
-                elif larr[1] in feature_ids:
-                    gene_id = larr[1]
-                else:
-                    error_msg = 'line {} does not include known feature'.format(line)
-                    raise ValueError(error_msg)
-
-                if gene_id != "":
-                    fpkm = float(larr[fpkm_col])
-                    sum_fpkm = sum_fpkm + fpkm
-                    fpkm_dict[gene_id] = math.log(fpkm + 1, 2)
-                    tpm_dict[gene_id] = fpkm
-
-        if sum_fpkm == 0:
-            self.logger.error("Unable to compute TPM values as sum of FPKM values is 0")
-        else:
-            for g in tpm_dict:
-                tpm_dict[g] = math.log((tpm_dict[g] / sum_fpkm) * 1e6 + 1, 2)
+        gene_ids, levels = self.get_expression_level_arrays(filepath, genome_ref, id_col)
+
+        # izip spares building a list of (gene id, level) tuples per dictionary
+        fpkm_dict = dict(izip(gene_ids, levels['log2_fpkm'].tolist()))
+        tpm_dict = dict(izip(gene_ids, levels['log2_tpm'].tolist()))
 
         return fpkm_dict, tpm_dict
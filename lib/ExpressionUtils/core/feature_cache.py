@@ -0,0 +1,95 @@
+import os
+import re
+import json
+import errno
+import uuid
+
+
+class FeatureIdCache:
+    """
+     Size bounded on-disk cache of genome feature ids. Entries are keyed by
+     immutable 'ws/obj/ver' genome references, so they never go stale; the
+     least recently used entries are evicted once the cache grows too large.
+    """
+
+    # bump when the layout of the cache entries changes
+    VERSION = 1
+
+    def __init__(self, cache_dir, max_size_bytes=512 * 1024 * 1024):
+        self.cache_dir = os.path.join(cache_dir, 'v' + str(self.VERSION))
+        self.max_size_bytes = max_size_bytes
+
+    def _get_entry_path(self, genome_ref):
+        """
+        _get_entry_path: returns the cache file of a genome, or None if the
+                         genome ref is not a versioned ws/obj/ver reference
+        """
+        if not re.match(r'^\d+/\d+/\d+$', str(genome_ref)):
+            return None
+        return os.path.join(self.cache_dir, genome_ref.replace('/', '_') + '.json')
+
+    def get(self, genome_ref):
+        """
+        get: returns the cached feature ids of a genome or None on a cache miss
+        """
+        entry_path = self._get_entry_path(genome_ref)
+        if entry_path is None or not os.path.isfile(entry_path):
+            return None
+
+        try:
+            with open(entry_path) as entry_file:
+                entry = json.load(entry_file)
+            # mark the entry as recently used
+            os.utime(entry_path, None)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if entry.get('genome_ref') != genome_ref:
+            return None
+
+        return entry['features']
+
+    def put(self, genome_ref, features):
+        """
+        put: stores the feature ids of a genome and evicts the least recently
+             used entries if the cache exceeds its maximum size
+        """
+        entry_path = self._get_entry_path(genome_ref)
+        if entry_path is None:
+            return
+
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        # write to a temporary file first so readers never see partial entries
+        tmp_path = entry_path + '.' + str(uuid.uuid4()) + '.tmp'
+        with open(tmp_path, 'w') as entry_file:
+            json.dump({'genome_ref': genome_ref, 'features': features}, entry_file)
+        os.rename(tmp_path, entry_path)
+
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith('.json'):
+                continue
+            entry_path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        cache_size = sum(entry[1] for entry in entries)
+        for mtime, size, entry_path in sorted(entries):
+            if cache_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            cache_size -= size
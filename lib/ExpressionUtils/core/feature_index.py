@@ -0,0 +1,57 @@
+from itertools import izip
+
+
+class FeatureIndex:
+    """
+     Hash index over the features of a genome, used to resolve the ids found in
+     expression files to genome feature ids in constant time.
+    """
+
+    def __init__(self, features):
+        """
+        :param features: either an iterable of feature ids, or a mapping from
+                         feature id to a list of its aliases
+        """
+        self._feature_ids = set(features)
+        self._aliases = {}
+
+        if isinstance(features, dict):
+            for feature_id, aliases in features.items():
+                for alias in aliases or []:
+                    # an alias shared by several features stays with the first one
+                    if alias not in self._aliases:
+                        self._aliases[alias] = feature_id
+
+    def __contains__(self, feature_id):
+        return feature_id in self._feature_ids
+
+    def __len__(self):
+        return len(self._feature_ids)
+
+    def resolve(self, feature_id, secondary_id=None):
+        """
+        resolve: returns feature_id, or else secondary_id, if it is a genome
+                 feature id. If neither is, they are looked up as aliases.
+                 Returns None if neither id can be resolved.
+        """
+        if feature_id in self._feature_ids:
+            return feature_id
+        if secondary_id in self._feature_ids:
+            return secondary_id
+
+        resolved_id = self._aliases.get(feature_id)
+        if resolved_id is None and secondary_id is not None:
+            resolved_id = self._aliases.get(secondary_id)
+
+        return resolved_id
+
+    def resolve_all(self, feature_ids, secondary_ids):
+        """
+        resolve_all: resolves each pair of the given feature ids and secondary
+                     ids, as resolve() does, and returns the list of results
+        """
+        # most ids are genome feature ids, which are kept without a call
+        known_ids = self._feature_ids
+        resolve = self.resolve
+        return [feature_id if feature_id in known_ids else resolve(feature_id, secondary_id)
+                for feature_id, secondary_id in izip(feature_ids, secondary_ids)]
@@ -0,0 +1,345 @@
+import os
+import sys
+import json
+import zlib
+import random
+import threading
+import requests
+from multiprocessing.pool import ThreadPool
+
+from job_poller import wait_job
+
+# faster JSON backend for large payloads, see json_dumps and json_loads.
+# ujson releases before 2.0 round floats, so they are not used.
+try:
+    import ujson as _ujson
+    if int(_ujson.__version__.split('.')[0]) < 2:
+        _ujson = None
+except ImportError:
+    _ujson = None
+
+_CT = 'content-type'
+_AJ = 'application/json'
+
+# HTTP connection pool shared by the clients of the process, see
+# configure_session. Defaults can be set with the KB_CLIENT_POOL_SIZE,
+# KB_CLIENT_KEEP_ALIVE, KB_CLIENT_STREAM_REQUESTS and
+# KB_CLIENT_COMPRESS_MIN_BYTES environment variables.
+_session = None
+_session_lock = threading.Lock()
+_session_config = {
+    'pool_size': int(os.environ.get('KB_CLIENT_POOL_SIZE', 10)),
+    'keep_alive': os.environ.get('KB_CLIENT_KEEP_ALIVE', 'true').lower() != 'false',
+    'stream_requests': os.environ.get('KB_CLIENT_STREAM_REQUESTS', 'false').lower() == 'true',
+    'compress_min_bytes': int(os.environ.get('KB_CLIENT_COMPRESS_MIN_BYTES', 0))
+}
+# gzip level of compressed request bodies; JSON payloads compress nearly as
+# well at level 1 as at the default level 6, several times faster
+GZIP_LEVEL = 1
+# size of the chunks of streamed request bodies
+STREAM_CHUNK_SIZE = 1 << 16
+
+# urls of the servers that cannot run batch requests, see call_methods
+_no_batch_urls = set()
+# thread pool of the calls made concurrently, see call_methods
+_call_pool = None
+
+# session client classes by the generated BaseClient class they extend
+_session_classes = dict()
+
+
+def configure_session(pool_size=None, keep_alive=None, stream_requests=None,
+                      compress_min_bytes=None):
+    """
+    configure_session: configures the HTTP connection pool shared by the
+                       clients of use_session. The pool is replaced on the
+                       next call.
+
+    :param pool_size: Optional - the maximum number of connections kept open
+                      per host
+    :param keep_alive: Optional - False to close the connection after each call
+    :param stream_requests: Optional - True to serialize request bodies while
+                            they are sent, with chunked transfer encoding,
+                            instead of serializing them in memory first.
+                            Serializing is slower, but the JSON of large
+                            parameters is never held whole. The servers
+                            called must accept chunked requests.
+    :param compress_min_bytes: Optional - gzip the request bodies of at least
+                               this many bytes, sent with Content-Encoding:
+                               gzip; 0 turns compression off. The servers
+                               called must accept gzipped requests. Streamed
+                               requests are not compressed.
+    """
+    global _session, _call_pool
+    with _session_lock:
+        if pool_size is not None:
+            if int(pool_size) < 1:
+                raise ValueError('Pool size must be at least 1')
+            _session_config['pool_size'] = int(pool_size)
+        if keep_alive is not None:
+            _session_config['keep_alive'] = bool(keep_alive)
+        if stream_requests is not None:
+            _session_config['stream_requests'] = bool(stream_requests)
+        if compress_min_bytes is not None:
+            if int(compress_min_bytes) < 0:
+                raise ValueError('Compression threshold must not be negative')
+            _session_config['compress_min_bytes'] = int(compress_min_bytes)
+        _session = None
+        if _call_pool is not None:
+            # the calls already queued still run
+            _call_pool.close()
+            _call_pool = None
+
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=_session_config['pool_size'],
+                pool_maxsize=_session_config['pool_size'])
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if not _session_config['keep_alive']:
+                session.headers['Connection'] = 'close'
+            _session = session
+        return _session
+
+
+def _get_call_pool():
+    global _call_pool
+    with _session_lock:
+        if _call_pool is None:
+            _call_pool = ThreadPool(_session_config['pool_size'])
+        return _call_pool
+
+
+class _JSONObjectEncoder(json.JSONEncoder):
+
+    def default(self, obj):
+        if isinstance(obj, (set, frozenset)):
+            return list(obj)
+        return json.JSONEncoder.default(self, obj)
+
+
+def json_dumps(obj, cls=_JSONObjectEncoder):
+    """
+    json_dumps: serializes obj to a JSON string, with ujson when it is
+                installed. Values ujson cannot serialize, e.g. sets, NaN or
+                integers over 64 bits, are serialized by the standard
+                library with the encoder cls.
+    """
+    if _ujson is not None:
+        try:
+            return _ujson.dumps(obj, escape_forward_slashes=False)
+        except (TypeError, OverflowError, ValueError):
+            pass
+    return json.dumps(obj, cls=cls)
+
+
+def json_loads(s):
+    """
+    json_loads: deserializes a JSON string, with ujson when it is installed.
+                Strings ujson cannot deserialize, e.g. with NaN or integers
+                over 64 bits, are deserialized by the standard library.
+    """
+    if _ujson is not None:
+        try:
+            return _ujson.loads(s)
+        except ValueError:
+            pass
+    return json.loads(s)
+
+
+def _gzip(data):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _iter_json(obj):
+    # serializes obj incrementally, in chunks of about STREAM_CHUNK_SIZE bytes
+    chunks, size = [], 0
+    for chunk in _JSONObjectEncoder().iterencode(obj):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunks).encode('utf-8')
+            chunks, size = [], 0
+    if chunks:
+        yield ''.join(chunks).encode('utf-8')
+
+
+def _arg_hash(method, params, context=None):
+    arg_hash = {'method': method,
+                'params': params,
+                'version': '1.1',
+                'id': str(random.random())[2:]
+                }
+    if context:
+        if type(context) is not dict:
+            raise ValueError('context is not type dict as required.')
+        arg_hash['context'] = context
+    return arg_hash
+
+
+class _SessionClient(object):
+    """
+     Mixed into the BaseClient class of a generated client package by
+     use_session, in place of its _call and _check_job. It raises the
+     ServerError of that package, _server_error.
+    """
+
+    def _post(self, url, arg_hash):
+        headers = self._headers
+        if _session_config['stream_requests']:
+            body = _iter_json(arg_hash)
+        else:
+            body = json_dumps(arg_hash).encode('utf-8')
+            compress_min_bytes = _session_config['compress_min_bytes']
+            if compress_min_bytes and len(body) >= compress_min_bytes:
+                body = _gzip(body)
+                headers = dict(headers)
+                headers['Content-Encoding'] = 'gzip'
+        ret = _get_session().post(url, data=body, headers=headers,
+                                  timeout=self.timeout,
+                                  verify=not self.trust_all_ssl_certificates)
+        ret.encoding = 'utf-8'
+        return ret
+
+    def _unpack_result(self, resp):
+        if 'result' not in resp:
+            raise self._server_error('Unknown', 0, 'An unknown server error occurred')
+        if not resp['result']:
+            return
+        if len(resp['result']) == 1:
+            return resp['result'][0]
+        return resp['result']
+
+    def _call(self, url, method, params, context=None):
+        ret = self._post(url, _arg_hash(method, params, context))
+        if ret.status_code == 500:
+            if ret.headers.get(_CT) == _AJ:
+                err = json_loads(ret.content)
+                if 'error' in err:
+                    raise self._server_error(**err['error'])
+                else:
+                    raise self._server_error('Unknown', 0, ret.text)
+            else:
+                raise self._server_error('Unknown', 0, ret.text)
+        if not ret.ok:
+            ret.raise_for_status()
+        return self._unpack_result(json_loads(ret.content))
+
+    def _call_batch(self, url, calls, context=None):
+        # returns None if the server cannot run the batch request
+        arg_hashes = [_arg_hash(method, params, context) for method, params in calls]
+        ids = set()
+        for arg_hash in arg_hashes:
+            while arg_hash['id'] in ids:
+                arg_hash['id'] = str(random.random())[2:]
+            ids.add(arg_hash['id'])
+
+        ret = self._post(url, arg_hashes)
+        try:
+            resps = json_loads(ret.content)
+        except ValueError:
+            resps = None
+        # servers that cannot run batches answer them with an error status,
+        # e.g. a JSON-RPC parse or invalid request error, or the error page of
+        # a request handler that failed on the list, before running any call
+        if not ret.ok or type(resps) is not list:
+            return None
+        # some of the calls may have run, so they are not made again
+        if len(resps) != len(arg_hashes):
+            raise self._server_error(
+                'Unknown', 0, 'The server answered {} calls with {} responses'.format(
+                    len(arg_hashes), len(resps)))
+        resps = dict((resp.get('id'), resp) for resp in resps if type(resp) is dict)
+        if set(resps) != ids:
+            raise self._server_error(
+                'Unknown', 0, 'The ids of the responses do not match the ids of the calls')
+
+        results = []
+        for arg_hash in arg_hashes:
+            resp = resps[arg_hash['id']]
+            if resp.get('error'):
+                raise self._server_error(**resp['error'])
+            results.append(self._unpack_result(resp))
+        return results
+
+    def _call_concurrently(self, url, calls, context=None):
+        if len(calls) == 1:
+            method, params = calls[0]
+            return [self._call(url, method, params, context)]
+        pool = _get_call_pool()
+        async_results = [pool.apply_async(self._call, (url, method, params, context))
+                         for method, params in calls]
+        # raise the error of the first failing call, as _call_batch does
+        return [async_result.get() for async_result in async_results]
+
+    def _call_methods(self, url, calls, context=None):
+        if len(calls) > 1 and url not in _no_batch_urls:
+            results = self._call_batch(url, calls, context)
+            if results is not None:
+                return results
+            _no_batch_urls.add(url)
+        return self._call_concurrently(url, calls, context)
+
+    def call_methods(self, calls, service_ver=None, context=None):
+        """
+        Call several methods of a standard or dynamic service synchronously,
+        returning their results in the order of the calls.
+        Required arguments:
+        calls - a list of (service_method, args) pairs, e.g.
+            [('myserv.mymeth', [arg1]), ('myserv.othermeth', [arg2])].
+        Optional arguments:
+        service_ver - the version of the service to run, e.g. a git hash
+            or dev/beta/release.
+        context - the rpc context dict.
+        The calls are sent as one JSON-RPC batch request. If the server
+        answers it with an error status or without a list of responses, the
+        calls are made concurrently instead, as are all the later calls to
+        that server. If any of the calls fails, the ServerError of the first
+        one is raised.
+        """
+        calls = [(service_method, args) for service_method, args in calls]
+        if not calls:
+            return []
+        services = set(service_method.split('.')[0] for service_method, _ in calls)
+        if len(services) > 1:
+            raise ValueError('All the calls must be to the same service')
+        url = self._get_service_url(calls[0][0], service_ver)
+        context = self._set_up_context(service_ver, context)
+        return self._call_methods(url, calls, context)
+
+    def _check_job_now(self, service, job_id):
+        return self._call(self.url, service + '._check_job', [job_id])
+
+    def _check_job(self, service, job_id):
+        # the generated clients check a job in a loop until it is finished;
+        # this check returns once the job poller has seen it finish
+        return wait_job(self, service, job_id)
+
+
+def use_session(client):
+    """
+    use_session: makes a generated KBase client, e.g. a DataFileUtil or
+                 Workspace instance, call its service through the session
+                 shared by the clients of the process and wait for its jobs
+                 with the shared job poller (see job_poller), and adds
+                 call_methods to its base client; returns the client
+    """
+    base_client = client._client
+    base_class = type(base_client)
+    if not issubclass(base_class, _SessionClient):
+        with _session_lock:
+            session_class = _session_classes.get(base_class)
+            if session_class is None:
+                server_error = sys.modules[base_class.__module__].ServerError
+                session_class = type('Session' + base_class.__name__,
+                                     (_SessionClient, base_class),
+                                     {'_server_error': server_error})
+                _session_classes[base_class] = session_class
+        base_client.__class__ = session_class
+    return client
@@ -0,0 +1,180 @@
+import os
+import time
+import heapq
+import threading
+
+# asynchronous jobs are checked at least every JOB_CHECK_ELAPSED_PERCENT
+# percent of the time they have been running, so that the result of a job is
+# collected at most that much later than the job finished. Can be set with
+# the KB_JOB_CHECK_ELAPSED_PERCENT environment variable.
+JOB_CHECK_ELAPSED_PERCENT = float(os.environ.get('KB_JOB_CHECK_ELAPSED_PERCENT', 10))
+
+
+class _JobWait:
+
+    def __init__(self, client, service, job_id):
+        self.client = client
+        self.service = service
+        self.job_id = job_id
+        self.start = time.time()
+        self.interval = client.async_job_check_time
+        self.next_check = self.start + self.interval
+        self.checks = 0
+        self.job_state = None
+        self.error = None
+        self.done = threading.Event()
+
+    def reschedule(self, now):
+        # back off as configured in the client, but never longer than a
+        # fraction of the time elapsed since the job was submitted
+        self.interval = min(
+            self.interval * self.client.async_job_check_time_scale_percent / 100.0,
+            max(self.client.async_job_check_time,
+                (now - self.start) * JOB_CHECK_ELAPSED_PERCENT / 100.0),
+            self.client.async_job_check_max_time)
+        self.next_check = now + self.interval
+
+
+class JobPoller:
+    """
+     Waits for asynchronous jobs from one thread. The jobs due for a check
+     are checked together, in a batch request per url, token and service.
+     Clients are the base clients of use_session (see http_session), which
+     check a single job with _check_job_now and a batch with _call_methods.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._waits = []
+        self._count = 0
+        self._thread = None
+        self.stats = {'jobs': 0, 'checks': 0, 'wait_time': 0.0,
+                      'max_wait_time': 0.0, 'idle_time_bound': 0.0}
+
+    def wait(self, client, service, job_id):
+        """
+        wait: waits for a job and returns its final job state, or raises the
+              error of checking it
+        """
+        wait = _JobWait(client, service, job_id)
+        with self._cond:
+            self._push(wait)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='JobPoller')
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+        wait.done.wait()
+        if wait.error is not None:
+            raise wait.error
+        return wait.job_state
+
+    def _push(self, wait):
+        self._count += 1
+        heapq.heappush(self._waits, (wait.next_check, self._count, wait))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._waits or self._waits[0][0] > time.time():
+                    if self._waits:
+                        self._cond.wait(self._waits[0][0] - time.time())
+                    else:
+                        self._cond.wait()
+                now = time.time()
+                due = []
+                while self._waits and self._waits[0][0] <= now:
+                    due.append(heapq.heappop(self._waits)[2])
+
+            groups = dict()
+            for wait in due:
+                key = (wait.client.url, wait.client._headers.get('AUTHORIZATION'),
+                       wait.service)
+                groups.setdefault(key, []).append(wait)
+            for waits in groups.values():
+                try:
+                    self._check(waits)
+                except Exception as e:
+                    # the waits would never be checked again
+                    self._fail(waits, e)
+
+    def _check(self, waits):
+        client = waits[0].client
+        try:
+            if len(waits) == 1:
+                job_states = [client._check_job_now(waits[0].service, waits[0].job_id)]
+            else:
+                job_states = client._call_methods(
+                    client.url, [(wait.service + '._check_job', [wait.job_id])
+                                 for wait in waits])
+                if type(job_states) is not list or len(job_states) != len(waits):
+                    raise client._server_error(
+                        'Unknown', 0, 'Invalid job states: {}'.format(job_states))
+        except Exception as e:
+            if len(waits) == 1:
+                job_states = [e]
+            else:
+                # check the jobs one by one to tell which of them failed, if
+                # any did and not the batch itself
+                for wait in waits:
+                    self._check([wait])
+                return
+
+        now = time.time()
+        with self._cond:
+            for wait, job_state in zip(waits, job_states):
+                wait.checks += 1
+                self.stats['checks'] += 1
+                if isinstance(job_state, Exception):
+                    wait.error = job_state
+                elif type(job_state) is not dict or 'finished' not in job_state:
+                    wait.error = client._server_error(
+                        'Unknown', 0, 'Invalid state of job {}: {}'.format(wait.job_id, job_state))
+                elif not job_state['finished']:
+                    wait.reschedule(now)
+                    self._push(wait)
+                    continue
+                else:
+                    wait.job_state = job_state
+                wait_time = now - wait.start
+                self.stats['jobs'] += 1
+                self.stats['wait_time'] += wait_time
+                self.stats['max_wait_time'] = max(self.stats['max_wait_time'], wait_time)
+                self.stats['idle_time_bound'] += wait.interval
+                wait.done.set()
+
+    def _fail(self, waits, error):
+        with self._cond:
+            waits = [wait for wait in waits if not wait.done.is_set()]
+            self._waits = [item for item in self._waits if item[2] not in waits]
+            heapq.heapify(self._waits)
+            for wait in waits:
+                wait.error = error
+                wait.done.set()
+
+
+_job_poller = JobPoller()
+
+
+def wait_job(client, service, job_id):
+    """
+    wait_job: waits for a job with the poller shared by the clients of the
+              process, see JobPoller.wait
+    """
+    return _job_poller.wait(client, service, job_id)
+
+
+def job_wait_stats():
+    """
+    job_wait_stats: returns statistics of the asynchronous jobs waited for by
+                    the clients:
+        jobs - the number of jobs waited for
+        checks - the number of job state checks made
+        wait_time - the total time spent waiting for the jobs, in seconds
+        max_wait_time - the longest time spent waiting for a job, in seconds
+        idle_time_bound - the total time between the last two checks of each
+                          job, an upper bound of the time that finished jobs
+                          waited for their results to be collected, in seconds
+    """
+    with _job_poller._cond:
+        return dict(_job_poller.stats)
@@ -0,0 +1,127 @@
+import numpy as np
+
+from operator import itemgetter
+
+
+class MatrixBuilder:
+    """
+     Assembles the row_ids and values of a KBaseFeatureValues matrix from one
+     {row_id: value} table per column. Rows and columns are given integer
+     indexes and the values are written into a preallocated NumPy array, one
+     vectorized assignment per column. Rows are sorted by id, so the same
+     tables always produce the same matrix.
+
+     Several matrices over the same rows and columns, e.g. the FPKM and TPM
+     levels of an expression set, can be built as named layers that share
+     the row index.
+
+     Memory use is one float64 per cell and layer: 60,000 genes x 1,000 samples take
+     60000 * 1000 * 8 bytes = 480 MB for the array. get_values() converts it
+     to the nested lists stored in the workspace object, which take about
+     32 bytes per cell (Python float plus list slot), i.e. about 1.9 GB more
+     for the same matrix.
+    """
+
+    # the layer of single layer matrices
+    VALUES = 'values'
+
+    def __init__(self, row_ids, col_count, fill_value=0.0, layers=(VALUES,)):
+        """
+        :param row_ids: the row ids, in matrix order
+        :param col_count: the number of columns of the matrix
+        :param fill_value: the value of the cells missing from the tables
+        :param layers: the names of the layers of the matrix
+        """
+        self.row_ids = list(row_ids)
+        self.row_index = dict((row_id, i) for i, row_id in enumerate(self.row_ids))
+        # column major, as the matrix is filled one column at a time
+        self.layers = dict((layer, np.full((len(self.row_ids), col_count), fill_value,
+                                           dtype=np.float64, order='F'))
+                           for layer in layers)
+        self._last_keys = None
+        self._last_rows = None
+
+    @classmethod
+    def from_tables(cls, tables, fill_value=0.0):
+        """
+        from_tables: builds a matrix with a column per table and a row for each
+                     row id found in any of the tables
+        """
+        return cls.from_layers({cls.VALUES: tables}, fill_value)
+
+    @classmethod
+    def from_layers(cls, layer_tables, fill_value=0.0, row_ids=()):
+        """
+        from_layers: builds a matrix with a layer per list of tables, sharing
+                     a row for each row id found in any table of any layer.
+                     Column i of each layer is built from the i-th table of
+                     its list; None tables leave their column filled.
+
+        :param layer_tables: a dictionary mapping each layer name to its tables,
+                             all the lists having the same length
+        :param row_ids: more row ids to include, e.g. those of the columns later
+                        copied with set_columns
+        """
+        col_counts = set(len(tables) for tables in layer_tables.values())
+        if len(col_counts) > 1:
+            raise ValueError('all layers must have the same number of tables')
+
+        row_ids = set(row_ids)
+        last_keys = None
+        for tables in layer_tables.values():
+            for table in tables:
+                keys = list(table or [])
+                # the tables of a set mostly list the same ids in the same order
+                if keys != last_keys:
+                    row_ids.update(keys)
+                    last_keys = keys
+
+        matrix = cls(sorted(row_ids), col_counts.pop() if col_counts else 0,
+                     fill_value, list(layer_tables))
+        for layer, tables in layer_tables.items():
+            for col, table in enumerate(tables):
+                matrix.set_column(col, table, layer)
+
+        return matrix
+
+    def set_column(self, col, table, layer=VALUES):
+        """
+        set_column: fills a column of a layer with the values of a
+                    {row_id: value} table
+        """
+        if not table:
+            return
+
+        # reuse the row positions of the previous table when it has the same keys
+        keys = list(table)
+        if keys == self._last_keys:
+            rows = self._last_rows
+        elif len(keys) == 1:
+            rows = [self.row_index[keys[0]]]
+        else:
+            rows = np.fromiter(itemgetter(*keys)(self.row_index), np.intp, len(keys))
+        self._last_keys, self._last_rows = keys, rows
+
+        # keys() and values() of an unmodified dict come in the same order
+        self.layers[layer][rows, col] = np.fromiter(table.values(), np.float64, len(table))
+
+    def set_columns(self, cols, row_ids, values, layer=VALUES):
+        """
+        set_columns: fills columns of a layer with the values of another
+                     matrix, given as its row ids and a 2D array with a row per
+                     row id and a column per column to fill
+        """
+        if not len(row_ids) or not len(cols):
+            return
+
+        if len(row_ids) == 1:
+            rows = [self.row_index[row_ids[0]]]
+        else:
+            rows = np.fromiter(itemgetter(*row_ids)(self.row_index), np.intp, len(row_ids))
+        self.layers[layer][np.ix_(rows, cols)] = values
+
+    def get_values(self, layer=VALUES):
+        """
+        get_values: returns the values of a layer as a list of rows
+        """
+        return self.layers[layer].tolist()
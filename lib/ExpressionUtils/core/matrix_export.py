@@ -0,0 +1,130 @@
+import os
+import json
+
+import numpy as np
+
+# file layout of exported matrices, see write_matrix_tiles
+MANIFEST_FILE = 'manifest.json'
+ROW_IDS_FILE = 'row_ids.json'
+COL_IDS_FILE = 'col_ids.json'
+TILE_FORMAT = 'kbase-matrix-tiles'
+TILE_FORMAT_VERSION = 1
+
+
+def _tile_file_name(row_block, col_block):
+    return 'tile_r{0}_c{1}.npy'.format(row_block, col_block)
+
+
+def write_matrix_tiles(output_dir, row_ids, col_ids, values,
+                       row_block_size=4096, col_block_size=64, attributes=None):
+    """
+    write_matrix_tiles: writes a matrix to output_dir as a grid of tiles of
+                        row_block_size rows x col_block_size columns, each an
+                        uncompressed float64 .npy file in column major order,
+                        so that a sample is contiguous within its tile.
+
+    The matrix is converted to NumPy one block of rows at a time, so only a
+    block is held as an array on top of the input values. Row and column ids
+    go to row_ids.json and col_ids.json, and manifest.json lists the shape,
+    block sizes, tiles and the given attributes.
+
+    :param values: the matrix as a list of rows, as stored in KBaseFeatureValues
+                   matrices
+    :return: the manifest
+    """
+    if len(values) != len(row_ids):
+        raise ValueError('the matrix has {0} rows but {1} row ids'.format(
+            len(values), len(row_ids)))
+    if row_block_size < 1 or col_block_size < 1:
+        raise ValueError('block sizes must be at least 1')
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    tiles = []
+    for row_start in range(0, len(row_ids), row_block_size):
+        row_end = min(row_start + row_block_size, len(row_ids))
+        row_block = np.array(values[row_start:row_end], dtype=np.float64)
+        if row_block.shape != (row_end - row_start, len(col_ids)):
+            raise ValueError('rows {0} to {1} do not have {2} values'.format(
+                row_start, row_end - 1, len(col_ids)))
+
+        for col_start in range(0, len(col_ids), col_block_size):
+            col_end = min(col_start + col_block_size, len(col_ids))
+            tile_file = _tile_file_name(row_start // row_block_size,
+                                        col_start // col_block_size)
+            np.save(os.path.join(output_dir, tile_file),
+                    np.asfortranarray(row_block[:, col_start:col_end]))
+            tiles.append({'file': tile_file,
+                          'rows': [row_start, row_end],
+                          'cols': [col_start, col_end]})
+
+    for ids_file, ids in [(ROW_IDS_FILE, row_ids), (COL_IDS_FILE, col_ids)]:
+        with open(os.path.join(output_dir, ids_file), 'w') as ids_out:
+            json.dump(list(ids), ids_out)
+
+    manifest = {'format': TILE_FORMAT,
+                'version': TILE_FORMAT_VERSION,
+                'dtype': np.dtype(np.float64).str,
+                'shape': [len(row_ids), len(col_ids)],
+                'row_block_size': row_block_size,
+                'col_block_size': col_block_size,
+                'row_ids_file': ROW_IDS_FILE,
+                'col_ids_file': COL_IDS_FILE,
+                'tiles': tiles,
+                'attributes': attributes or {}}
+    with open(os.path.join(output_dir, MANIFEST_FILE), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+
+    return manifest
+
+
+class MatrixTileReader:
+    """
+     Reads single rows or columns of a matrix written by write_matrix_tiles,
+     memory mapping only the tiles they go through.
+    """
+
+    def __init__(self, tiles_dir):
+        self.tiles_dir = tiles_dir
+        with open(os.path.join(tiles_dir, MANIFEST_FILE)) as manifest_file:
+            self.manifest = json.load(manifest_file)
+        if self.manifest.get('format') != TILE_FORMAT:
+            raise ValueError('{0} is not an exported matrix'.format(tiles_dir))
+
+        self.row_ids = self._read_ids(self.manifest['row_ids_file'])
+        self.col_ids = self._read_ids(self.manifest['col_ids_file'])
+        self.row_index = dict((row_id, i) for i, row_id in enumerate(self.row_ids))
+        self.col_index = dict((col_id, i) for i, col_id in enumerate(self.col_ids))
+
+    def _read_ids(self, ids_file):
+        with open(os.path.join(self.tiles_dir, ids_file)) as ids_in:
+            return json.load(ids_in)
+
+    def _load_tile(self, row_block, col_block):
+        return np.load(os.path.join(self.tiles_dir, _tile_file_name(row_block, col_block)),
+                       mmap_mode='r')
+
+    def get_row(self, row_id):
+        """
+        get_row: returns the values of a row (gene) across all the columns
+        """
+        row = self.row_index[row_id]
+        row_block_size = self.manifest['row_block_size']
+        col_block_count = -(-len(self.col_ids) // self.manifest['col_block_size'])
+
+        return np.concatenate(
+            [self._load_tile(row // row_block_size, col_block)[row % row_block_size]
+             for col_block in range(col_block_count)] or [np.zeros(0)])
+
+    def get_column(self, col_id):
+        """
+        get_column: returns the values of a column (sample) across all the rows
+        """
+        col = self.col_index[col_id]
+        col_block_size = self.manifest['col_block_size']
+        row_block_count = -(-len(self.row_ids) // self.manifest['row_block_size'])
+
+        return np.concatenate(
+            [self._load_tile(row_block, col // col_block_size)[:, col % col_block_size]
+             for row_block in range(row_block_count)] or [np.zeros(0)])
@@ -0,0 +1,132 @@
+import threading
+
+
+class WorkspaceObjectCache:
+    """
+     Memo of the workspace objects and object infos fetched while serving a
+     request, keyed by the references they were requested with, so that each
+     object is fetched from the workspace at most once. Objects fetched in full
+     also serve later requests for their top level fields.
+    """
+
+    def __init__(self, ws_client):
+        self.ws_client = ws_client
+        self._objects = dict()
+        self._infos = dict()
+        self._lock = threading.Lock()
+
+    def _lookup_object(self, ref, included):
+        obj = self._objects.get((ref, included))
+        if obj is not None or included is None:
+            return obj
+
+        full_obj = self._objects.get((ref, None))
+        if full_obj is None:
+            return None
+
+        fields = [path.strip('/') for path in included]
+        if any('/' in field for field in fields):
+            return None
+
+        return {'info': full_obj['info'],
+                'data': dict((field, full_obj['data'][field])
+                             for field in fields if field in full_obj['data'])}
+
+    def get_objects(self, refs, included=None):
+        """
+        get_objects: returns the objects of refs in order, fetching the ones
+                     not in the cache in a single get_objects2 call
+
+        :param included: Optional - the paths of the objects to fetch
+        """
+        included = tuple(included) if included else None
+
+        with self._lock:
+            missing_refs = list()
+            for ref in refs:
+                if ref not in missing_refs and self._lookup_object(ref, included) is None:
+                    missing_refs.append(ref)
+
+        if missing_refs:
+            object_specs = [{'ref': ref} for ref in missing_refs]
+            if included:
+                for object_spec in object_specs:
+                    object_spec['included'] = list(included)
+
+            objs = self.ws_client.get_objects2({'objects': object_specs})['data']
+
+            with self._lock:
+                for ref, obj in zip(missing_refs, objs):
+                    self._objects[(ref, included)] = obj
+                    self._infos.setdefault(ref, obj['info'])
+
+        with self._lock:
+            return [self._lookup_object(ref, included) for ref in refs]
+
+    def get_object_infos(self, refs):
+        """
+        get_object_infos: returns the object infos of refs in order, with their
+                          metadata, fetching the ones not in the cache in a
+                          single get_object_info3 call
+        """
+        with self._lock:
+            missing_refs = list()
+            for ref in refs:
+                if ref not in missing_refs and ref not in self._infos:
+                    missing_refs.append(ref)
+
+        if missing_refs:
+            infos = self.ws_client.get_object_info3(
+                {'objects': [{'ref': ref} for ref in missing_refs],
+                 'includeMetadata': 1})['infos']
+
+            with self._lock:
+                for ref, info in zip(missing_refs, infos):
+                    self._infos[ref] = info
+
+        with self._lock:
+            return [self._infos[ref] for ref in refs]
+
+    def prefetch(self, object_refs=(), info_refs=(), ws_calls=()):
+        """
+        prefetch: fetches the objects (in full) and object infos not in the
+                  cache along with the other workspace calls ws_calls, all in
+                  one batch request; returns the results of ws_calls
+
+        :param ws_calls: (method, params) pairs of workspace calls, e.g.
+                         ('get_workspace_info', {'workspace': 'my_ws'})
+        """
+        with self._lock:
+            missing_refs = list()
+            for ref in object_refs:
+                if ref not in missing_refs and self._lookup_object(ref, None) is None:
+                    missing_refs.append(ref)
+            missing_info_refs = list()
+            for ref in info_refs:
+                if ref not in missing_info_refs and ref not in self._infos:
+                    missing_info_refs.append(ref)
+
+        calls = [('Workspace.' + method, [params]) for method, params in ws_calls]
+        if missing_refs:
+            calls.append(('Workspace.get_objects2',
+                          [{'objects': [{'ref': ref} for ref in missing_refs]}]))
+        if missing_info_refs:
+            calls.append(('Workspace.get_object_info3',
+                          [{'objects': [{'ref': ref} for ref in missing_info_refs],
+                            'includeMetadata': 1}]))
+        if not calls:
+            return []
+
+        results = self.ws_client._client.call_methods(calls, self.ws_client._service_ver)
+
+        with self._lock:
+            results = list(results)
+            if missing_info_refs:
+                for ref, info in zip(missing_info_refs, results.pop()['infos']):
+                    self._infos[ref] = info
+            if missing_refs:
+                for ref, obj in zip(missing_refs, results.pop()['data']):
+                    self._objects[(ref, None)] = obj
+                    self._infos.setdefault(ref, obj['info'])
+
+        return results
@@ -0,0 +1,88 @@
+import sys
+import time
+import Queue
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+
+class Pipeline:
+    """
+     Runs named stages, each a function of the results of the stages it
+     depends on. A stage starts as soon as all of its dependencies are done,
+     so stages that do not depend on each other run concurrently, each on a
+     thread of its own. The wall clock time of each stage, in seconds, is kept
+     in timings.
+    """
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.timings = OrderedDict()
+
+    def add_stage(self, name, func, depends_on=()):
+        """
+        add_stage: adds a stage calling func with the results of the stages
+                   of depends_on, in that order. Dependencies must be added
+                   before the stages depending on them.
+        """
+        if name in self.stages:
+            raise ValueError('stage {0} is already in the pipeline'.format(name))
+        for dependency in depends_on:
+            if dependency not in self.stages:
+                raise ValueError('stage {0} depends on unknown stage {1}'.format(
+                    name, dependency))
+
+        self.stages[name] = (func, tuple(depends_on))
+
+    def _run_stage(self, name, func, args, done):
+        start = time.time()
+        try:
+            result = func(*args)
+        except Exception:
+            self.timings[name] = time.time() - start
+            done.put((name, None, sys.exc_info()))
+        else:
+            self.timings[name] = time.time() - start
+            done.put((name, result, None))
+
+    def run(self):
+        """
+        run: runs the stages and returns a dictionary of their results. Once a
+             stage fails no other stage is started, and when the running
+             stages are done the error of the failed stage added first is
+             raised.
+        """
+        results = dict()
+        pending = OrderedDict(self.stages)
+        done = Queue.Queue()
+        running = 0
+        errors = dict()
+
+        pool = ThreadPool(max(len(self.stages), 1))
+        try:
+            while True:
+                if not errors:
+                    for name, (func, depends_on) in list(pending.items()):
+                        if all(dependency in results for dependency in depends_on):
+                            del pending[name]
+                            running += 1
+                            pool.apply_async(self._run_stage, (
+                                name, func, [results[dependency] for dependency in depends_on],
+                                done))
+                if not running:
+                    break
+
+                name, result, stage_exc_info = done.get()
+                running -= 1
+                if stage_exc_info is None:
+                    results[name] = result
+                else:
+                    errors[name] = stage_exc_info
+        finally:
+            pool.close()
+
+        for name in self.stages:
+            if name in errors:
+                exc_info = errors[name]
+                raise exc_info[0], exc_info[1], exc_info[2]
+
+        return results
@@ -0,0 +1,150 @@
+import json
+import zlib
+from StringIO import StringIO
+
+from http_session import GZIP_LEVEL, json_dumps, json_loads
+
+# deploy.cfg key of the size of the smallest response gzipped for the clients
+# accepting it; 0, the default, turns response compression off
+COMPRESS_MIN_BYTES = 'rpc-compress-min-bytes'
+
+
+def _error_response(start_response, code, name, message):
+    """
+    _error_response: answers a request with a JSON-RPC error, as the
+                     generated server answers the requests it cannot parse
+    """
+    response_body = json.dumps({'version': '1.1',
+                                'error': {'code': code,
+                                          'name': name,
+                                          'message': message,
+                                          'error': None}})
+    start_response('500 Internal Server Error',
+                   [('Access-Control-Allow-Origin', '*'),
+                    ('content-type', 'application/json'),
+                    ('content-length', str(len(response_body)))])
+    return [response_body]
+
+
+class RPCMiddleware(object):
+    """
+     WSGI middleware around the application of the generated
+     ExpressionUtilsServer, which `make compile` regenerates, see wsgi.py.
+     It inflates the requests sent with Content-Encoding: gzip, answers the
+     requests whose body is not a JSON object, e.g. batch requests, with a
+     JSON-RPC -32600 error, and gzips the responses of at least
+     compress_min_bytes for the clients accepting gzip.
+    """
+
+    def __init__(self, application, compress_min_bytes=0):
+        """
+        :param application: the WSGI application to wrap
+        :param compress_min_bytes: Optional - size of the smallest response
+                                   gzipped, 0 to leave responses uncompressed
+        """
+        self.application = application
+        self.compress_min_bytes = compress_min_bytes
+
+    def _read_request(self, environ, start_response):
+        """
+        _read_request: replaces the body of a request with its inflated body,
+                       returning None, or returns an error response
+        """
+        try:
+            body_size = int(environ.get('CONTENT_LENGTH', 0))
+        except ValueError:
+            body_size = 0
+        request_body = environ['wsgi.input'].read(body_size)
+
+        if environ.get('HTTP_CONTENT_ENCODING', '').lower() == 'gzip':
+            try:
+                request_body = zlib.decompress(request_body, 16 + zlib.MAX_WBITS)
+            except zlib.error as e:
+                return _error_response(start_response, -32700, 'Parse error', str(e))
+            del environ['HTTP_CONTENT_ENCODING']
+
+        # only bodies not starting as an object are parsed here; the server
+        # answers the ones that are not JSON
+        if request_body.lstrip()[:1] != '{':
+            try:
+                req = json_loads(request_body)
+            except ValueError:
+                pass
+            else:
+                return _error_response(start_response, -32600, 'Invalid Request',
+                                       'the request is not a JSON object: ' +
+                                       type(req).__name__)
+
+        environ['wsgi.input'] = StringIO(request_body)
+        environ['CONTENT_LENGTH'] = str(len(request_body))
+        return None
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] != 'OPTIONS':
+            error_response = self._read_request(environ, start_response)
+            if error_response is not None:
+                return error_response
+
+        if not self.compress_min_bytes:
+            return self.application(environ, start_response)
+
+        response = dict()
+
+        def start_wrapped_response(status, response_headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = response_headers
+
+        response_body = ''.join(self.application(environ, start_wrapped_response))
+
+        response_headers = [(name, value) for name, value in response['headers']
+                            if name.lower() != 'content-length']
+        response_headers.append(('Vary', 'Accept-Encoding'))
+        if (len(response_body) >= self.compress_min_bytes and
+                'gzip' in environ.get('HTTP_ACCEPT_ENCODING', '')):
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            response_body = compressor.compress(response_body) + compressor.flush()
+            response_headers.append(('content-encoding', 'gzip'))
+        response_headers.append(('content-length', str(len(response_body))))
+
+        start_response(response['status'], response_headers)
+        return [response_body]
+
+
+class _FastJSON(object):
+    """
+     Stands for the json module in a generated server module, see
+     use_fast_json: dumps and loads serialize with ujson when it is installed,
+     the rest is the json module's.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if set(kwargs) - set(['cls']):
+            return json.dumps(obj, **kwargs)
+        return json_dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return json_loads(s)
+
+    def __getattr__(self, name):
+        return getattr(json, name)
+
+
+def use_fast_json(server_module):
+    """
+    use_fast_json: makes a generated server module serialize its JSON-RPC
+                   requests and responses with json_dumps and json_loads
+    """
+    server_module.json = _FastJSON()
+
+
+def wrap_server(server_module):
+    """
+    wrap_server: returns the application of a generated server module wrapped
+                 in an RPCMiddleware configured from the deploy.cfg of the
+                 server
+    """
+    config = server_module.config or {}
+    return RPCMiddleware(server_module.application,
+                         int(config.get(COMPRESS_MIN_BYTES) or 0))
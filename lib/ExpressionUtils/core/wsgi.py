@@ -0,0 +1,20 @@
+# uWSGI entry point of the service, see build-startup-script in the Makefile:
+# the application of the generated ExpressionUtilsServer, serializing JSON
+# with json_dumps and json_loads of http_session and wrapped in the
+# RPCMiddleware. Kept out of the generated server so `make compile` keeps it.
+#
+# To run it in uwsgi with 4 workers listening on port 9999 use:
+# uwsgi -M -p 4 --http :9999 --wsgi-file _this_file_
+from ExpressionUtils import ExpressionUtilsServer as _server
+from ExpressionUtils.core.rpc_middleware import use_fast_json, wrap_server
+
+use_fast_json(_server)
+application = wrap_server(_server)
+
+try:
+    import uwsgi
+    # the generated server mounts its own application, mount the wrapped one
+    uwsgi.applications = {'': application}
+except ImportError:
+    # Not available outside of wsgi, ignore
+    pass
@@ -32,6 +32,19 @@ function ExpressionUtils(url, auth, auth_cb, timeout, async_job_check_time_ms, s
             [params], 1, _callback, _errorCallback);
     };
  
+     this.upload_expressions_batch = function (params, _callback, _errorCallback) {
+        if (typeof params === 'function')
+            throw 'Argument params can not be a function';
+        if (_callback && typeof _callback !== 'function')
+            throw 'Argument _callback must be a function if defined';
+        if (_errorCallback && typeof _errorCallback !== 'function')
+            throw 'Argument _errorCallback must be a function if defined';
+        if (typeof arguments === 'function' && arguments.length > 1+2)
+            throw 'Too many arguments ('+arguments.length+' instead of '+(1+2)+')';
+        return json_call_ajax(_url, "ExpressionUtils.upload_expressions_batch",
+            [params], 1, _callback, _errorCallback);
+    };
+ 
      this.download_expression = function (params, _callback, _errorCallback) {
         if (typeof params === 'function')
             throw 'Argument params can not be a function';
@@ -45,6 +58,19 @@ function ExpressionUtils(url, auth, auth_cb, timeout, async_job_check_time_ms, s
             [params], 1, _callback, _errorCallback);
     };
  
+     this.get_expression_member = function (params, _callback, _errorCallback) {
+        if (typeof params === 'function')
+            throw 'Argument params can not be a function';
+        if (_callback && typeof _callback !== 'function')
+            throw 'Argument _callback must be a function if defined';
+        if (_errorCallback && typeof _errorCallback !== 'function')
+            throw 'Argument _errorCallback must be a function if defined';
+        if (typeof arguments === 'function' && arguments.length > 1+2)
+            throw 'Too many arguments ('+arguments.length+' instead of '+(1+2)+')';
+        return json_call_ajax(_url, "ExpressionUtils.get_expression_member",
+            [params], 1, _callback, _errorCallback);
+    };
+ 
      this.export_expression = function (params, _callback, _errorCallback) {
         if (typeof params === 'function')
             throw 'Argument params can not be a function';
@@ -71,6 +97,19 @@ function ExpressionUtils(url, auth, auth_cb, timeout, async_job_check_time_ms, s
             [params], 1, _callback, _errorCallback);
     };
   
+     this.export_expression_matrix = function (params, _callback, _errorCallback) {
+        if (typeof params === 'function')
+            throw 'Argument params can not be a function';
+        if (_callback && typeof _callback !== 'function')
+            throw 'Argument _callback must be a function if defined';
+        if (_errorCallback && typeof _errorCallback !== 'function')
+            throw 'Argument _errorCallback must be a function if defined';
+        if (typeof arguments === 'function' && arguments.length > 1+2)
+            throw 'Too many arguments ('+arguments.length+' instead of '+(1+2)+')';
+        return json_call_ajax(_url, "ExpressionUtils.export_expression_matrix",
+            [params], 1, _callback, _errorCallback);
+    };
+ 
     this.status = function (_callback, _errorCallback) {
         if (_callback && typeof _callback !== 'function')
             throw 'Argument _callback must be a function if defined';
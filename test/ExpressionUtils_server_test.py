@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import json
 import unittest
 import os  # noqa: F401
 import time
@@ -367,6 +368,7 @@ class ExpressionUtilsTest(unittest.TestCase):
         # uploads reads, genome and assembly to be used as input parameters to upload_expression
 
         cls.upload_genome('test_genome', 'minimal.gbff')
+        cls.upload_genome('test_genome_2', 'minimal.gbff')
         annotation_ref = cls.upload_annotation('test_annotation', 'test.gtf')
 
         int_reads = {'file': 'data/interleaved.fq',
@@ -493,11 +495,103 @@ class ExpressionUtilsTest(unittest.TestCase):
     def test_upload_cufflinks_expression_success(self):
         self.upload_expression_success(self.cufflinks_params, self.uploaded_cufflinks_zip)
     
+    @patch.object(Expression_Utils, "_get_feature_ids", side_effect=mock_get_feature_ids)
+    def test_upload_expressions_batch_success(self, _get_feature_ids):
+
+        stringtie_params = dict(self.stringtie_params)
+        stringtie_params['destination_ref'] = self.getWsName() + '/test_stringtie_batch_expression'
+        cufflinks_params = dict(self.cufflinks_params)
+        cufflinks_params['destination_ref'] = self.getWsName() + '/test_cufflinks_batch_expression'
+
+        ret = self.getImpl().upload_expressions_batch(
+            self.ctx, {'expressions': [stringtie_params, cufflinks_params],
+                       'num_threads': 2})[0]
+
+        self.assertEqual(len(ret['obj_refs']), 2)
+        self.assertEqual(len(ret['stage_timings']), 2)
+        self.assertItemsEqual(['params', 'genome_ref', 'download_alignment', 'ctab_files',
+                               'expression_levels', 'upload_bundle'],
+                              ret['stage_timings'][0].keys())
+        self.upload_expression_success(stringtie_params, self.uploaded_stringtie_zip)
+        self.upload_expression_success(cufflinks_params, self.uploaded_cufflinks_zip)
+
+    def test_upload_expressions_batch_fail_shared_source_dir(self):
+
+        with self.assertRaisesRegexp(ValueError,
+                                     'source_dir must be different for each expression'):
+            self.getImpl().upload_expressions_batch(
+                self.ctx, {'expressions': [self.stringtie_params, self.transcript_params]})
+
+    @patch.object(Expression_Utils, "_get_feature_ids", side_effect=mock_get_feature_ids)
+    def test_upload_expressions_batch_fail_mixed(self, _get_feature_ids):
+
+        stringtie_params = dict(self.stringtie_params)
+        stringtie_params['destination_ref'] = self.getWsName() + '/test_stringtie_mixed_expression'
+        assembly_params = dict(self.cufflinks_params)
+        assembly_params['destination_ref'] = self.getWsName() + '/test_assembly_mixed_expression'
+        assembly_params['alignment_ref'] = self.getWsName() + '/test_alignment_assembly'
+        assembly_params['genome_ref'] = self.getWsName() + '/test_genome_2'
+        failing_dir_path = os.path.join(self.scratch, 'upload_failing_' + str(int(time.time())))
+        copy_tree('data/stringtie_output', failing_dir_path)
+        failing_params = {'destination_ref': self.getWsName() + '/test_failing_mixed_expression',
+                          'source_dir': failing_dir_path,
+                          'alignment_ref': self.getWsName() + '/no_such_alignment'}
+
+        with self.assertRaisesRegexp(Exception, 'no_such_alignment'):
+            self.getImpl().upload_expressions_batch(
+                self.ctx, {'expressions': [stringtie_params, assembly_params, failing_params],
+                           'num_threads': 3})
+
+        # the error of one expression fails the batch, and none is saved
+        infos = self.ws.get_object_info3({'objects': [{'ref': params['destination_ref']}
+                                                      for params in [stringtie_params,
+                                                                     assembly_params,
+                                                                     failing_params]],
+                                          'ignoreErrors': 1})['infos']
+        self.assertEqual([None, None, None], infos)
+
     def test_download_stringtie_expression_success(self):
-        self.download_expression_success('test_stringtie_expression', self.upload_stringtie_dir_path)
+        self.download_expression_success('test_stringtie_expression',
+                                         self.upload_stringtie_dir_path)
 
     def test_download_cufflinks_expression_success(self):
-        self.download_expression_success('test_cufflinks_expression', self.upload_cufflinks_dir_path)
+        self.download_expression_success('test_cufflinks_expression',
+                                         self.upload_cufflinks_dir_path)
+
+    def test_get_expression_member(self):
+        params = {'source_ref': self.getWsName() + '/test_stringtie_expression',
+                  'member': 'genes.fpkm_tracking'}
+
+        info = self.getWsClient().get_object_info3({'objects': [{'ref': params['source_ref']}],
+                                                    'includeMetadata': 1})['infos'][0]
+        self.assertIn('genes.fpkm_tracking', json.loads(info[10]['bundle_members']))
+
+        ret = self.getImpl().get_expression_member(self.ctx, params)[0]
+
+        self.assertEqual(os.path.basename(ret['file_path']), 'genes.fpkm_tracking')
+        self.assertEqual(self.md5(ret['file_path']),
+                         self.md5(os.path.join(self.upload_stringtie_dir_path,
+                                               'genes.fpkm_tracking')))
+
+        params['member'] = 'missing.ctab'
+        with self.assertRaisesRegexp(ValueError, 'Files not in the expression: missing.ctab'):
+            self.getImpl().get_expression_member(self.ctx, params)
+
+    def test_download_expression_members(self):
+        params = {'source_ref': self.getWsName() + '/test_stringtie_expression',
+                  'members': ['t_data.ctab', 'genes.fpkm_tracking']}
+
+        ret = self.getImpl().download_expression(self.ctx, params)[0]
+
+        self.assertEqual(sorted(os.listdir(ret['destination_dir'])),
+                         ['genes.fpkm_tracking', 't_data.ctab'])
+        for member in params['members']:
+            self.assertEqual(self.md5(os.path.join(ret['destination_dir'], member)),
+                             self.md5(os.path.join(self.upload_stringtie_dir_path, member)))
+
+        params['members'] = ['t_data.ctab', 'missing.ctab']
+        with self.assertRaisesRegexp(ValueError, 'Files not in the expression: missing.ctab'):
+            self.getImpl().download_expression(self.ctx, params)
 
     def export_expression_success(self, obj_name, export_params,
                                   upload_dir, upload_dir_path, uploaded_zip):
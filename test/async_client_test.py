@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest
+from multiprocessing.pool import ThreadPool
+
+from ExpressionUtils.core.async_client import AsyncClient
+
+
+class FakeClient:
+
+    def __init__(self):
+        self.url = 'http://localhost:1'
+
+    def slow_echo(self, params, delay=0.2):
+        time.sleep(delay)
+        return params
+
+    def fail(self, params):
+        raise ValueError('No such object: ' + params['ref'])
+
+    def _call(self, method):
+        return method
+
+
+class AsyncClientTest(unittest.TestCase):
+
+    def test_calls(self):
+        client = AsyncClient(FakeClient())
+
+        start = time.time()
+        pending = [client.slow_echo({'ref': str(i)}) for i in range(3)]
+        self.assertTrue(time.time() - start < 0.1)
+
+        self.assertEquals([{'ref': '0'}, {'ref': '1'}, {'ref': '2'}],
+                          [result.get() for result in pending])
+        # the calls overlap
+        self.assertTrue(time.time() - start < 0.35)
+
+    def test_call_error(self):
+        client = AsyncClient(FakeClient())
+
+        result = client.fail({'ref': '1/2/3'})
+
+        with self.assertRaises(ValueError) as context:
+            result.get()
+        self.assertEquals('No such object: 1/2/3', str(context.exception))
+
+    def test_attributes(self):
+        client = AsyncClient(FakeClient())
+
+        # only public methods are made asynchronous
+        self.assertEquals('http://localhost:1', client.url)
+        self.assertEquals('m', client._call('m'))
+
+    def test_pool(self):
+        pool = ThreadPool(1)
+        try:
+            client = AsyncClient(FakeClient(), pool)
+
+            start = time.time()
+            pending = [client.slow_echo(i, 0.1) for i in range(2)]
+
+            self.assertEquals([0, 1], [result.get() for result in pending])
+            # one call at a time on a pool of one thread
+            self.assertTrue(time.time() - start >= 0.2)
+        finally:
+            pool.close()
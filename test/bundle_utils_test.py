@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import hashlib
+import shutil
+import struct
+import tempfile
+import unittest
+import zipfile
+
+from ExpressionUtils.core import bundle_utils
+from ExpressionUtils.core.bundle_utils import (hash_bundle, pack_bundle, unpack_bundle_stream,
+                                               index_bundle, dump_bundle_index,
+                                               unpack_bundle_member, file_md5, BundleIndex)
+
+
+class BundleUtilsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def make_bundle(self, parent, name, files):
+        bundle_dir = os.path.join(self.tmp_dir, parent, name)
+        for rel_path, content in files.items():
+            file_path = os.path.join(bundle_dir, rel_path)
+            if not os.path.exists(os.path.dirname(file_path)):
+                os.makedirs(os.path.dirname(file_path))
+            with open(file_path, 'w') as bundle_file:
+                bundle_file.write(content)
+        return bundle_dir
+
+    def test_hash_bundle(self):
+        files = {'genes.fpkm_tracking': 'gene_id\tFPKM\n', 'sub/t_data.ctab': 't_id\n'}
+        bundle_hash = hash_bundle(self.make_bundle('a', 'bundle', files))
+
+        self.assertEquals(bundle_hash, hash_bundle(self.make_bundle('b', 'bundle', files)))
+        self.assertNotEquals(bundle_hash, hash_bundle(self.make_bundle('c', 'other', files)))
+        self.assertNotEquals(bundle_hash, hash_bundle(self.make_bundle(
+            'd', 'bundle', dict(files, **{'genes.fpkm_tracking': 'gene_id\tTPM\n'}))))
+        self.assertEquals(bundle_hash, hash_bundle(
+            self.make_bundle('e', 'bundle', dict(files, **{'bundle.zip': 'PK'})),
+            exclude=['bundle.zip']))
+
+    def test_file_md5(self):
+        bundle_dir = self.make_bundle('a', 'bundle', {'t_data.ctab': 't_id\n' * 100000})
+
+        self.assertEquals(hashlib.md5('t_id\n' * 100000).hexdigest(),
+                          file_md5(os.path.join(bundle_dir, 't_data.ctab')))
+
+    def test_pack_bundle(self):
+        files = {'genes.fpkm_tracking': 'gene_id\tFPKM\n' * 1000, 'empty.ctab': '',
+                 'sub/t_data.ctab': 't_id\n'}
+        bundle_dir = self.make_bundle('a', 'bundle', dict(files, **{'bundle.zip': 'PK'}))
+        zip_path = os.path.join(self.tmp_dir, 'bundle.zip')
+
+        block_size = bundle_utils.PACK_BLOCK_SIZE
+        bundle_utils.PACK_BLOCK_SIZE = 100
+        try:
+            for level, threads in [(0, 1), (1, 1), (6, 3)]:
+                pack_bundle(bundle_dir, zip_path, level, threads, exclude=['bundle.zip'])
+
+                with zipfile.ZipFile(zip_path) as zip_file:
+                    self.assertEquals(None, zip_file.testzip())
+                    self.assertEquals(sorted(files), sorted(zip_file.namelist()))
+                    for name in files:
+                        self.assertEquals(files[name], zip_file.read(name))
+                    self.assertEquals(zipfile.ZIP_DEFLATED if level else zipfile.ZIP_STORED,
+                                      zip_file.getinfo('genes.fpkm_tracking').compress_type)
+        finally:
+            bundle_utils.PACK_BLOCK_SIZE = block_size
+
+    def test_unpack_bundle_stream(self):
+        files = {'genes.fpkm_tracking': 'gene_id\tFPKM\n' * 1000, 'empty.ctab': '',
+                 'sub/t_data.ctab': 't_id\n'}
+        bundle_dir = self.make_bundle('a', 'bundle', files)
+        for name, level in [('stored.zip', 0), ('deflated.zip', 6)]:
+            zip_path = os.path.join(self.tmp_dir, name)
+            pack_bundle(bundle_dir, zip_path, level)
+
+            dest_dir = os.path.join(self.tmp_dir, 'all_' + name)
+            with open(zip_path, 'rb') as stream:
+                extracted = unpack_bundle_stream(stream, dest_dir)
+            self.assertEquals(sorted(files), sorted(extracted))
+            for name_, content in files.items():
+                with open(os.path.join(dest_dir, name_)) as member_file:
+                    self.assertEquals(content, member_file.read())
+
+            dest_dir = os.path.join(self.tmp_dir, 'some_' + name)
+            with open(zip_path, 'rb') as stream:
+                extracted = unpack_bundle_stream(stream, dest_dir, ['empty.ctab'])
+                # the rest of the zip file is not read
+                self.assertTrue(stream.tell() < os.path.getsize(zip_path) / 2)
+            self.assertEquals(['empty.ctab'], extracted)
+            self.assertEquals(['empty.ctab'], os.listdir(dest_dir))
+
+    def test_unpack_bundle_stream_errors(self):
+        zip_path = os.path.join(self.tmp_dir, 'bundle.zip')
+        with zipfile.ZipFile(zip_path, 'w') as zip_file:
+            zip_file.writestr('../outside.ctab', 't_id\n')
+        with open(zip_path, 'rb') as stream:
+            with self.assertRaises(ValueError):
+                unpack_bundle_stream(stream, os.path.join(self.tmp_dir, 'dest'))
+
+        # a zip file with the sizes of its files after their data
+        with zipfile.ZipFile(zip_path, 'w') as zip_file:
+            zip_file.writestr('t_data.ctab', 't_id\n')
+        with open(zip_path, 'r+b') as zip_file:
+            zip_file.seek(6)
+            zip_file.write(struct.pack('<H', 0x8))
+        with open(zip_path, 'rb') as stream:
+            with self.assertRaises(ValueError):
+                unpack_bundle_stream(stream, os.path.join(self.tmp_dir, 'dest'))
+
+    def test_index_bundle(self):
+        files = {'genes.fpkm_tracking': 'gene_id\tFPKM\n' * 1000, 'empty.ctab': '',
+                 'sub/t_data.ctab': 't_id\n'}
+        bundle_dir = self.make_bundle('a', 'bundle', files)
+        zip_paths = list()
+        for level in [0, 6]:
+            zip_paths.append(os.path.join(self.tmp_dir, 'pack_{0}.zip'.format(level)))
+            pack_bundle(bundle_dir, zip_paths[-1], level)
+        # as zipped by DataFileUtil
+        zip_paths.append(shutil.make_archive(os.path.join(self.tmp_dir, 'archive'), 'zip',
+                                             bundle_dir))
+
+        for zip_path in zip_paths:
+            members = index_bundle(zip_path)
+
+            self.assertEquals(sorted(files), sorted(members))
+            for name, content in files.items():
+                file_path = os.path.join(self.tmp_dir, 'member')
+                with open(zip_path, 'rb') as stream:
+                    stream.seek(members[name][0])
+                    unpack_bundle_member(stream, members[name], file_path)
+                with open(file_path) as member_file:
+                    self.assertEquals(content, member_file.read())
+
+            # the bytes of another file
+            with open(zip_path, 'rb') as stream:
+                with self.assertRaises(ValueError):
+                    unpack_bundle_member(stream, members['genes.fpkm_tracking'], file_path)
+
+    def test_dump_bundle_index(self):
+        # the bundle of an upload, within the 900 bytes of a metadata value
+        members = index_bundle(shutil.make_archive(os.path.join(self.tmp_dir, 'stringtie'), 'zip',
+                                                   os.path.join('data', 'stringtie_output')))
+
+        index = dump_bundle_index(members, 900)
+
+        self.assertEquals(members, json.loads(index))
+        self.assertEquals(None, dump_bundle_index(members, len(index) - 1))
+
+        # a bundle of many files
+        bundle_dir = self.make_bundle('a', 'bundle', dict(('sample_{0}.ctab'.format(i), 't_id\n')
+                                                          for i in range(40)))
+        zip_path = os.path.join(self.tmp_dir, 'bundle.zip')
+        pack_bundle(bundle_dir, zip_path)
+
+        self.assertEquals(None, dump_bundle_index(index_bundle(zip_path), 900))
+
+    def test_bundle_index(self):
+        index = BundleIndex(os.path.join(self.tmp_dir, 'index'))
+        handle = {'hid': 'KBH_1', 'id': 'node_1', 'file_name': 'bundle.zip'}
+
+        self.assertEquals(None, index.get('user_1', 'ab12'))
+        index.put('user_1', 'ab12', handle, {'t_data.ctab': [41, 5, 5, 0, 1]})
+        self.assertEquals({'handle': handle, 'members': {'t_data.ctab': [41, 5, 5, 0, 1]}},
+                          BundleIndex(index.index_dir).get('user_1', 'ab12'))
+        # the bundles of a user are not reused by the others
+        self.assertEquals(None, index.get('user_2', 'ab12'))
+        index.remove('user_1', 'ab12')
+        self.assertEquals(None, index.get('user_1', 'ab12'))
+
+        with self.assertRaises(ValueError):
+            index.put('user_1', '../ab12', handle)
+        with self.assertRaises(ValueError):
+            index.put('../user_1', 'ab12', handle)
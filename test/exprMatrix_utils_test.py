@@ -4,6 +4,9 @@ import os  # noqa: F401
 import time
 import inspect
 import shutil
+import logging
+import tempfile
+import threading
 
 from os import environ
 
@@ -20,6 +23,8 @@ from GenomeFileUtil.GenomeFileUtilClient import GenomeFileUtil
 from ExpressionUtils.ExpressionUtilsImpl import ExpressionUtils
 from ExpressionUtils.ExpressionUtilsServer import MethodContext
 from ExpressionUtils.authclient import KBaseAuth as _KBaseAuth
+from ExpressionUtils.core.exprMatrix_utils import ExprMatrixUtils
+from ExpressionUtils.core.object_cache import WorkspaceObjectCache
 
 class ExprMatrixUtilsTest(unittest.TestCase):
     @classmethod
@@ -229,3 +234,275 @@ class ExprMatrixUtilsTest(unittest.TestCase):
             'or KBaseSets.ExpressionSet', exception=TypeError)
 
 
+
+    def fail_exportExprMat(self, params, error, exception=ValueError):
+
+        test_name = inspect.stack()[1][3]
+        print('\n*** starting expected export Expression Matrix fail test: ' + test_name + ' **********************')
+
+        with self.assertRaises(exception) as context:
+            self.getImpl().export_expression_matrix(self.ctx, params)
+        self.assertEqual(error, str(context.exception.message))
+
+    def test_exportExprMat_fail_no_source_ref(self):
+        self.fail_exportExprMat(
+            {
+                'row_block_size': 100
+            },
+            '"source_ref" parameter is required, but missing')
+
+    def test_exportExprMat_fail_non_matrix_ref(self):
+        self.fail_exportExprMat(
+            {
+                'source_ref': self.genome_ref
+            },
+            'source_ref should be of type KBaseFeatureValues.ExpressionMatrix',
+            exception=TypeError)
+
+
+class FakeWorkspace:
+    """
+     Answers get_objects2 with objects named after their refs, 1/<i>/1. The
+     calls with the lower refs answer last.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def get_objects2(self, params):
+        refs = [object_spec['ref'] for object_spec in params['objects']]
+        with self.lock:
+            self.calls.append(params)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep((1000 - int(refs[0].split('/')[1])) / 100000.0)
+        with self.lock:
+            self.in_flight -= 1
+        return {'data': [{'info': [ref], 'data': {'condition': ref}} for ref in refs]}
+
+
+class ExprMatrixUtilsFetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.scratch)
+
+    def get_expression_objects(self, expr_obj_refs, num_threads):
+        expr_matrix_utils = ExprMatrixUtils({'scratch': self.scratch,
+                                             'workspace-url': 'http://localhost:1',
+                                             'expression-fetch-threads': num_threads},
+                                            logging.getLogger('ExprMatrixUtilsFetchTest'))
+        ws = FakeWorkspace()
+
+        return expr_matrix_utils.get_expression_objects(WorkspaceObjectCache(ws), expr_obj_refs,
+                                                        'my_ws'), ws
+
+    def test_get_expression_objects(self):
+        batch_size = ExprMatrixUtils.EXPR_FETCH_BATCH_SIZE
+        for num_refs, batch_sizes in [(0, []),
+                                      (1, [1]),
+                                      (batch_size, [batch_size]),
+                                      (batch_size + 1, [batch_size, 1]),
+                                      (5 * batch_size + 20, [batch_size] * 5 + [20])]:
+            expr_obj_refs = ['1/{}/1'.format(i) for i in range(num_refs)]
+
+            expr_objs, ws = self.get_expression_objects(expr_obj_refs, 4)
+
+            # in the order of the refs, whatever order the batches answer in
+            self.assertEqual(expr_obj_refs, [expr_obj['info'][0] for expr_obj in expr_objs])
+            self.assertEqual(batch_sizes, [len(params['objects']) for params in
+                                           sorted(ws.calls, key=lambda params: int(
+                                               params['objects'][0]['ref'].split('/')[1]))])
+            self.assertTrue(ws.max_in_flight <= 4)
+            for params in ws.calls:
+                for object_spec in params['objects']:
+                    self.assertEqual(ExprMatrixUtils.EXPR_INCLUDED_PATHS,
+                                     object_spec['included'])
+
+    def test_get_expression_objects_threads(self):
+        expr_obj_refs = ['1/{}/1'.format(i) for i in range(200)]
+
+        expr_objs, ws = self.get_expression_objects(expr_obj_refs, 4)
+        self.assertEqual(4, ws.max_in_flight)
+
+        expr_objs, ws = self.get_expression_objects(expr_obj_refs, 1)
+        self.assertEqual(expr_obj_refs, [expr_obj['info'][0] for expr_obj in expr_objs])
+        self.assertEqual(1, ws.max_in_flight)
+        self.assertEqual(['1/0/1', '1/50/1', '1/100/1', '1/150/1'],
+                         [params['objects'][0]['ref'] for params in ws.calls])
+
+
+class FakeObjectWorkspace:
+    """
+     Workspace of the objects saved with save_objects, which also serves as
+     the DataFileUtil saving them. Objects are saved at the save date set in
+     save_date, with their extra provenance input refs as resolved refs.
+    """
+
+    def __init__(self):
+        self.objects = dict()
+        self.fetched_refs = []
+        self.save_date = '2020-01-01T00:00:00+0000'
+        # batched calls go through the client of the workspace client
+        self._client = self
+        self._service_ver = None
+
+    def save_objects(self, params):
+        infos = []
+        for obj in params['objects']:
+            info = [len(self.objects) + 1, obj['name'], obj['type'], self.save_date, 1,
+                    'user', 1, 'my_ws', 'chsum', 0, obj.get('meta', {})]
+            provenance = [{'resolved_ws_objects': obj.get('extra_provenance_input_refs', [])}]
+            self.objects['1/{}/1'.format(info[0])] = {'info': info, 'data': obj['data'],
+                                                      'provenance': provenance}
+            infos.append(info)
+        return infos
+
+    def call_methods(self, calls, service_ver=None):
+        return [getattr(self, method.split('.')[1])(*args) for method, args in calls]
+
+    def get_objects2(self, params):
+        data = []
+        for object_spec in params['objects']:
+            obj = self.objects[object_spec['ref']]
+            self.fetched_refs.append(object_spec['ref'])
+            fields = [path.strip('/') for path in object_spec.get('included', obj['data'])]
+            data.append({'info': obj['info'],
+                         'data': dict((field, obj['data'][field])
+                                      for field in fields if field in obj['data']),
+                         'provenance': obj['provenance']})
+        return {'data': data}
+
+    def get_object_info3(self, params):
+        return {'infos': [self.objects[object_spec['ref']]['info']
+                          for object_spec in params['objects']]}
+
+
+class ExprMatrixUtilsIncrementalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp()
+        self.ws = FakeObjectWorkspace()
+        self.expr_matrix_utils = ExprMatrixUtils(
+            {'scratch': self.scratch, 'workspace-url': 'http://localhost:1'},
+            logging.getLogger('ExprMatrixUtilsIncrementalTest'))
+        self.expr_matrix_utils.ws_client = self.ws
+        self.expr_matrix_utils.dfu = self.ws
+        self.genome_ref = self.save_object('genome', 'KBaseGenomes.Genome-8.0', {})
+
+    def tearDown(self):
+        shutil.rmtree(self.scratch)
+
+    def save_object(self, name, obj_type, data, meta=None):
+        info = self.ws.save_objects({'objects': [{'name': name, 'type': obj_type,
+                                                  'data': data, 'meta': meta or {}}]})[0]
+        return '1/{}/1'.format(info[0])
+
+    def save_expression(self, name, levels):
+        gene_ids = ['gene_{}'.format(i) for i in range(len(levels))]
+        return self.save_object(
+            name, 'KBaseRNASeq.RNASeqExpression-1.0',
+            {'expression_levels': dict(zip(gene_ids, levels)),
+             'tpm_expression_levels': dict(zip(gene_ids, [level * 2 for level in levels])),
+             'condition': name + '_condition',
+             'numerical_interpretation': 'FPKM'},
+            {'genome_id': self.genome_ref})
+
+    def get_expression_matrix(self, expr_refs, previous_refs=None):
+        set_ref = self.save_object('expression_set', 'KBaseSets.ExpressionSet-2.0',
+                                   {'items': [{'ref': expr_ref} for expr_ref in expr_refs]})
+        params = {'expressionset_ref': set_ref,
+                  'output_obj_name': 'matrix',
+                  'workspace_name': 1}
+        if previous_refs:
+            params['previous_exprMatrix_FPKM_ref'] = previous_refs[0]
+            params['previous_exprMatrix_TPM_ref'] = previous_refs[1]
+        self.ws.fetched_refs = []
+
+        return self.expr_matrix_utils.get_expression_matrix(params)
+
+    def test_incremental_matrix(self):
+        expr_1 = self.save_expression('expr_1', [1.0, 0.0, 3.0])
+        expr_2 = self.save_expression('expr_2', [4.0, 5.0, 6.0])
+        expr_3 = self.save_expression('expr_3', [7.0, 8.0, 0.0])
+        previous_refs = self.get_expression_matrix([expr_1, expr_2, expr_3])
+
+        # expr_3 is saved again after the previous matrices, with other levels
+        self.ws.save_date = '2020-02-01T00:00:00+0000'
+        expr_3 = self.save_expression('expr_3', [9.0, 0.0, 1.5])
+        expr_4 = self.save_expression('expr_4', [2.0, 2.5, 0.0])
+        expr_refs = [expr_4, expr_3, expr_1]
+
+        incremental_refs = self.get_expression_matrix(expr_refs, previous_refs)
+        # only the added and the saved again expressions are fetched
+        self.assertItemsEqual([expr_3, expr_4],
+                              [ref for ref in self.ws.fetched_refs if ref in expr_refs])
+        full_refs = self.get_expression_matrix(expr_refs)
+
+        for incremental_ref, full_ref in zip(incremental_refs, full_refs):
+            incremental = self.ws.objects[incremental_ref]['data']
+            full = self.ws.objects[full_ref]['data']
+            self.assertEqual(full, incremental)
+        fpkm = self.ws.objects[incremental_refs[0]]['data']['data']
+        self.assertEqual(['expr_4', 'expr_3', 'expr_1'], fpkm['col_ids'])
+        self.assertEqual([[2.0, 9.0, 1.0], [2.5, 0.0, 0.0], [0.0, 1.5, 3.0]], fpkm['values'])
+
+    def test_incremental_matrix_other_object(self):
+        expr_1 = self.save_expression('expr_1', [1.0, 2.0])
+        # a same-named object, e.g. another version or from another workspace
+        other_expr_1 = self.save_expression('expr_1', [3.0, 4.0])
+        expr_2 = self.save_expression('expr_2', [5.0, 6.0])
+        previous_refs = self.get_expression_matrix([other_expr_1, expr_2])
+
+        refs = self.get_expression_matrix([expr_1, expr_2], previous_refs)
+
+        self.assertEqual([expr_1], [ref for ref in self.ws.fetched_refs
+                                    if ref in [expr_1, other_expr_1, expr_2]])
+        fpkm = self.ws.objects[refs[0]]['data']['data']
+        self.assertEqual(['expr_1', 'expr_2'], fpkm['col_ids'])
+        self.assertEqual([[1.0, 5.0], [2.0, 6.0]], fpkm['values'])
+
+    def test_incremental_matrix_without_provenance(self):
+        expr_1 = self.save_expression('expr_1', [1.0, 2.0])
+        expr_2 = self.save_expression('expr_2', [5.0, 6.0])
+        previous_refs = self.get_expression_matrix([expr_1, expr_2])
+        # the expressions of the columns cannot be told
+        for previous_ref in previous_refs:
+            self.ws.objects[previous_ref]['provenance'] = []
+
+        refs = self.get_expression_matrix([expr_1, expr_2], previous_refs)
+
+        self.assertItemsEqual([expr_1, expr_2], [ref for ref in self.ws.fetched_refs
+                                                 if ref in [expr_1, expr_2]])
+        self.assertEqual([[1.0, 5.0], [2.0, 6.0]],
+                         self.ws.objects[refs[0]]['data']['data']['values'])
+
+    def test_concurrent_matrices(self):
+        expr_1 = self.save_expression('expr_1', [1.0, 2.0])
+        expr_2 = self.save_expression('expr_2', [3.0, 4.0])
+
+        # another matrix is built while the expressions of the first are fetched
+        other_refs = []
+        get_objects2 = self.ws.get_objects2
+
+        def get_objects2_building_other(params):
+            if '/expression_levels' in params['objects'][0].get('included', []):
+                self.ws.get_objects2 = get_objects2
+                other_refs.extend(self.get_expression_matrix([expr_2]))
+            return get_objects2(params)
+        self.ws.get_objects2 = get_objects2_building_other
+
+        refs = self.get_expression_matrix([expr_1])
+
+        self.assertTrue(other_refs)
+        for matrix_refs, expr_ref, expr_name in [(refs, expr_1, 'expr_1'),
+                                                 (other_refs, expr_2, 'expr_2')]:
+            matrix = self.ws.objects[matrix_refs[0]]
+            self.assertEqual([expr_name], matrix['data']['data']['col_ids'])
+            set_ref = matrix['provenance'][0]['resolved_ws_objects'][1]
+            self.assertEqual([{'ref': expr_ref}], self.ws.objects[set_ref]['data']['items'])
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import unittest
+import gzip
+import shutil
+import os
+import tempfile
+
+from ExpressionUtils.core.expression_reader import ExpressionFileReader
+from ExpressionUtils.core.expression_reader import STRINGTIE, CUFFLINKS, CTAB
+
+
+class ExpressionFileReaderTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def read_rows(self, filepath, column_names):
+        with ExpressionFileReader(filepath) as reader:
+            columns = [reader.column_index(name) for name in column_names]
+            return list(reader.rows(columns))
+
+    def test_read_fpkm_tracking(self):
+        rows = self.read_rows('data/cufflinks_output/genes.fpkm_tracking',
+                              ['tracking_id', 'FPKM'])
+
+        self.assertEquals(10, len(rows))
+        self.assertEquals(('AT1G29740', '0'), rows[0])
+
+    def test_read_ctab(self):
+        rows = self.read_rows('data/expression_utils/t_data.ctab', ['t_name', 'FPKM'])
+
+        self.assertEquals(9, len(rows))
+        # FPKM is the last column of a ctab file
+        self.assertEquals(('MSTRG.3.1', '572568.250000'), rows[-1])
+
+    def test_read_gzip_gene_abund(self):
+        filepath = 'data/stringtie_output/hy5_rep1.gene_abund.tab'
+        gz_filepath = os.path.join(self.tmp_dir, 'hy5_rep1.gene_abund.tab.gz')
+        with open(filepath, 'rb') as f_in, gzip.open(gz_filepath, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+
+        rows = self.read_rows(filepath, ['Gene ID', 'FPKM', 'TPM'])
+        self.assertEquals(33518, len(rows))
+        self.assertEquals(rows, self.read_rows(gz_filepath, ['Gene ID', 'FPKM', 'TPM']))
+
+    def test_missing_column(self):
+        with ExpressionFileReader('data/expression_utils/t_data.ctab') as reader:
+            self.assertIsNone(reader.column_index('TPM'))
+
+    def test_short_and_blank_lines(self):
+        filepath = os.path.join(self.tmp_dir, 'short.fpkm_tracking')
+        with open(filepath, 'w') as f:
+            f.write('Gene ID\tGene Name\tFPKM\nG1\t-\t1.5\n\nG2\n')
+
+        with ExpressionFileReader(filepath) as reader:
+            rows = reader.rows([0, 2])
+            self.assertEquals(('G1', '1.5'), next(rows))
+            with self.assertRaisesRegexp(ValueError, 'line 4 .* has only 1 columns'):
+                next(rows)
+
+    def test_read_columns(self):
+        for filepath, column_names in [
+                ('data/stringtie_output/hy5_rep1.gene_abund.tab', ['Gene ID', 'FPKM', 'TPM']),
+                ('data/expression_utils/t_data.ctab', ['t_name', 'gene_name', 'FPKM'])]:
+            with ExpressionFileReader(filepath) as reader:
+                columns = [reader.column_index(name) for name in column_names]
+                values = reader.columns(columns)
+
+            self.assertEquals(self.read_rows(filepath, column_names), zip(*values))
+
+    def test_columns_short_and_blank_lines(self):
+        filepath = os.path.join(self.tmp_dir, 'short_columns.fpkm_tracking')
+        with open(filepath, 'w') as f:
+            f.write('Gene ID\tGene Name\tFPKM\nG1\t-\t1.5\n\nG2\t-\t2\n\n\nG3\t-\t0\n')
+
+        with ExpressionFileReader(filepath) as reader:
+            self.assertEquals([['G1', 'G2', 'G3'], ['1.5', '2', '0']], reader.columns([0, 2]))
+            self.assertEquals([2, 4, 7], [reader.row_line_number(row) for row in range(3)])
+
+        with open(filepath, 'a') as f:
+            f.write('G4\n')
+        with ExpressionFileReader(filepath) as reader:
+            with self.assertRaisesRegexp(ValueError, 'line 8 .* has only 1 columns'):
+                reader.columns([0, 2])
+
+    def test_detect_format(self):
+        for filepath, expected_format in [
+                ('data/stringtie_output/genes.fpkm_tracking', STRINGTIE),
+                ('data/stringtie_output/hy5_rep1.gene_abund.tab', STRINGTIE),
+                ('data/cufflinks_output/genes.fpkm_tracking', CUFFLINKS),
+                ('data/cufflinks_output/isoforms.fpkm_tracking', CUFFLINKS),
+                ('data/stringtie_output/t_data.ctab', CTAB),
+                ('data/stringtie_output/e2t.ctab', None)]:
+            with ExpressionFileReader(filepath) as reader:
+                self.assertEquals(expected_format, reader.format)
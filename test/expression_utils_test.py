@@ -4,6 +4,10 @@ import logging
 import sys
 import os  # noqa: F401
 import time
+import math
+import shutil
+import tempfile
+import threading
 from mock import patch
 
 from os import environ
@@ -19,6 +23,28 @@ from ExpressionUtils.authclient import KBaseAuth as _KBaseAuth
 from ExpressionUtils.core.expression_utils import ExpressionUtils
 
 
+class FakeGenomeSearchUtil:
+    """
+     Searches a genome of feature_num features, gene_000000, gene_000001...,
+     each with one alias
+    """
+
+    def __init__(self, feature_num):
+        self.feature_num = feature_num
+        self.searches = []
+        self.lock = threading.Lock()
+
+    def search(self, params):
+        with self.lock:
+            self.searches.append(params)
+        start = params.get('start', 0)
+        return {'num_found': self.feature_num,
+                'features': [{'feature_id': 'gene_{:06d}'.format(i),
+                              'aliases': {'alias_{}'.format(i): ['source']}}
+                             for i in range(start, min(start + params['limit'],
+                                                       self.feature_num))]}
+
+
 class GFFUtilsTest(unittest.TestCase):
 
     @classmethod
@@ -123,7 +149,7 @@ class GFFUtilsTest(unittest.TestCase):
         exp_utils = ExpressionUtils(self.__class__.cfg)  # no logger specified
 
         fpkm_dict, tpm_dict = exp_utils.get_expression_levels(
-            filepath='data/expression_utils/zero_sum_fpkm.genes.fpkm_tracking',
+            filepath='data/expression_utils/zero_sum_fpkm.cufflinks.genes.fpkm_tracking',
             genome_ref='')
 
         self.assertEquals(10, len(fpkm_dict))
@@ -134,6 +160,22 @@ class GFFUtilsTest(unittest.TestCase):
             sum_tpm += tpm
         self.assertEquals(0.0, sum_tpm)
 
+    @patch.object(ExpressionUtils, "_get_feature_ids", side_effect=mock_get_feature_ids)
+    def test_get_expression_levels_stringtie_tpm(self, _get_feature_ids):
+        exp_utils = ExpressionUtils(self.__class__.cfg)  # no logger specified
+
+        # StringTie TPM levels are used as is, even though the FPKM levels sum to 0
+        fpkm_dict, tpm_dict = exp_utils.get_expression_levels(
+            filepath='data/expression_utils/zero_sum_fpkm.genes.fpkm_tracking',
+            genome_ref='')
+
+        self.assertEquals(10, len(fpkm_dict))
+        self.assertEquals(10, len(tpm_dict))
+
+        self.assertEquals(0.0, sum(fpkm_dict.values()))
+        self.assertAlmostEqual(math.log(527.347168 + 1, 2), tpm_dict['AT1G01100'])
+        self.assertEquals(0.0, tpm_dict['AT1G01010'])
+
     @patch.object(ExpressionUtils, "_get_feature_ids",
                   side_effect=mock_get_feature_ids)
     def test_get_transcript_expression_levels(self, _get_feature_ids):
@@ -158,3 +200,83 @@ class GFFUtilsTest(unittest.TestCase):
 
         self.assertEqual(fpkm_dict, expected_fpkm)
         self.assertEqual(tpm_dict, expected_tpm)
+
+    @patch.object(ExpressionUtils, "_get_feature_ids",
+                  side_effect=mock_get_feature_ids)
+    def test_get_transcript_expression_level_arrays(self, _get_feature_ids):
+        exp_utils = ExpressionUtils(self.__class__.cfg)  # no logger specified
+
+        gene_ids, levels = exp_utils.get_expression_level_arrays(
+            filepath='data/expression_utils/t_data.ctab',
+            genome_ref='', id_col=5)
+
+        self.assertEqual(gene_ids, ['gene_1_mRNA', 'mRNA_1', 'mRNA_2', 'mRNA_3',
+                                    'MSTRG.1.1', 'MSTRG.1.2', 'MSTRG.2.1',
+                                    'MSTRG.2.2', 'MSTRG.3.1'])
+        self.assertEqual(levels['fpkm'][4], 158804.90625)
+        self.assertEqual(levels['log2_fpkm'][4], 17.276905044091045)
+        self.assertAlmostEqual(levels['tpm'].sum(), 1e6)
+        self.assertEqual(levels['log2_tpm'][8], 19.22155881227908)
+
+    def test_get_feature_ids_pages(self):
+        scratch = tempfile.mkdtemp()
+        try:
+            exp_utils = ExpressionUtils(dict(self.__class__.cfg, scratch=scratch))
+            page_size = ExpressionUtils.FEATURE_PAGE_SIZE
+            for feature_num in [0, 1, page_size, 2 * page_size, 2 * page_size + 1]:
+                genome_ref = '1/{}/1'.format(feature_num)
+                exp_utils.gsu = FakeGenomeSearchUtil(feature_num)
+
+                feature_ids = exp_utils._get_feature_ids(genome_ref)
+
+                self.assertEqual(feature_num, len(feature_ids))
+                for i in [0, page_size - 1, page_size, feature_num - 1]:
+                    if 0 <= i < feature_num:
+                        self.assertEqual(['alias_{}'.format(i)],
+                                         feature_ids['gene_{:06d}'.format(i)])
+                # the count, then each page once, sorted the same way
+                searches = exp_utils.gsu.searches
+                self.assertEqual({'ref': genome_ref, 'limit': 1}, searches[0])
+                self.assertEqual(range(0, feature_num, page_size),
+                                 sorted(search['start'] for search in searches[1:]))
+                for search in searches[1:]:
+                    self.assertEqual(page_size, search['limit'])
+                    self.assertEqual(feature_num, search['num_found'])
+                    self.assertEqual([['feature_id', True]], search['sort_by'])
+        finally:
+            shutil.rmtree(scratch)
+
+    def test_get_feature_index_genomes(self):
+        exp_utils = ExpressionUtils(self.__class__.cfg)
+        started = {'1/1/1': threading.Event(), '1/2/1': threading.Event()}
+        overlapped = []
+
+        def get_feature_ids(genome_ref):
+            started[genome_ref].set()
+            # the build of each genome waits for the build of the other one
+            other_ref = [ref for ref in started if ref != genome_ref][0]
+            overlapped.append(started[other_ref].wait(5))
+            return {'gene_' + genome_ref: []}
+
+        with patch.object(exp_utils, '_get_feature_ids',
+                          side_effect=get_feature_ids) as _get_feature_ids:
+            feature_indexes = dict()
+            threads = [threading.Thread(
+                target=lambda genome_ref, i: feature_indexes.__setitem__(
+                    (genome_ref, i), exp_utils._get_feature_index(genome_ref)),
+                args=(genome_ref, i))
+                for genome_ref in started for i in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        # each index is built once, concurrently with the other genome
+        self.assertEqual(2, _get_feature_ids.call_count)
+        self.assertEqual([True, True], overlapped)
+        for genome_ref in started:
+            feature_index = feature_indexes[(genome_ref, 0)]
+            self.assertEqual('gene_' + genome_ref,
+                             feature_index.resolve('gene_' + genome_ref, None))
+            for i in range(1, 3):
+                self.assertTrue(feature_indexes[(genome_ref, i)] is feature_index)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import shutil
+import tempfile
+
+from ExpressionUtils.core.feature_cache import FeatureIdCache
+
+
+class FeatureIdCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_get_put(self):
+        cache = FeatureIdCache(self.cache_dir)
+        features = {'AT1G01010': ['NAC001'], 'AT1G01020': []}
+
+        self.assertIsNone(cache.get('1/2/3'))
+        cache.put('1/2/3', features)
+        self.assertEquals(features, cache.get('1/2/3'))
+
+        # a new cache over the same directory sees the stored entry
+        self.assertEquals(features, FeatureIdCache(self.cache_dir).get('1/2/3'))
+
+    def test_unversioned_refs_not_cached(self):
+        cache = FeatureIdCache(self.cache_dir)
+
+        cache.put('my_ws/my_genome', {'AT1G01010': []})
+        cache.put('1/2', {'AT1G01010': []})
+
+        self.assertIsNone(cache.get('my_ws/my_genome'))
+        self.assertIsNone(cache.get('1/2'))
+        self.assertFalse(os.path.isdir(cache.cache_dir))
+
+    def test_lru_eviction(self):
+        features = dict(('AT1G{:05d}'.format(i), []) for i in range(100))
+        cache = FeatureIdCache(self.cache_dir)
+        cache.put('1/1/1', features)
+        entry_size = os.path.getsize(os.path.join(cache.cache_dir, '1_1_1.json'))
+
+        cache = FeatureIdCache(self.cache_dir, max_size_bytes=2 * entry_size)
+        cache.put('1/2/1', features)
+        os.utime(os.path.join(cache.cache_dir, '1_1_1.json'), (0, 0))
+        os.utime(os.path.join(cache.cache_dir, '1_2_1.json'), (1, 1))
+
+        cache.get('1/1/1')  # 1/1/1 becomes the most recently used entry
+        cache.put('1/3/1', features)
+
+        self.assertIsNotNone(cache.get('1/1/1'))
+        self.assertIsNone(cache.get('1/2/1'))
+        self.assertIsNotNone(cache.get('1/3/1'))
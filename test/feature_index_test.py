@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from ExpressionUtils.core.feature_index import FeatureIndex
+
+
+class FeatureIndexTest(unittest.TestCase):
+
+    def test_resolve_feature_ids(self):
+        feature_index = FeatureIndex(['AT1G01010', 'AT1G01020', 'AT1G01020'])
+
+        self.assertEquals(2, len(feature_index))
+        self.assertTrue('AT1G01010' in feature_index)
+        self.assertFalse('missing' in feature_index)
+
+        self.assertEquals('AT1G01020', feature_index.resolve('AT1G01020', '-'))
+        self.assertEquals('AT1G01010', feature_index.resolve('missing', 'AT1G01010'))
+        self.assertIsNone(feature_index.resolve('missing', '-'))
+
+    def test_resolve_aliases(self):
+        feature_index = FeatureIndex({'AT1G01010': ['NAC001', 'ANAC001'],
+                                      'AT1G01020': ['ARV1'],
+                                      'AT1G01030': None})
+
+        self.assertEquals(3, len(feature_index))
+        self.assertFalse('NAC001' in feature_index)
+
+        self.assertEquals('AT1G01010', feature_index.resolve('ANAC001', '-'))
+        self.assertEquals('AT1G01020', feature_index.resolve('missing', 'ARV1'))
+
+        # feature ids take precedence over aliases
+        self.assertEquals('AT1G01030', feature_index.resolve('ARV1', 'AT1G01030'))
+
+    def test_resolve_all(self):
+        feature_index = FeatureIndex({'AT1G01010': ['NAC001'], 'AT1G01020': []})
+
+        self.assertEquals(['AT1G01010', 'AT1G01020', 'AT1G01010', None],
+                          feature_index.resolve_all(['AT1G01010', 'missing', 'NAC001', 'missing'],
+                                                    ['-', 'AT1G01020', '-', '-']))
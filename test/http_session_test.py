@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+import json
+import random
+import requests
+import unittest
+import zlib
+
+from ExpressionUtils.core import http_session
+from DataFileUtil.DataFileUtilClient import DataFileUtil
+from DataFileUtil.baseclient import ServerError as DFUError
+from Workspace.WorkspaceClient import Workspace
+from Workspace.baseclient import ServerError as WorkspaceError
+
+
+class HTTPSessionJSONTest(unittest.TestCase):
+
+    def test_json_round_trip(self):
+        obj = {'params': [{'genome_ref': '1/2/3',
+                           'levels': {'gene_a': 0.1, 'gene_b': 1e-320, 'gene_c': 123.456789012345},
+                           'name': u'caf\xe9'}]}
+
+        s = http_session.json_dumps(obj)
+
+        self.assertEquals(obj, json.loads(s))
+        self.assertEquals(obj, http_session.json_loads(s))
+
+    def test_json_fallback(self):
+        # values only the standard library serializes
+        obj = {'ids': set(['a']), 'big': 2 ** 70, 'nan': float('nan')}
+
+        obj = http_session.json_loads(http_session.json_dumps(obj))
+
+        self.assertEquals(['a'], obj['ids'])
+        self.assertEquals(2 ** 70, obj['big'])
+        self.assertTrue(obj['nan'] != obj['nan'])
+
+    def test_iter_json(self):
+        obj = {'values': [[float(i), float(j)] for i in range(5000) for j in range(2)]}
+
+        chunks = list(http_session._iter_json(obj))
+
+        self.assertTrue(len(chunks) > 1)
+        self.assertEquals(obj, json.loads(b''.join(chunks)))
+
+    def test_gzip(self):
+        body = http_session.json_dumps({'levels': dict(('gene_{0}'.format(i), 0.0)
+                                                     for i in range(1000))}).encode('utf-8')
+
+        compressed = http_session._gzip(body)
+
+        self.assertTrue(len(compressed) < len(body) / 5)
+        self.assertEquals(body, zlib.decompress(compressed, 16 + zlib.MAX_WBITS))
+
+    def test_json_matrix_round_trip(self):
+        random.seed(1)
+        row_ids = ['gene_{0}'.format(i) for i in range(50)]
+        obj = {'data': {'row_ids': row_ids,
+                        'col_ids': ['sample_{0}'.format(i) for i in range(4)],
+                        'values': [[random.random() * 1000 for _ in range(4)] for _ in row_ids]},
+               'expression_levels': dict((row_id, random.random() * 100) for row_id in row_ids),
+               # only the standard library serializes these
+               'genome_refs': frozenset(['1/2/3'])}
+        expected = dict(obj, genome_refs=['1/2/3'])
+
+        ujson = http_session._ujson
+        try:
+            for backend in [ujson, None]:
+                http_session._ujson = backend
+                self.assertEquals(expected, http_session.json_loads(http_session.json_dumps(obj)))
+        finally:
+            http_session._ujson = ujson
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, body, content_type='application/json'):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = {'content-type': content_type}
+        self.content = json.dumps(body) if content_type == 'application/json' else body
+        self.text = self.content
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.exceptions.HTTPError('{} Error'.format(self.status_code))
+
+
+class FakeSession:
+    """
+     Answers the posts of the clients with handler(url, request), which
+     returns a (status code, body) pair, or a (status code, text, content
+     type) triple
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.posts = list()
+
+    def post(self, url, data=None, headers=None, timeout=None, verify=None):
+        request = json.loads(data)
+        self.posts.append((url, request))
+        return FakeResponse(*self.handler(url, request))
+
+
+class HTTPSessionClientTest(unittest.TestCase):
+
+    def setUp(self):
+        http_session._session = None
+
+    def tearDown(self):
+        http_session._session = None
+        http_session._no_batch_urls.clear()
+
+    def fake_session(self, handler):
+        session = FakeSession(handler)
+        http_session._get_session()
+        http_session._session = session
+        return session
+
+    def test_use_session(self):
+        def handler(url, request):
+            if request['method'] == 'Workspace.ver':
+                return 200, {'version': '1.1', 'id': request['id'], 'result': ['0.8.0']}
+            return 500, {'version': '1.1', 'id': request['id'],
+                         'error': {'name': 'JSONRPCError', 'code': -32500,
+                                   'message': 'No workspace', 'error': 'trace'}}
+        session = self.fake_session(handler)
+
+        dfu = http_session.use_session(DataFileUtil('http://localhost:1', token='t'))
+        ws = http_session.use_session(Workspace('http://localhost:2', token='t'))
+
+        self.assertTrue(http_session.use_session(dfu) is dfu)
+        self.assertEquals('0.8.0', ws.ver())
+        # each client raises the ServerError of its package
+        with self.assertRaises(DFUError) as context:
+            dfu.ws_name_to_id('my_ws')
+        self.assertEquals('No workspace', context.exception.message)
+        with self.assertRaises(WorkspaceError):
+            ws.get_workspace_info({'workspace': 'my_ws'})
+        # through the session shared by the clients of all the packages
+        self.assertEquals(['http://localhost:2', 'http://localhost:1', 'http://localhost:2'],
+                          [url for url, request in session.posts])
+
+    def test_use_session_job(self):
+        job_checks = list()
+
+        def handler(url, request):
+            if request['method'] == 'DataFileUtil._file_to_shock_submit':
+                return 200, {'version': '1.1', 'id': request['id'], 'result': ['job_1']}
+            job_checks.append(request['params'][0])
+            job_state = {'finished': len(job_checks) == 3, 'result': [{'shock_id': 'node_1'}]}
+            return 200, {'version': '1.1', 'id': request['id'], 'result': [job_state]}
+        self.fake_session(handler)
+
+        dfu = http_session.use_session(DataFileUtil('http://localhost:1', token='t',
+                                                    async_job_check_time_ms=1))
+
+        self.assertEquals({'shock_id': 'node_1'}, dfu.file_to_shock({'file_path': 'f'}))
+        # the client checked the job once, the job poller until it finished
+        self.assertEquals(['job_1'] * 3, job_checks)
+
+    def ver_handler(self, batch_reply):
+        # answers single calls with the version, and batches with batch_reply
+        def handler(url, request):
+            if type(request) is list:
+                return batch_reply(request)
+            return 200, {'version': '1.1', 'id': request['id'],
+                         'result': [request['params'][0]]}
+        return handler
+
+    def test_call_methods_batch(self):
+        def batch_reply(requests):
+            # in any order, matched to the calls by id
+            return 200, [{'version': '1.1', 'id': request['id'],
+                          'result': [request['params'][0]]}
+                         for request in reversed(requests)]
+        session = self.fake_session(self.ver_handler(batch_reply))
+        ws = http_session.use_session(Workspace('http://localhost:2', token='t'))
+
+        results = ws._client.call_methods([('Workspace.ver', ['a']),
+                                           ('Workspace.ver', ['b']),
+                                           ('Workspace.ver', ['c'])])
+
+        self.assertEquals(['a', 'b', 'c'], results)
+        self.assertEquals(1, len(session.posts))
+        self.assertEquals(['a', 'b', 'c'],
+                          [request['params'][0] for request in session.posts[0][1]])
+
+    def test_call_methods_fallback(self):
+        def batch_reply(requests):
+            return 500, {'version': '1.1', 'error': {'name': 'JSONRPCError', 'code': -32700,
+                                                     'message': 'Parse error'}}
+        session = self.fake_session(self.ver_handler(batch_reply))
+        ws = http_session.use_session(Workspace('http://localhost:2', token='t'))
+        calls = [('Workspace.ver', [str(i)]) for i in range(20)]
+
+        self.assertEquals([str(i) for i in range(20)], ws._client.call_methods(calls))
+        self.assertEquals(21, len(session.posts))
+        self.assertEquals(set(['http://localhost:2']), http_session._no_batch_urls)
+        # the server is not sent batches again
+        self.assertEquals(['0', '1'], ws._client.call_methods(calls[:2]))
+        self.assertEquals(23, len(session.posts))
+
+    def test_call_methods_fallback_html(self):
+        def batch_reply(requests):
+            # a server failing on the list before running any call
+            return 500, '<html><body>Internal Server Error</body></html>', 'text/html'
+        session = self.fake_session(self.ver_handler(batch_reply))
+        ws = http_session.use_session(Workspace('http://localhost:2', token='t'))
+
+        results = ws._client.call_methods([('Workspace.ver', ['a']), ('Workspace.ver', ['b'])])
+
+        self.assertEquals(['a', 'b'], results)
+        self.assertEquals(3, len(session.posts))
+        self.assertEquals(set(['http://localhost:2']), http_session._no_batch_urls)
+
+    def test_call_methods_fallback_status(self):
+        def batch_reply(requests):
+            return 502, 'Bad Gateway'
+        session = self.fake_session(self.ver_handler(batch_reply))
+        ws = http_session.use_session(Workspace('http://localhost:2', token='t'))
+
+        results = ws._client.call_methods([('Workspace.ver', ['a']), ('Workspace.ver', ['b'])])
+
+        self.assertEquals(['a', 'b'], results)
+        self.assertEquals(3, len(session.posts))
+        self.assertEquals(set(['http://localhost:2']), http_session._no_batch_urls)
+
+    def test_call_methods_mismatch(self):
+        def batch_reply(requests):
+            return 200, [{'version': '1.1', 'id': requests[0]['id'], 'result': ['a']}]
+        session = self.fake_session(self.ver_handler(batch_reply))
+        ws = http_session.use_session(Workspace('http://localhost:2', token='t'))
+
+        with self.assertRaises(WorkspaceError) as context:
+            ws._client.call_methods([('Workspace.ver', ['a']), ('Workspace.ver', ['b'])])
+        self.assertEquals('The server answered 2 calls with 1 responses',
+                          context.exception.message)
+        # the calls may have run, so they are not made again
+        self.assertEquals(1, len(session.posts))
+        self.assertEquals(set(), http_session._no_batch_urls)
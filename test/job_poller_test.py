@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from ExpressionUtils.core.job_poller import JobPoller, _JobWait
+
+
+class FakeServerError(Exception):
+
+    def __init__(self, name, code, message, data=None, error=None):
+        super(Exception, self).__init__(message)
+        self.message = message
+
+
+class FakeClient:
+    """
+     Answers the checks of a job with the next of its job states, or raises
+     it if it is an exception
+    """
+
+    def __init__(self, job_states):
+        self.job_states = job_states
+        self.url = 'http://localhost:1'
+        self._headers = {'AUTHORIZATION': 'token'}
+        self._server_error = FakeServerError
+        self.async_job_check_time = 0.001
+        self.async_job_check_time_scale_percent = 150
+        self.async_job_check_max_time = 0.01
+        self.batches = []
+        # raised by the next batched check, if set
+        self.batch_error = None
+
+    def _check_job_now(self, service, job_id):
+        job_state = self.job_states[job_id].pop(0)
+        if isinstance(job_state, Exception):
+            raise job_state
+        return job_state
+
+    def _call_methods(self, url, calls):
+        self.batches.append([params[0] for method, params in calls])
+        if self.batch_error is not None:
+            batch_error, self.batch_error = self.batch_error, None
+            raise batch_error
+        job_states = [self.job_states[params[0]][0] for method, params in calls]
+        for job_state in job_states:
+            if isinstance(job_state, Exception):
+                raise job_state
+        return [self._check_job_now(method.split('.')[0], params[0])
+                for method, params in calls]
+
+
+class JobPollerTest(unittest.TestCase):
+
+    def test_wait(self):
+        client = FakeClient({'job_1': [{'finished': 0}, {'finished': 0},
+                                       {'finished': 1, 'result': ['done']}]})
+        poller = JobPoller()
+
+        self.assertEquals({'finished': 1, 'result': ['done']},
+                          poller.wait(client, 'Svc', 'job_1'))
+        self.assertEquals(1, poller.stats['jobs'])
+        self.assertEquals(3, poller.stats['checks'])
+
+    def test_batched_check(self):
+        client = FakeClient({'job_1': [{'finished': 1}],
+                             'job_2': [{'finished': 0}],
+                             'job_3': [{'finished': 1}]})
+        poller = JobPoller()
+        waits = [_JobWait(client, 'Svc', job_id) for job_id in ['job_1', 'job_2', 'job_3']]
+
+        poller._check(waits)
+
+        self.assertEquals([['job_1', 'job_2', 'job_3']], client.batches)
+        self.assertEquals([True, False, True], [wait.done.is_set() for wait in waits])
+        self.assertEquals({'finished': 1}, waits[2].job_state)
+        # the unfinished job is checked again
+        self.assertEquals([waits[1]], [item[2] for item in poller._waits])
+
+    def test_batched_check_error(self):
+        client = FakeClient({'job_1': [{'finished': 1}],
+                             'job_2': [FakeServerError('Unknown', 0, 'No job')],
+                             'job_3': [{'finished': 1}]})
+        poller = JobPoller()
+        waits = [_JobWait(client, 'Svc', job_id) for job_id in ['job_1', 'job_2', 'job_3']]
+
+        poller._check(waits)
+
+        # the jobs are checked one by one to tell which of them failed
+        self.assertEquals([True, True, True], [wait.done.is_set() for wait in waits])
+        self.assertEquals({'finished': 1}, waits[0].job_state)
+        self.assertEquals('No job', waits[1].error.message)
+        self.assertEquals({'finished': 1}, waits[2].job_state)
+
+    def test_batched_check_request_error(self):
+        client = FakeClient({'job_1': [{'finished': 1}],
+                             'job_2': [{'finished': 0}]})
+        client.batch_error = IOError('Connection reset by peer')
+        poller = JobPoller()
+        waits = [_JobWait(client, 'Svc', job_id) for job_id in ['job_1', 'job_2']]
+
+        poller._check(waits)
+
+        # a failed batch fails none of its jobs, which are checked one by one
+        self.assertEquals([['job_1', 'job_2']], client.batches)
+        self.assertEquals({'finished': 1}, waits[0].job_state)
+        self.assertEquals(None, waits[0].error)
+        self.assertFalse(waits[1].done.is_set())
+        self.assertEquals([waits[1]], [item[2] for item in poller._waits])
+
+    def test_invalid_job_state(self):
+        client = FakeClient({'job_1': [None], 'job_2': [{'finished': 1}]})
+        poller = JobPoller()
+
+        with self.assertRaises(FakeServerError) as context:
+            poller.wait(client, 'Svc', 'job_1')
+        self.assertEquals('Invalid state of job job_1: None', context.exception.message)
+        # the poller goes on with the next jobs
+        self.assertEquals({'finished': 1}, poller.wait(client, 'Svc', 'job_2'))
+
+    def test_failing_check(self):
+        client = FakeClient({'job_1': [{'finished': 1}], 'job_2': [{'finished': 1}]})
+        poller = JobPoller()
+        check = poller._check
+
+        def failing_check(waits):
+            poller._check = check
+            raise KeyError('finished')
+        poller._check = failing_check
+
+        with self.assertRaises(KeyError):
+            poller.wait(client, 'Svc', 'job_1')
+        self.assertEquals({'finished': 1}, poller.wait(client, 'Svc', 'job_2'))
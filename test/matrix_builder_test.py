@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from ExpressionUtils.core.matrix_builder import MatrixBuilder
+
+
+class MatrixBuilderTest(unittest.TestCase):
+
+    def test_from_tables(self):
+        tables = [{'gene_b': 1.5, 'gene_a': 2.0},
+                  {},
+                  {'gene_c': 3.25, 'gene_a': 4.0}]
+
+        matrix = MatrixBuilder.from_tables(tables)
+
+        self.assertEquals(['gene_a', 'gene_b', 'gene_c'], matrix.row_ids)
+        self.assertEquals([[2.0, 0.0, 4.0],
+                           [1.5, 0.0, 0.0],
+                           [0.0, 0.0, 3.25]], matrix.get_values())
+
+    def test_from_tables_row_order(self):
+        genes = ['gene_{}'.format(i) for i in range(1000)]
+        tables = [dict((gene, float(i)) for i, gene in enumerate(genes)),
+                  dict((gene, float(i)) for i, gene in enumerate(reversed(genes)))]
+
+        matrix = MatrixBuilder.from_tables(tables)
+        reversed_matrix = MatrixBuilder.from_tables(list(reversed(tables)))
+
+        self.assertEquals(sorted(genes), matrix.row_ids)
+        self.assertEquals(matrix.row_ids, reversed_matrix.row_ids)
+        self.assertEquals([row[::-1] for row in matrix.get_values()],
+                          reversed_matrix.get_values())
+
+    def test_set_column(self):
+        matrix = MatrixBuilder(['gene_a', 'gene_b'], 2, fill_value=-1)
+        matrix.set_column(1, {'gene_b': 5})
+
+        self.assertEquals([[-1.0, -1.0], [-1.0, 5.0]], matrix.get_values())
+        with self.assertRaises(KeyError):
+            matrix.set_column(0, {'unknown': 1.0})
+
+
+    def test_from_layers(self):
+        matrix = MatrixBuilder.from_layers({'fpkm': [{'gene_a': 1.0}, {'gene_b': 2.0}],
+                                            'tpm': [{'gene_a': 3.0}, None]})
+
+        self.assertEquals(['gene_a', 'gene_b'], matrix.row_ids)
+        self.assertEquals([[1.0, 0.0], [0.0, 2.0]], matrix.get_values('fpkm'))
+        self.assertEquals([[3.0, 0.0], [0.0, 0.0]], matrix.get_values('tpm'))
+
+        with self.assertRaises(ValueError):
+            MatrixBuilder.from_layers({'fpkm': [{'gene_a': 1.0}], 'tpm': []})
+
+    def test_set_columns(self):
+        matrix = MatrixBuilder.from_layers({'fpkm': [None, {'gene_c': 5.0}, None]},
+                                           row_ids=['gene_b', 'gene_a'])
+        matrix.set_columns([0, 2], ['gene_b', 'gene_a'], [[1.0, 2.0], [3.0, 4.0]], 'fpkm')
+
+        self.assertEquals(['gene_a', 'gene_b', 'gene_c'], matrix.row_ids)
+        self.assertEquals([[3.0, 0.0, 4.0],
+                           [1.0, 0.0, 2.0],
+                           [0.0, 5.0, 0.0]], matrix.get_values('fpkm'))
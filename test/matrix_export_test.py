@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import json
+import shutil
+import tempfile
+
+import numpy as np
+
+from ExpressionUtils.core.matrix_export import write_matrix_tiles, MatrixTileReader
+
+
+class MatrixExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tiles_dir = os.path.join(tempfile.mkdtemp(), 'tiles')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.tiles_dir))
+
+    def test_write_read_tiles(self):
+        row_ids = [u'gene_{}'.format(i) for i in range(10)]
+        col_ids = [u'sample_{}'.format(i) for i in range(7)]
+        values = np.arange(70, dtype=np.float64).reshape(10, 7)
+
+        manifest = write_matrix_tiles(self.tiles_dir, row_ids, col_ids, values.tolist(),
+                                      row_block_size=4, col_block_size=3,
+                                      attributes={'scale': 'log2'})
+
+        self.assertEquals([10, 7], manifest['shape'])
+        # 3 row blocks x 3 column blocks
+        self.assertEquals(9, len(manifest['tiles']))
+        with open(os.path.join(self.tiles_dir, 'manifest.json')) as manifest_file:
+            self.assertEquals({'scale': 'log2'}, json.load(manifest_file)['attributes'])
+
+        tile = np.load(os.path.join(self.tiles_dir, 'tile_r2_c1.npy'))
+        self.assertTrue(tile.flags['F_CONTIGUOUS'])
+        self.assertEquals(values[8:10, 3:6].tolist(), tile.tolist())
+
+        reader = MatrixTileReader(self.tiles_dir)
+        self.assertEquals(row_ids, reader.row_ids)
+        self.assertEquals(values[5].tolist(), reader.get_row('gene_5').tolist())
+        self.assertEquals(values[:, 6].tolist(), reader.get_column('sample_6').tolist())
+
+    def test_write_tiles_bad_values(self):
+        with self.assertRaises(ValueError):
+            write_matrix_tiles(self.tiles_dir, ['gene_a', 'gene_b'], ['sample_a'], [[1.0]])
+
+        with self.assertRaises(ValueError):
+            write_matrix_tiles(self.tiles_dir, ['gene_a'], ['sample_a'], [[1.0, 2.0]])
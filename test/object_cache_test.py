@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from ExpressionUtils.core.object_cache import WorkspaceObjectCache
+
+
+class FakeWorkspace:
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.calls = []
+        # batched calls go through the client of the workspace client
+        self._client = self
+        self._service_ver = None
+
+    def call_methods(self, calls, service_ver=None):
+        self.calls.append(('call_methods', [method for method, args in calls]))
+        return [getattr(self, method.split('.')[1])(*args) for method, args in calls]
+
+    def get_workspace_info(self, params):
+        self.calls.append(('get_workspace_info', params))
+        return [1, params['workspace']]
+
+    def get_objects2(self, params):
+        self.calls.append(('get_objects2', params))
+        data = []
+        for object_spec in params['objects']:
+            obj = self.objects[object_spec['ref']]
+            fields = [path.strip('/') for path in object_spec.get('included', obj['data'])]
+            data.append({'info': obj['info'],
+                         'data': dict((field, obj['data'][field]) for field in fields)})
+        return {'data': data}
+
+    def get_object_info3(self, params):
+        self.calls.append(('get_object_info3', params))
+        return {'infos': [self.objects[object_spec['ref']]['info']
+                          for object_spec in params['objects']]}
+
+
+class WorkspaceObjectCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ws = FakeWorkspace(
+            {'1/1/1': {'info': [1, 'expr_1'], 'data': {'genome_id': '1/9/1', 'condition': 'a'}},
+             '1/2/1': {'info': [2, 'expr_2'], 'data': {'genome_id': '1/9/1', 'condition': 'b'}}})
+        self.cache = WorkspaceObjectCache(self.ws)
+
+    def test_get_objects_once(self):
+        objs = self.cache.get_objects(['1/1/1', '1/2/1', '1/1/1'])
+        self.assertEquals(['expr_1', 'expr_2', 'expr_1'], [obj['info'][1] for obj in objs])
+
+        self.cache.get_objects(['1/2/1'])
+        # subsets of objects fetched in full come from the cache
+        subset = self.cache.get_objects(['1/1/1'], ['/condition'])[0]
+        self.assertEquals({'condition': 'a'}, subset['data'])
+        self.assertEquals(1, len(self.ws.calls))
+        self.assertEquals(['1/1/1', '1/2/1'],
+                          [object_spec['ref'] for object_spec in self.ws.calls[0][1]['objects']])
+
+    def test_get_subsets(self):
+        self.cache.get_objects(['1/1/1'], ['/genome_id'])
+        self.cache.get_objects(['1/1/1', '1/2/1'], ['/genome_id'])
+        obj = self.cache.get_objects(['1/1/1'])[0]
+
+        self.assertEquals({'genome_id': '1/9/1', 'condition': 'a'}, obj['data'])
+        self.assertEquals([['1/1/1'], ['1/2/1'], ['1/1/1']],
+                          [[object_spec['ref'] for object_spec in params['objects']]
+                           for method, params in self.ws.calls])
+
+    def test_get_object_infos(self):
+        self.cache.get_objects(['1/1/1'])
+        infos = self.cache.get_object_infos(['1/1/1', '1/2/1'])
+        self.cache.get_object_infos(['1/2/1'])
+
+        self.assertEquals(['expr_1', 'expr_2'], [info[1] for info in infos])
+        self.assertEquals(('get_object_info3', {'objects': [{'ref': '1/2/1'}],
+                                                'includeMetadata': 1}),
+                          self.ws.calls[1])
+        self.assertEquals(2, len(self.ws.calls))
+
+    def test_prefetch(self):
+        self.cache.get_object_infos(['1/1/1'])
+        ws_info = self.cache.prefetch(['1/1/1', '1/2/1'], ['1/1/1', '1/2/1'],
+                                      [('get_workspace_info', {'workspace': 'ws'})])[0]
+        self.cache.get_objects(['1/1/1', '1/2/1'], ['/condition'])
+        infos = self.cache.get_object_infos(['1/1/1', '1/2/1'])
+
+        self.assertEquals([1, 'ws'], ws_info)
+        self.assertEquals(['expr_1', 'expr_2'], [info[1] for info in infos])
+        # the missing objects and infos are fetched in the same batch as the other calls
+        self.assertEquals(('call_methods', ['Workspace.get_workspace_info',
+                                            'Workspace.get_objects2',
+                                            'Workspace.get_object_info3']),
+                          self.ws.calls[1])
+        self.assertEquals([{'ref': '1/2/1'}], self.ws.calls[-1][1]['objects'])
+        self.assertEquals(5, len(self.ws.calls))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest
+
+from ExpressionUtils.core.pipeline import Pipeline
+
+
+class PipelineTest(unittest.TestCase):
+
+    def test_run(self):
+        pipeline = Pipeline()
+        pipeline.add_stage('a', lambda: 2)
+        pipeline.add_stage('b', lambda a: time.sleep(0.2) or a + 1, ['a'])
+        pipeline.add_stage('c', lambda a: time.sleep(0.2) or a * 10, ['a'])
+        pipeline.add_stage('d', lambda c, b: (b, c), ['c', 'b'])
+
+        start = time.time()
+        results = pipeline.run()
+
+        self.assertEquals({'a': 2, 'b': 3, 'c': 20, 'd': (3, 20)}, results)
+        # b and c run concurrently
+        self.assertTrue(time.time() - start < 0.35)
+        self.assertEquals(['a', 'b', 'c', 'd'], sorted(pipeline.timings))
+        self.assertTrue(pipeline.timings['b'] >= 0.2)
+
+    def test_run_fail(self):
+        calls = []
+
+        def fail(message, delay=0):
+            time.sleep(delay)
+            raise ValueError(message)
+
+        pipeline = Pipeline()
+        pipeline.add_stage('a', lambda: calls.append('a'))
+        pipeline.add_stage('b', lambda a: fail('b failed', 0.1), ['a'])
+        pipeline.add_stage('c', lambda a: fail('c failed'), ['a'])
+        pipeline.add_stage('d', lambda c: calls.append('d'), ['c'])
+
+        with self.assertRaises(ValueError) as context:
+            pipeline.run()
+
+        # the error of the stage added first, and no stage after a failure
+        self.assertEquals('b failed', str(context.exception))
+        self.assertEquals(['a'], calls)
+
+    def test_add_stage_fail(self):
+        pipeline = Pipeline()
+        pipeline.add_stage('a', lambda: None)
+
+        with self.assertRaises(ValueError) as context:
+            pipeline.add_stage('b', lambda c: None, ['c'])
+        self.assertEquals('stage b depends on unknown stage c', str(context.exception))
+
+        with self.assertRaises(ValueError) as context:
+            pipeline.add_stage('a', lambda: None)
+        self.assertEquals('stage a is already in the pipeline', str(context.exception))
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import json
+import types
+import zlib
+import unittest
+from StringIO import StringIO
+
+from ExpressionUtils.core.rpc_middleware import RPCMiddleware, use_fast_json
+
+
+def gzip(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class FakeApplication:
+    """
+     Echoes the body of the requests as the generated server would answer them
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, environ, start_response):
+        request_body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH', 0)))
+        self.requests.append((request_body, environ.get('HTTP_CONTENT_ENCODING')))
+        response_body = json.dumps({'version': '1.1', 'result': [request_body]})
+        start_response('200 OK', [('content-type', 'application/json'),
+                                  ('content-length', str(len(response_body)))])
+        return [response_body]
+
+
+class RPCMiddlewareTest(unittest.TestCase):
+
+    def call(self, middleware, request_body, headers=None):
+        environ = {'REQUEST_METHOD': 'POST',
+                   'CONTENT_LENGTH': str(len(request_body)),
+                   'wsgi.input': StringIO(request_body)}
+        environ.update(headers or {})
+        response = dict()
+
+        def start_response(status, response_headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = dict(response_headers)
+        response_body = ''.join(middleware(environ, start_response))
+
+        self.assertEquals(str(len(response_body)), response['headers']['content-length'])
+        return response['status'], response['headers'], response_body
+
+    def test_request(self):
+        application = FakeApplication()
+        request_body = json.dumps({'method': 'ExpressionUtils.status', 'params': [{}]})
+
+        status, headers, response_body = self.call(RPCMiddleware(application), request_body)
+
+        self.assertEquals('200 OK', status)
+        self.assertEquals([request_body], json.loads(response_body)['result'])
+        self.assertNotIn('Vary', headers)
+
+    def test_gzip_request(self):
+        application = FakeApplication()
+        request_body = json.dumps({'method': 'ExpressionUtils.status', 'params': [{}]})
+
+        status, headers, response_body = self.call(RPCMiddleware(application),
+                                                   gzip(request_body),
+                                                   {'HTTP_CONTENT_ENCODING': 'gzip'})
+
+        self.assertEquals('200 OK', status)
+        # the application gets the inflated body
+        self.assertEquals([(request_body, None)], application.requests)
+
+    def test_bad_gzip_request(self):
+        application = FakeApplication()
+
+        status, headers, response_body = self.call(RPCMiddleware(application), '{"method"',
+                                                   {'HTTP_CONTENT_ENCODING': 'gzip'})
+
+        self.assertEquals('500 Internal Server Error', status)
+        self.assertEquals(-32700, json.loads(response_body)['error']['code'])
+        self.assertEquals([], application.requests)
+
+    def test_batch_request(self):
+        application = FakeApplication()
+        request_body = json.dumps([{'method': 'ExpressionUtils.status', 'params': [{}]}])
+
+        for body in [request_body, ' 42']:
+            status, headers, response_body = self.call(RPCMiddleware(application), body)
+
+            self.assertEquals('500 Internal Server Error', status)
+            error = json.loads(response_body)['error']
+            self.assertEquals(-32600, error['code'])
+            self.assertEquals('Invalid Request', error['name'])
+        self.assertEquals([], application.requests)
+
+        # the server answers the requests that are not JSON
+        self.call(RPCMiddleware(application), 'not json')
+        self.assertEquals([('not json', None)], application.requests)
+
+    def test_gzip_response(self):
+        request_body = json.dumps({'method': 'ExpressionUtils.status', 'params': ['x' * 1000]})
+        middleware = RPCMiddleware(FakeApplication(), 1000)
+
+        status, headers, response_body = self.call(middleware, request_body,
+                                                   {'HTTP_ACCEPT_ENCODING': 'gzip, deflate'})
+
+        self.assertEquals('gzip', headers['content-encoding'])
+        self.assertEquals('Accept-Encoding', headers['Vary'])
+        self.assertEquals([request_body], json.loads(zlib.decompress(
+            response_body, 16 + zlib.MAX_WBITS))['result'])
+
+        # not for the clients not accepting gzip, nor for small responses
+        for request_body, headers in [(request_body, {}),
+                                      ('{}', {'HTTP_ACCEPT_ENCODING': 'gzip'})]:
+            status, headers, response_body = self.call(middleware, request_body, headers)
+            self.assertNotIn('content-encoding', headers)
+            self.assertEquals([request_body], json.loads(response_body)['result'])
+
+    def test_use_fast_json(self):
+        server_module = types.ModuleType('FakeServer')
+        server_module.json = json
+        use_fast_json(server_module)
+
+        obj = {'version': '1.1', 'result': [{'values': [0.5, -1e-300, 2 ** 70]}]}
+        s = server_module.json.dumps(obj, cls=json.JSONEncoder)
+        self.assertEquals(obj, server_module.json.loads(s))
+        self.assertEquals('{\n "a": 1\n}', server_module.json.dumps({'a': 1}, indent=1))
+        # the rest of the json module is left as it is
+        self.assertIs(json.JSONEncoder, server_module.json.JSONEncoder)
+        self.assertIs(json.load, server_module.json.load)